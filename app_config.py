@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""config.json, read once per process and shared by main.py, the bot and the web server."""
+import functools
+import json
+
+CONFIG_FILE = "config.json"
+
+
+@functools.lru_cache(maxsize=None)
+def load_config(path=CONFIG_FILE):
+	with open(path, "r") as config_file:
+		return json.load(config_file)
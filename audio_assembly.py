@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""NumPy-backed decoding, analysis, time-stretching and assembly of countdown audio.
+
+Each number is decoded once into a float32 PCM array of shape
+(samples, channels). Speed adjustment is a vectorized overlap-add time
+stretch, and the countdown is written into one preallocated buffer where
+number k occupies exactly samples [k * rate, (k + 1) * rate). The result is
+encoded once at the end, instead of growing an immutable pydub AudioSegment
+with += (quadratic) and running AudioSegment.speedup per number.
+
+TTS output starts with a varying amount of silence, so each number is
+analysed first. RMS levels of short frames, computed as one reshaped array,
+find where speech starts and ends. The silence around it is trimmed, the
+number is sped up only if its speech would not fit in its slot, and the
+speech is placed so its onset lands `onset_ms` after the second boundary.
+The measured onsets are written to a JSON sidecar next to the clip
+(countdown-en-30-0.json), which the bot reads to skip the lead-in.
+
+Besides MP3, export() writes Discord-native Ogg/Opus (48 kHz stereo, 20 ms
+packets, encoded with the same libopus settings as the bot's clip cache).
+The bot plays those packets as they are, with no transcoding.
+"""
+import json
+import os
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+
+import ogg_opus
+
+STRETCH_FRAME_MS = 40
+ANALYSIS_FRAME_MS = 5
+SILENCE_FLOOR_DB = -50.0  # nothing quieter than this is speech
+RELATIVE_THRESHOLD_DB = -30.0  # speech is within this many dB of the loudest frame
+PREROLL_MS = 10  # kept before the detected onset so consonant attacks are not clipped
+DEFAULT_ONSET_MS = 30
+DEFAULT_TAIL_MS = 100  # minimum quiet gap left before the next number
+SIDECAR_VERSION = 1
+
+
+def load_samples(path):
+	"""Decode an audio file once; returns (float32 array of shape (n, channels), sample_rate)."""
+	segment = AudioSegment.from_file(path)
+	samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+	scale = float(1 << (8 * segment.sample_width - 1))
+	return samples.reshape(-1, segment.channels) / scale, segment.frame_rate
+
+
+def duration_ms(samples, sample_rate):
+	return len(samples) * 1000 // sample_rate
+
+
+def conform(samples, from_rate, to_rate, channels):
+	"""Resample (linear interpolation) and up/down-mix `samples` to the target format."""
+	if from_rate != to_rate and len(samples):
+		target_length = int(round(len(samples) * to_rate / from_rate))
+		positions = np.linspace(0, len(samples) - 1, target_length)
+		samples = np.stack([np.interp(positions, np.arange(len(samples)), samples[:, c]) for c in range(samples.shape[1])], axis=1).astype(np.float32)
+	if samples.shape[1] != channels:
+		mono = samples.mean(axis=1, keepdims=True)
+		samples = np.repeat(mono, channels, axis=1)
+	return samples
+
+
+def time_stretch(samples, speed, sample_rate, frame_ms=STRETCH_FRAME_MS):
+	"""Shorten `samples` by `speed` without changing pitch, using a 50%-overlap Hann OLA.
+
+	Frames are read every `hop * speed` samples and written every `hop`
+	samples. With a periodic Hann window at 50% overlap the windows sum to
+	one, so the frames can be overlap-added as two reshaped, non-overlapping
+	halves instead of a Python loop.
+	"""
+	if speed <= 1 or len(samples) == 0:
+		return samples
+	frame = max(2, int(sample_rate * frame_ms / 1000) // 2 * 2)
+	hop = frame // 2
+	if len(samples) < frame:
+		samples = np.concatenate([samples, np.zeros((frame - len(samples), samples.shape[1]), dtype=samples.dtype)])
+
+	count = int((len(samples) - frame) / (hop * speed)) + 1
+	starts = (np.arange(count) * hop * speed).astype(np.int64)
+	window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frame) / frame)).astype(np.float32)
+	frames = samples[starts[:, None] + np.arange(frame)[None, :]] * window[None, :, None]
+
+	out = np.zeros(((count + 1) * hop, samples.shape[1]), dtype=np.float32)
+	blocks = out.reshape(count + 1, hop, samples.shape[1])
+	blocks[:-1] += frames[:, :hop]
+	blocks[1:] += frames[:, hop:]
+	# Only the very first and last half-frames are not covered twice; undo their fade
+	norm = np.ones(len(out), dtype=np.float32)
+	norm[:hop] = np.maximum(window[:hop], 1e-3)
+	norm[-hop:] = np.maximum(window[hop:], 1e-3)
+	return out / norm[:, None]
+
+
+def frame_levels_db(samples, sample_rate, frame_ms=ANALYSIS_FRAME_MS):
+	"""RMS level (dBFS) of consecutive `frame_ms` frames of the mono mix; returns (levels, hop)."""
+	hop = max(1, sample_rate * frame_ms // 1000)
+	mono = samples.mean(axis=1)
+	count = len(mono) // hop
+	frames = mono[:count * hop].reshape(count, hop)
+	rms = np.sqrt(np.mean(frames * frames, axis=1))
+	return 20 * np.log10(np.maximum(rms, 1e-9)), hop
+
+
+def detect_speech(samples, sample_rate):
+	"""Return (onset, offset) sample positions of the speech in `samples`; (0, 0) if it is all silence."""
+	levels, hop = frame_levels_db(samples, sample_rate)
+	if len(levels) == 0:
+		return 0, 0
+	threshold = max(SILENCE_FLOOR_DB, float(levels.max()) + RELATIVE_THRESHOLD_DB)
+	active = np.flatnonzero(levels >= threshold)
+	if len(active) == 0:
+		return 0, 0
+	return int(active[0]) * hop, min(len(samples), (int(active[-1]) + 1) * hop)
+
+
+def speed_for(speech_length, sample_rate, onset_ms=DEFAULT_ONSET_MS, tail_ms=DEFAULT_TAIL_MS):
+	"""Speed factor that fits `speech_length` samples between the onset and the tail gap; 1.0 if it already fits."""
+	budget = sample_rate * (1000 - onset_ms - tail_ms) // 1000
+	return max(1.0, speech_length / budget)
+
+
+def place_number(samples, sample_rate, onset_ms=DEFAULT_ONSET_MS, tail_ms=DEFAULT_TAIL_MS):
+	"""Trim, speed up only if needed, and place a number's speech at `onset_ms` in a one-second slot.
+
+	Returns (slot, info). info holds the speech length before adjustment,
+	the speed factor used and the onset measured in the finished slot.
+	"""
+	onset, offset = detect_speech(samples, sample_rate)
+	start = max(0, onset - sample_rate * PREROLL_MS // 1000)
+	speed = speed_for(offset - onset, sample_rate, onset_ms, tail_ms)
+	speech = time_stretch(samples[start:offset], speed, sample_rate)
+
+	slot = np.zeros((sample_rate, samples.shape[1]), dtype=np.float32)
+	# The pre-roll shrinks with the speed-up, so shift by its stretched length to keep the onset exact
+	lead = max(0, sample_rate * onset_ms // 1000 - int(round((onset - start) / speed)))
+	body = speech[:sample_rate - lead]
+	slot[lead:lead + len(body)] = body
+
+	measured_onset, _ = detect_speech(slot, sample_rate)
+	return slot, {
+		"speech_ms": (offset - onset) * 1000 // sample_rate,
+		"speed": round(speed, 4),
+		"onset_ms": measured_onset * 1000 // sample_rate,
+	}
+
+
+def adjust_number(samples, sample_rate, onset_ms=DEFAULT_ONSET_MS, tail_ms=DEFAULT_TAIL_MS):
+	"""Turn one synthesized number into exactly one second with its onset at `onset_ms`; returns (slot, info)."""
+	return place_number(samples, sample_rate, onset_ms, tail_ms)
+
+
+def assemble_countdown(segments, sample_rate, channels=None, onset_ms=DEFAULT_ONSET_MS, tail_ms=DEFAULT_TAIL_MS):
+	"""Place every (samples, rate) segment in its own one-second slot of one preallocated buffer.
+
+	Returns (countdown, placements) with one place_number() info dict per slot.
+	"""
+	channels = channels or max(samples.shape[1] for samples, rate in segments)
+	countdown = np.zeros((len(segments) * sample_rate, channels), dtype=np.float32)
+	placements = []
+	for slot, (samples, rate) in enumerate(segments):
+		samples = conform(samples, rate, sample_rate, channels)
+		placed, info = place_number(samples, sample_rate, onset_ms, tail_ms)
+		countdown[slot * sample_rate:(slot + 1) * sample_rate] = placed
+		placements.append(info)
+	return countdown, placements
+
+
+def sidecar_path(path):
+	return f"{os.path.splitext(path)[0]}.json"
+
+
+def write_sidecar(path, numbers, placements, onset_ms=DEFAULT_ONSET_MS):
+	"""Record where each number's speech starts in the clip at `path`, in countdown-en-30-0.json form."""
+	slots = [
+		{"number": number, "onset_ms": slot * 1000 + info["onset_ms"], "speech_ms": info["speech_ms"], "speed": info["speed"]}
+		for slot, (number, info) in enumerate(zip(numbers, placements))
+	]
+	sidecar = {
+		"version": SIDECAR_VERSION,
+		"target_onset_ms": onset_ms,
+		"first_onset_ms": slots[0]["onset_ms"] if slots else 0,
+		"numbers": slots,
+	}
+	with open(sidecar_path(path), "w") as sidecar_file:
+		json.dump(sidecar, sidecar_file)
+
+
+def to_pcm16(samples):
+	return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+
+
+def to_audio_segment(samples, sample_rate):
+	return AudioSegment(data=to_pcm16(samples).tobytes(), sample_width=2, frame_rate=sample_rate, channels=samples.shape[1])
+
+
+def export(samples, sample_rate, path, format="mp3"):
+	"""Encode `samples` once; WAV and Opus are written directly, anything else goes through pydub."""
+	if format == "wav":
+		write_wav(path, samples, sample_rate)
+	elif format == "opus":
+		write_opus(path, samples, sample_rate)
+	else:
+		to_audio_segment(samples, sample_rate).export(path, format=format)
+
+
+def write_wav(path, samples, sample_rate):
+	with wave.open(path, "wb") as output:
+		output.setnchannels(samples.shape[1])
+		output.setsampwidth(2)
+		output.setframerate(sample_rate)
+		output.writeframes(to_pcm16(samples).tobytes())
+
+
+def write_opus(path, samples, sample_rate):
+	"""Write `samples` as Ogg/Opus in exactly the packets Discord voice is sent: 48 kHz stereo, 20 ms."""
+	# Imported here so that generating MP3s does not need discord.py, whose libopus binding does the encoding
+	from clip_cache import SAMPLE_RATE, CHANNELS, encode_pcm
+	pcm = to_pcm16(conform(samples, sample_rate, SAMPLE_RATE, CHANNELS)).tobytes()
+	ogg_opus.write_ogg_opus(path, encode_pcm(pcm), channels=CHANNELS)
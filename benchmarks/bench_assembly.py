@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Benchmark countdown assembly: the old pydub path against the NumPy engine.
+
+Numbers are synthesized with the offline 'tone' backend, so no network access
+or ffmpeg is needed. Both paths start from the same decoded-from-disk inputs
+and stop at a finished in-memory countdown; the final encode is left out
+because it is identical for both.
+
+	python benchmarks/bench_assembly.py --sizes 10 90 600 --json results.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pydub import AudioSegment  # noqa: E402
+
+from audio_assembly import load_samples, assemble_countdown  # noqa: E402
+from tts_backends import get_backend  # noqa: E402
+
+
+def legacy_assembly(paths, speed_factor):
+	"""The previous generate_countdown path: speedup, pad and += one AudioSegment per number."""
+	countdown_audio = AudioSegment.silent(duration=0)
+	for path in paths:
+		segment = AudioSegment.from_file(path).speedup(playback_speed=speed_factor)
+		if len(segment) < 1000:
+			segment += AudioSegment.silent(duration=1000 - len(segment))
+		countdown_audio += segment
+	return len(countdown_audio)
+
+
+def numpy_assembly(paths, speed_factor):
+	# speed_factor is only for the legacy path; the NumPy engine picks a factor per number from its own speech
+	segments = [load_samples(path) for path in paths]
+	sample_rate = segments[0][1]
+	countdown, placements = assemble_countdown(segments, sample_rate)
+	return len(countdown) * 1000 // sample_rate
+
+
+def synthesize(directory, count):
+	backend = get_backend("tone")
+	paths = []
+	for number in range(count - 1, -1, -1):
+		path = os.path.join(directory, f"{number}.{backend.extension}")
+		if not os.path.exists(path):
+			backend.synthesize(str(number), "en", path)
+		paths.append(path)
+	return paths
+
+
+def timed(fn, *args):
+	started = time.perf_counter()
+	result = fn(*args)
+	return time.perf_counter() - started, result
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Compare pydub and NumPy countdown assembly.")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10, 90, 600], help="Countdown lengths (numbers) to benchmark.")
+	parser.add_argument("--json", type=str, help="Also write the results to this JSON file.")
+	parser.add_argument("--skip-legacy-above", type=int, default=None, help="Skip the pydub path for sizes larger than this.")
+	args = parser.parse_args()
+
+	results = []
+	with tempfile.TemporaryDirectory() as directory:
+		paths = synthesize(directory, max(args.sizes))
+		for size in args.sizes:
+			subset = paths[-size:]
+			speed_factor = max(len(AudioSegment.from_file(path)) for path in subset) / 1000
+			result = {"numbers": size, "speed_factor": round(speed_factor, 3)}
+
+			result["numpy_seconds"], result["numpy_length_ms"] = timed(numpy_assembly, subset, speed_factor)
+			if args.skip_legacy_above is None or size <= args.skip_legacy_above:
+				result["legacy_seconds"], result["legacy_length_ms"] = timed(legacy_assembly, subset, speed_factor)
+				result["speedup"] = round(result["legacy_seconds"] / result["numpy_seconds"], 1)
+			results.append(result)
+
+			legacy = f"{result['legacy_seconds']:.3f}s ({result['legacy_length_ms']}ms)" if "legacy_seconds" in result else "skipped"
+			print(f"{size:>5} numbers  numpy {result['numpy_seconds']:.3f}s ({result['numpy_length_ms']}ms)  pydub {legacy}  speedup {result.get('speedup', '-')}x")
+
+	if args.json:
+		with open(args.json, "w") as output:
+			json.dump({"benchmark": "assembly", "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+	main()
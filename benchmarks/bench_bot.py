@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Benchmark the bot and web server against the local Discord stand-in.
+
+Suites:
+
+- play: latency of play_sound() calls and CPU per play, where a play
+  includes reading the whole source as the audio player thread would. Then
+  bursts of concurrent clicks in one guild, counting how many of them
+  actually (re)started playback after the playback actor coalesced them.
+- http: throughput and latency of /api/play, /api/logs, /api/guilds and
+  /api/channels/<id> with concurrent clients. Requests go through Quart's
+  test client, so the app is measured and the network is not.
+- logs: cost per log_message call, and how fast the pipeline drains.
+- generate: wall time and throughput of generate_countdown with the
+  offline 'tone' TTS backend.
+- clips: CPU to load each catalog clip into the clip cache, and so to play
+  it cold, from its MP3 (ffmpeg decode plus Opus encode, counting the ffmpeg
+  child's CPU) versus from an Ogg/Opus copy (in-process demux). The MP3 side
+  needs ffmpeg and libopus and is skipped without them. In that case the
+  .opus copies are written from synthetic packets of the same length.
+
+Everything runs without Discord, network access, ffmpeg or libopus. Results
+can be written as JSON to compare runs between versions:
+
+	python benchmarks/bench_bot.py --json before.json
+	python benchmarks/bench_bot.py --suites play http --clients 1 8 32 --json after.json
+"""
+import argparse
+import asyncio
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_discord
+from latency import percentile
+
+SUITES = ("play", "http", "logs", "generate", "clips")
+
+
+def percentiles(samples):
+	"""p50/p95/p99/max of `samples` (seconds) in milliseconds."""
+	if not samples:
+		return {}
+	ordered = sorted(samples)
+	return {"count": len(ordered), **{f"p{pct}_ms": round(percentile(ordered, pct) * 1000, 3) for pct in (50, 95, 99)}, "max_ms": round(ordered[-1] * 1000, 3)}
+
+
+async def bench_play(env, guilds, plays):
+	discord_bot = env.discord_bot
+	sounds = discord_bot.sound_catalog.names()
+	latencies, call_cpu, play_cpu, frames = [], [], [], 0
+	for n in range(plays):
+		guild = guilds[n % len(guilds)]
+		sound = sounds[n % len(sounds)]
+		cpu_started = time.process_time()
+		started = time.perf_counter()
+		await discord_bot.play_sound(sound, guild)
+		latencies.append(time.perf_counter() - started)
+		call_cpu.append(time.process_time() - cpu_started)
+		frames += guild.voice_client.drain()
+		play_cpu.append(time.process_time() - cpu_started)
+
+	# Bursts of simultaneous clicks in one guild: each start is a stop/start of the voice client
+	guild = guilds[0]
+	bursts, burst_size = 20, 5
+	starts_before = guild.voice_client.plays
+	for n in range(bursts):
+		await asyncio.gather(*(discord_bot.play_sound(sounds[(n + k) % len(sounds)], guild) for k in range(burst_size)))
+		guild.voice_client.drain()
+	return {
+		"plays": plays,
+		"burst": {"bursts": bursts, "clicks_per_burst": burst_size, "starts_per_burst": round((guild.voice_client.plays - starts_before) / bursts, 2)},
+		"call_latency": percentiles(latencies),
+		"call_cpu_ms_mean": round(sum(call_cpu) / plays * 1000, 4),
+		"cpu_ms_per_play_mean": round(sum(play_cpu) / plays * 1000, 4),
+		"frames_per_play_mean": round(frames / plays, 1),
+	}
+
+
+async def bench_http(env, guilds, clients_list, requests_per_client):
+	client = env.web_server.app.test_client()
+	sounds = env.discord_bot.sound_catalog.names()
+	endpoints = {
+		"/api/play": lambda n: client.post("/api/play", json={"guildId": str(guilds[n % len(guilds)].id), "sound": sounds[n % len(sounds)]}),
+		"/api/logs": lambda n: client.get("/api/logs?limit=100"),
+		"/api/guilds": lambda n: client.get("/api/guilds"),
+		"/api/channels": lambda n: client.get(f"/api/channels/{guilds[n % len(guilds)].id}"),
+	}
+	results = {}
+	for name, request in endpoints.items():
+		results[name] = {}
+		for clients in clients_list:
+			latencies, errors = [], 0
+
+			async def run_client(offset):
+				nonlocal errors
+				for n in range(requests_per_client):
+					started = time.perf_counter()
+					response = await request(offset * requests_per_client + n)
+					await response.get_data()
+					latencies.append(time.perf_counter() - started)
+					if response.status_code >= 400:
+						errors += 1
+					if name == "/api/play":
+						# Let the next request find an idle voice client, like a finished clip would
+						voice_client = guilds[(offset * requests_per_client + n) % len(guilds)].voice_client
+						voice_client.stop()
+
+			started = time.perf_counter()
+			await asyncio.gather(*(run_client(offset) for offset in range(clients)))
+			elapsed = time.perf_counter() - started
+			results[name][str(clients)] = {
+				"requests": len(latencies),
+				"errors": errors,
+				"requests_per_second": round(len(latencies) / elapsed, 1),
+				"latency": percentiles(latencies),
+			}
+	return results
+
+
+def bench_logs(env, records):
+	discord_bot = env.discord_bot
+	pipeline = discord_bot.log_pipeline
+	before = pipeline.stats()
+	started = time.perf_counter()
+	cpu_started = time.process_time()
+	for n in range(records):
+		discord_bot.log_message(f"benchmark record {n}", category="benchmark")
+	call_seconds = time.perf_counter() - started
+	call_cpu = time.process_time() - cpu_started
+	# Wait for the listener thread to write everything that was queued
+	pipeline.queue.join()
+	drained_seconds = time.perf_counter() - started
+	after = pipeline.stats()
+	return {
+		"records": records,
+		"us_per_call": round(call_seconds / records * 1e6, 3),
+		"cpu_us_per_call": round(call_cpu / records * 1e6, 3),
+		"calls_per_second": round(records / call_seconds, 1),
+		"drained_records_per_second": round(records / drained_seconds, 1),
+		"dropped": after["dropped"] - before["dropped"],
+		"sampled": after["sampled"] - before["sampled"],
+	}
+
+
+def bench_generate(sizes):
+	spec = importlib.util.spec_from_file_location("generate_countdown", os.path.join(fake_discord.REPO_ROOT, "generate-countdown.py"))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	from tts_backends import get_backend
+	from tts_cache import TTSCache
+
+	# mp3 needs ffmpeg; WAV keeps the run self-contained where it is missing
+	output_format = "mp3" if shutil.which("ffmpeg") else "wav"
+	results = []
+	with tempfile.TemporaryDirectory() as directory:
+		for size in sizes:
+			for reuse_cache in (False, True):
+				cache = TTSCache(os.path.join(directory, "tts-cache"))
+				output_file = os.path.join(directory, f"countdown-{size}-0.{output_format}")
+				started = time.perf_counter()
+				module.generate_countdown(size, 0, output_file, "en", reuse_cache, False, backend=get_backend("tone"), cache=cache, output_format=output_format)
+				elapsed = time.perf_counter() - started
+				results.append({
+					"numbers": size + 1,
+					"reuse_cache": reuse_cache,
+					"format": output_format,
+					"seconds": round(elapsed, 3),
+					# Every number is one second of audio, so this is also seconds of audio per second
+					"numbers_per_second": round((size + 1) / elapsed, 1),
+				})
+	return results
+
+
+def cpu_seconds():
+	"""CPU time of this process plus its finished children (ffmpeg)."""
+	children = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def bench_clips(env):
+	import discord
+	import ogg_opus
+	from clip_cache import OpusFrameSource, load_frames, transcode_to_opus
+
+	catalog = env.discord_bot.sound_catalog
+	can_transcode = bool(shutil.which("ffmpeg")) and (discord.opus.is_loaded() or discord.opus._load_default())
+	loads = {"transcoded": [], "demuxed": []}
+	play_cpu = []
+	audio_seconds = 0.0
+	with tempfile.TemporaryDirectory() as directory:
+		for name in catalog.names():
+			info = catalog.get(name)
+			opus_path = os.path.join(directory, f"{os.path.basename(name)}.opus")
+			if can_transcode and info.path.endswith(".mp3"):
+				started = cpu_seconds()
+				frames, _ = load_frames(info.path)
+				loads["transcoded"].append(cpu_seconds() - started)
+				transcode_to_opus(info.path, opus_path)
+			else:
+				frames = [fake_discord.FAKE_OPUS_PACKET] * max(1, int((info.duration or 1.0) * 50))
+				ogg_opus.write_ogg_opus(opus_path, frames)
+			started = cpu_seconds()
+			frames, how = load_frames(opus_path)
+			loads[how].append(cpu_seconds() - started)
+			audio_seconds += len(frames) / 50
+
+			# A play reads every frame, as the audio player thread would; this part is the same either way
+			source = OpusFrameSource(tuple(frames))
+			started = cpu_seconds()
+			while source.read():
+				pass
+			play_cpu.append(cpu_seconds() - started)
+
+	def mean_ms(samples):
+		return round(sum(samples) / len(samples) * 1000, 3) if samples else None
+
+	send_ms = mean_ms(play_cpu)
+	return {
+		"clips": len(play_cpu),
+		"audio_seconds": round(audio_seconds, 1),
+		"transcoded": bool(loads["transcoded"]),
+		"load_cpu_ms_mean": {how: mean_ms(samples) for how, samples in loads.items()},
+		"send_cpu_ms_mean": send_ms,
+		# A cold play loads the clip, then sends it; a warm one only sends
+		"cold_play_cpu_ms_mean": {how: round(mean_ms(samples) + send_ms, 3) if samples else None for how, samples in loads.items()},
+	}
+
+
+def run_metadata():
+	try:
+		commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=fake_discord.REPO_ROOT, capture_output=True, text=True).stdout.strip()
+	except OSError:
+		commit = None
+	return {
+		"timestamp": datetime.datetime.now().isoformat(),
+		"commit": commit or None,
+		"python": sys.version.split()[0],
+		"platform": platform.platform(),
+		"cpus": os.cpu_count(),
+	}
+
+
+async def run(args):
+	results = {"benchmark": "bot", "meta": run_metadata(), "suites": {}}
+	env = fake_discord.load_environment({"playback-coalesce-ms": args.coalesce_ms})
+	try:
+		guilds = fake_discord.install(env.bot, guild_count=args.guilds, channels_per_guild=3)
+		fake_discord.seed_clip_cache(env.discord_bot)
+		# on_ready is never dispatched here, so build the web snapshot it would have
+		env.discord_bot.guild_snapshot.rebuild(env.bot.guilds)
+
+		if "play" in args.suites:
+			results["suites"]["play"] = await bench_play(env, guilds, args.plays)
+			play = results["suites"]["play"]
+			print(f"play      {play['plays']} plays  p50 {play['call_latency']['p50_ms']}ms  p99 {play['call_latency']['p99_ms']}ms  cpu/play {play['cpu_ms_per_play_mean']}ms")
+			print(f"play      bursts of {play['burst']['clicks_per_burst']} clicks  {play['burst']['starts_per_burst']} starts per burst")
+		if "http" in args.suites:
+			results["suites"]["http"] = await bench_http(env, guilds, args.clients, args.requests)
+			for endpoint, by_clients in results["suites"]["http"].items():
+				for clients, result in by_clients.items():
+					print(f"http      {endpoint:<14} {clients:>3} clients  {result['requests_per_second']:>8} req/s  p99 {result['latency']['p99_ms']}ms  errors {result['errors']}")
+		if "logs" in args.suites:
+			results["suites"]["logs"] = bench_logs(env, args.records)
+			logs = results["suites"]["logs"]
+			print(f"logs      {logs['records']} records  {logs['us_per_call']}us/call  drained at {logs['drained_records_per_second']}/s  dropped {logs['dropped']}")
+		if "clips" in args.suites:
+			results["suites"]["clips"] = bench_clips(env)
+			clips = results["suites"]["clips"]
+			for how, cpu_ms in clips["cold_play_cpu_ms_mean"].items():
+				if cpu_ms is not None:
+					print(f"clips     {how:<11} {clips['clips']} clips  load {clips['load_cpu_ms_mean'][how]}ms  cold play {cpu_ms}ms  warm play {clips['send_cpu_ms_mean']}ms")
+			if not clips["transcoded"]:
+				print("clips     transcoded  not measured (needs ffmpeg and libopus), so there is no MP3 baseline to compare with")
+	finally:
+		fake_discord.remove_environment(env)
+
+	if "generate" in args.suites:
+		results["suites"]["generate"] = bench_generate(args.countdown_sizes)
+		for result in results["suites"]["generate"]:
+			cache = "warm" if result["reuse_cache"] else "cold"
+			print(f"generate  {result['numbers']:>4} numbers ({cache} cache)  {result['seconds']}s  {result['numbers_per_second']} numbers/s")
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the bot and web server against a local Discord stand-in.")
+	parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES), help="Which suites to run. Default is all.")
+	parser.add_argument("--guilds", type=int, default=10, help="Number of fake guilds, each connected to voice.")
+	parser.add_argument("--plays", type=int, default=500, help="play suite: number of play_sound calls.")
+	parser.add_argument("--coalesce-ms", type=int, default=0, help="play suite: playback actor window. Default is 0, so back-to-back plays in a guild are not delayed by it.")
+	parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32], help="http suite: concurrent client counts to test.")
+	parser.add_argument("--requests", type=int, default=100, help="http suite: requests per client.")
+	parser.add_argument("--records", type=int, default=20000, help="logs suite: number of log_message calls.")
+	parser.add_argument("--countdown-sizes", type=int, nargs="+", default=[10, 60], help="generate suite: countdown lengths to generate.")
+	parser.add_argument("--json", type=str, help="Also write the results to this JSON file.")
+	args = parser.parse_args()
+	# The run changes into a scratch directory, so resolve the output path first
+	json_path = os.path.abspath(args.json) if args.json else None
+
+	results = asyncio.run(run(args))
+	if json_path:
+		with open(json_path, "w") as output:
+			json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Benchmark the sharded deployment's control plane against stand-in shard workers.
+
+The benchmark process is worker 0 and runs the web app. Workers 1..N-1 are
+child processes of this script, each with the Discord stand-in. Every guild
+is installed only in the worker that owns its shard, exactly as
+AutoShardedBot would receive it, so requests for the other workers' guilds
+have to cross the control plane. Nothing connects to Discord.
+
+Measured, through Quart's test client:
+
+- /api/play for guilds owned by worker 0 (local) and by the other workers (routed)
+- /api/guilds and /api/channels/<id>, merged from or routed to every worker
+- what a routed request and /api/guilds return once a worker has been killed
+
+	python benchmarks/bench_shards.py --processes 2 --shard-count 4
+	python benchmarks/bench_shards.py --processes 4 --shard-count 8 --guilds 200 --json shards.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_discord
+from bench_bot import percentiles
+from control_plane import shard_for, worker_for_shard
+
+READY = "ready"
+
+
+def guild_ids(count):
+	"""Ids of `count` guilds spread over the shards: guild n lands on shard n % shard_count."""
+	return [(n << 22) + 1 for n in range(count)]
+
+
+def environment_overrides(args, socket_dir):
+	return {
+		"shard-count": args.shard_count,
+		"shard-processes": args.processes,
+		"control-plane-address": f"unix:{socket_dir}/control-{{worker}}.sock",
+		"playback-coalesce-ms": 0,
+		"clip-cache-preload": False,
+	}
+
+
+def owned_guilds(args, worker):
+	return [guild_id for guild_id in guild_ids(args.guilds) if worker_for_shard(shard_for(guild_id, args.shard_count), args.processes) == worker]
+
+
+async def load_worker(args, worker, socket_dir):
+	"""Import the bot as shard worker `worker`, install its guilds and start answering the control plane."""
+	os.environ["SHARD_WORKER"] = str(worker)
+	env = fake_discord.load_environment(environment_overrides(args, socket_dir))
+	guilds = fake_discord.install(env.bot, channels_per_guild=2, guild_ids=owned_guilds(args, worker))
+	fake_discord.seed_clip_cache(env.discord_bot)
+	for guild in guilds:
+		env.discord_bot.guild_snapshot.update_guild(guild)
+	await env.web_server.main_control()
+	return env, guilds
+
+
+async def run_worker(args):
+	env, _ = await load_worker(args, args.worker, args.socket_dir)
+	print(READY, flush=True)
+	try:
+		# Exit with the benchmark, which closes our stdin
+		await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+	finally:
+		env.web_server.shard_router.close()
+		fake_discord.remove_environment(env)
+
+
+def start_workers(args, socket_dir):
+	workers = {}
+	for worker in range(1, args.processes):
+		command = [sys.executable, os.path.abspath(__file__), "--worker", str(worker), "--socket-dir", socket_dir,
+			"--processes", str(args.processes), "--shard-count", str(args.shard_count), "--guilds", str(args.guilds)]
+		workers[worker] = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+	for worker, process in workers.items():
+		if process.stdout.readline().strip() != READY:
+			raise RuntimeError(f"Stand-in shard worker {worker} did not start")
+	return workers
+
+
+def stop_workers(workers):
+	for process in workers.values():
+		if process.poll() is None:
+			process.stdin.close()
+	for process in workers.values():
+		try:
+			process.wait(timeout=10)
+		except subprocess.TimeoutExpired:
+			process.kill()
+
+
+async def timed_requests(request, count):
+	latencies, statuses = [], {}
+	for n in range(count):
+		started = time.perf_counter()
+		response = await request(n)
+		await response.get_data()
+		latencies.append(time.perf_counter() - started)
+		statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+	return {"statuses": statuses, "latency": percentiles(latencies)}
+
+
+async def run(args):
+	socket_dir = tempfile.mkdtemp(prefix="wos-shards-")
+	workers = start_workers(args, socket_dir)
+	env = None
+	try:
+		env, local_guilds = await load_worker(args, 0, socket_dir)
+		client = env.web_server.app.test_client()
+		sounds = env.discord_bot.sound_catalog.names()
+		remote_guilds = [guild_id for guild_id in guild_ids(args.guilds) if guild_id not in {guild.id for guild in local_guilds}]
+
+		def play(guilds):
+			return lambda n: client.post("/api/play", json={"guildId": str(guilds[n % len(guilds)]), "sound": sounds[n % len(sounds)]})
+
+		results = {"processes": args.processes, "shard_count": args.shard_count, "guilds": args.guilds, "local_guilds": len(local_guilds)}
+		results["play_local"] = await timed_requests(play([guild.id for guild in local_guilds]), args.requests)
+		if remote_guilds:
+			results["play_routed"] = await timed_requests(play(remote_guilds), args.requests)
+			results["channels_routed"] = await timed_requests(lambda n: client.get(f"/api/channels/{remote_guilds[n % len(remote_guilds)]}"), args.requests)
+		results["guilds_merged"] = await timed_requests(lambda n: client.get("/api/guilds"), args.requests)
+		response = await client.get("/api/guilds")
+		results["guilds_listed"] = len(await response.get_json())
+
+		if workers:
+			# Kill the last worker: its guilds answer 502 and the merged list leaves them out
+			victim = args.processes - 1
+			workers[victim].kill()
+			workers[victim].wait()
+			victim_guild = owned_guilds(args, victim)[0]
+			response = await client.post("/api/play", json={"guildId": str(victim_guild), "sound": sounds[0]})
+			guilds_response = await client.get("/api/guilds")
+			results["worker_down"] = {
+				"worker": victim,
+				"play_status": response.status_code,
+				"play_error": (await response.get_json()).get("error"),
+				"guilds_listed": len(await guilds_response.get_json()),
+			}
+		results["router"] = env.web_server.shard_router.stats()
+	finally:
+		stop_workers(workers)
+		if env is not None:
+			env.web_server.shard_router.close()
+			fake_discord.remove_environment(env)
+		shutil.rmtree(socket_dir, ignore_errors=True)
+
+	print(f"{args.processes} processes, {args.shard_count} shards, {args.guilds} guilds ({results['local_guilds']} in worker 0)")
+	for name in ("play_local", "play_routed", "channels_routed", "guilds_merged"):
+		if name in results:
+			latency = results[name]["latency"]
+			print(f"{name:<16} p50 {latency['p50_ms']:>8} ms  p99 {latency['p99_ms']:>8} ms  statuses {results[name]['statuses']}")
+	print(f"/api/guilds lists {results['guilds_listed']} of {args.guilds} guilds")
+	if "worker_down" in results:
+		down = results["worker_down"]
+		print(f"worker {down['worker']} down: /api/play {down['play_status']} ({down['play_error']}), /api/guilds lists {down['guilds_listed']}")
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark control plane routing between stand-in shard worker processes.")
+	parser.add_argument("--processes", type=int, default=2, help="Shard worker processes, including this one.")
+	parser.add_argument("--shard-count", type=int, default=4, help="Total shards.")
+	parser.add_argument("--guilds", type=int, default=40, help="Fake guilds, spread over the shards.")
+	parser.add_argument("--requests", type=int, default=200, help="Requests per measurement.")
+	parser.add_argument("--json", type=str, help="Also write the results to this JSON file.")
+	parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+	parser.add_argument("--socket-dir", type=str, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.worker is not None:
+		asyncio.run(run_worker(args))
+		return
+	# The run changes into a scratch directory, so resolve the output path first
+	json_path = os.path.abspath(args.json) if args.json else None
+
+	results = asyncio.run(run(args))
+	if json_path:
+		with open(json_path, "w") as output:
+			json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""A local stand-in for Discord guilds, voice channels and voice clients.
+
+It implements the parts of discord.VoiceClient, Guild and VoiceChannel that
+play_sound, stop_sound and the web_server handlers touch. The fakes are
+registered in the bot's connection state, so bot.guilds, bot.get_guild,
+bot.voice_clients and guild.voice_client all work unchanged.
+
+Playback never touches the network. FakeVoiceClient.play() keeps the
+source, and drain() reads it to the end the way discord.py's AudioPlayer
+would, without the 20 ms pacing. That lets CPU per play be measured.
+
+The clip cache is seeded with synthetic Opus-sized frames matching each
+clip's real duration, so neither ffmpeg nor libopus is needed.
+
+	env = load_environment()       # imports discord_bot/web_server in a scratch directory
+	guilds = install(env.bot, guild_count=10, channels_per_guild=3)
+	seed_clip_cache(env.discord_bot)
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, REPO_ROOT)
+
+import discord  # noqa: E402
+
+FAKE_OPUS_PACKET = b"\xfc" + b"\x00" * 59  # about the size of a 20 ms voice packet
+
+
+class FakeVoiceClient:
+	def __init__(self, bot, guild, channel):
+		self.bot = bot
+		self.guild = guild
+		self.channel = channel
+		self.source = None
+		self.after = None
+		self.plays = 0
+		self.frames_sent = 0
+		self._connected = True
+
+	def is_connected(self):
+		return self._connected
+
+	def is_playing(self):
+		return self.source is not None
+
+	def is_paused(self):
+		return False
+
+	def play(self, source, *, after=None):
+		if not self._connected:
+			raise discord.ClientException("Not connected to voice.")
+		if self.source is not None:
+			raise discord.ClientException("Already playing audio.")
+		self.source = source
+		self.after = after
+		self.plays += 1
+
+	def stop(self):
+		source, self.source = self.source, None
+		if source is not None:
+			source.cleanup()
+			if self.after:
+				self.after(None)
+
+	def drain(self):
+		"""Read the current source to the end, as the audio player thread would, and return the frame count."""
+		source = self.source
+		frames = 0
+		if source is None:
+			return 0
+		while source.read():
+			frames += 1
+		self.frames_sent += frames
+		self.stop()
+		return frames
+
+	async def move_to(self, channel, **kwargs):
+		self.channel = channel
+
+	async def disconnect(self, *, force=False):
+		self.stop()
+		self._connected = False
+		self.bot._connection._remove_voice_client(self.guild.id)
+
+
+class FakeVoiceChannel(discord.VoiceChannel):
+	"""A VoiceChannel (so isinstance checks pass) that connects a FakeVoiceClient."""
+
+	def __init__(self, bot, guild, channel_id, name):
+		self._bot = bot
+		self.id = channel_id
+		self.name = name
+		self.guild = guild
+
+	def __repr__(self):
+		return f"<FakeVoiceChannel id={self.id} name={self.name!r}>"
+
+	async def connect(self, **kwargs):
+		voice_client = FakeVoiceClient(self._bot, self.guild, self)
+		self._bot._connection._add_voice_client(self.guild.id, voice_client)
+		return voice_client
+
+
+class FakeGuild:
+	def __init__(self, bot, guild_id, name, channel_count):
+		self._bot = bot
+		self.id = guild_id
+		self.name = name
+		self.roles = []
+		self.channels = [FakeVoiceChannel(bot, self, guild_id * 100 + n, f"voice-{n}") for n in range(channel_count)]
+
+	@property
+	def voice_client(self):
+		return self._bot._connection._get_voice_client(self.id)
+
+	def get_channel(self, channel_id):
+		return discord.utils.get(self.channels, id=channel_id)
+
+	def __repr__(self):
+		return f"<FakeGuild id={self.id} name={self.name!r}>"
+
+
+def install(bot, guild_count=1, channels_per_guild=2, connect=True, guild_ids=None):
+	"""Register fake guilds (optionally already in voice) with `bot` and return them.
+
+	Guild ids are 1000, 1001, ... unless `guild_ids` gives them, e.g. to land on particular shards.
+	"""
+	guilds = []
+	for n, guild_id in enumerate(guild_ids if guild_ids is not None else range(1000, 1000 + guild_count)):
+		guild = FakeGuild(bot, guild_id, f"guild-{n}", channels_per_guild)
+		bot._connection._guilds[guild.id] = guild
+		if connect:
+			bot._connection._add_voice_client(guild.id, FakeVoiceClient(bot, guild, guild.channels[0]))
+		guilds.append(guild)
+	return guilds
+
+
+def seed_clip_cache(discord_bot):
+	"""Fill the clip cache with synthetic frames as long as each catalog clip."""
+	from clip_cache import CachedClip
+	for name in discord_bot.sound_catalog.names():
+		info = discord_bot.sound_catalog.get(name)
+		frame_count = max(1, int((info.duration or 1.0) * 50))
+		discord_bot.clip_cache._insert(CachedClip(name, [FAKE_OPUS_PACKET] * frame_count))
+
+
+def load_environment(config_overrides=None, quiet=True):
+	"""Import discord_bot and web_server in a scratch directory with a generated config.json.
+
+	The scratch directory links the real sound-clips and templates, so the
+	catalog is real, while logs, archives and stores stay out of the tree.
+	"""
+	original_cwd = os.getcwd()
+	workdir = tempfile.mkdtemp(prefix="wos-bench-")
+	for name in ("sound-clips", "templates"):
+		os.symlink(os.path.join(REPO_ROOT, name), os.path.join(workdir, name))
+	with open(os.path.join(REPO_ROOT, "example.config.json"), "r") as example:
+		config = json.load(example)
+	config.update({
+		"token": "benchmark",
+		"purge-and-repost-on-channel-ids": [],
+		"roles-allowed-to-control-bot": [],
+		"log-archive": False,
+		"sound-catalog-poll-seconds": 0,
+		"log-levels": {"default": "info"},
+	})
+	config.update(config_overrides or {})
+	with open(os.path.join(workdir, "config.json"), "w") as config_file:
+		json.dump(config, config_file)
+	os.chdir(workdir)
+
+	import discord_bot
+	import web_server
+	if quiet:
+		discord_bot.console_sink.setStream(open(os.devnull, "w"))
+	return types.SimpleNamespace(workdir=workdir, original_cwd=original_cwd, discord_bot=discord_bot, web_server=web_server, bot=discord_bot.bot, config=config)
+
+
+def remove_environment(env):
+	env.discord_bot.log_pipeline.stop()
+	os.chdir(env.original_cwd)
+	shutil.rmtree(env.workdir, ignore_errors=True)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""In-memory cache of sound clips pre-encoded into 20 ms Opus frames.
+
+Every clip in sound-clips/ is decoded once (a single ffmpeg run), encoded to
+Opus once, and kept as a tuple of ready-to-send packets. Playback then goes
+through OpusFrameSource, which hands those packets straight to the voice
+client without spawning a subprocess or re-encoding anything.
+
+A clip stored as Discord-native Ogg/Opus (clip.opus: 48 kHz, 20 ms packets)
+skips both steps. Its pages are demuxed in-process and the packets are
+cached exactly as they are in the file. The catalog prefers .opus over
+.mp3, and a file whose packets cannot be sent as-is is transcoded instead.
+
+Clips made by generate-countdown.py have an onset sidecar (clip.json next to
+clip.mp3). Playback starts at the first spoken onset it records, so there is
+no dead air before the first number.
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+import discord
+
+import ogg_opus
+from sound_catalog import clip_path
+
+logger = logging.getLogger(__name__)
+
+SOUND_DIR = "sound-clips"
+SAMPLE_RATE = 48000
+CHANNELS = 2
+PCM_FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE  # bytes of 16-bit stereo PCM per frame
+FRAME_LENGTH_MS = discord.opus.Encoder.FRAME_LENGTH  # 20 ms
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+def decode_to_pcm(path):
+	"""Decode an audio file to 48 kHz stereo s16le PCM with a single ffmpeg run."""
+	result = subprocess.run(
+		["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+		 "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", str(CHANNELS), "pipe:1"],
+		stdout=subprocess.PIPE,
+		stderr=subprocess.PIPE,
+		check=True,
+	)
+	return result.stdout
+
+
+def encode_pcm(pcm):
+	"""Encode raw PCM into a list of 20 ms Opus packets, zero-padding the last frame."""
+	encoder = discord.opus.Encoder()
+	frames = []
+	for offset in range(0, len(pcm), PCM_FRAME_SIZE):
+		chunk = pcm[offset:offset + PCM_FRAME_SIZE]
+		if len(chunk) < PCM_FRAME_SIZE:
+			chunk += b"\x00" * (PCM_FRAME_SIZE - len(chunk))
+		frames.append(encoder.encode(chunk, encoder.SAMPLES_PER_FRAME))
+	return frames
+
+
+def transcode_to_opus(path, output_path=None):
+	"""Decode `path` and write it as a Discord-native .opus next to it (or to `output_path`); returns that path."""
+	output_path = output_path or f"{os.path.splitext(path)[0]}.opus"
+	ogg_opus.write_ogg_opus(output_path, encode_pcm(decode_to_pcm(path)), channels=CHANNELS)
+	return output_path
+
+
+def load_frames(path):
+	"""Return (frames, how) for the clip at `path`: demuxed from .opus when possible, else transcoded."""
+	if path.endswith(".opus"):
+		try:
+			return ogg_opus.read_frames(path)[1], "demuxed"
+		except ValueError as e:
+			logger.warning(f"{path} cannot be played without transcoding: {e}")
+	return encode_pcm(decode_to_pcm(path)), "transcoded"
+
+
+def lead_in_frames(path):
+	"""Whole frames before the first onset recorded in the clip's sidecar; 0 if it has none."""
+	try:
+		with open(f"{os.path.splitext(path)[0]}.json", "r") as sidecar_file:
+			first_onset_ms = json.load(sidecar_file).get("first_onset_ms", 0)
+	except (OSError, ValueError, AttributeError):
+		return 0
+	return max(0, int(first_onset_ms // FRAME_LENGTH_MS))
+
+
+class CachedClip:
+	"""A fully encoded clip. The frame tuple is never mutated, so it can be shared freely.
+
+	`start_frame` is where playback begins (the first onset); the frames before
+	it are kept so second boundaries still line up for SegmentTable.
+	"""
+
+	def __init__(self, name, frames, start_frame=0):
+		self.name = name
+		self.frames = tuple(frames)
+		self.start_frame = min(start_frame, max(0, len(self.frames) - 1))
+		self.nbytes = sum(len(frame) for frame in self.frames)
+
+	@property
+	def duration(self):
+		return len(self.frames) * FRAME_LENGTH_MS / 1000
+
+
+class OpusFrameSource(discord.AudioSource):
+	"""Plays a sequence of pre-encoded Opus frames from its own read cursor.
+
+	Any number of sources can share one frame tuple: each only holds a reference
+	to it and an integer position, which is what makes broadcasting a clip to
+	many voice clients cost the same decode and encode as a single play.
+	"""
+
+	def __init__(self, frames, start=0):
+		self.frames = frames
+		self.position = start
+
+	def read(self):
+		if self.position >= len(self.frames):
+			return b""
+		frame = self.frames[self.position]
+		self.position += 1
+		return frame
+
+	def is_opus(self):
+		return True
+
+
+class FrameSequenceSource(discord.AudioSource):
+	"""Plays several frame sequences back to back as one continuous source.
+
+	The parts are referenced, never concatenated, so composing a long stream
+	from cached pieces costs nothing beyond the list of parts itself.
+	"""
+
+	def __init__(self, parts):
+		self.parts = [part for part in parts if part]
+		self.part = 0
+		self.position = 0
+
+	def read(self):
+		while self.part < len(self.parts):
+			frames = self.parts[self.part]
+			if self.position < len(frames):
+				frame = frames[self.position]
+				self.position += 1
+				return frame
+			self.part += 1
+			self.position = 0
+		return b""
+
+	def is_opus(self):
+		return True
+
+
+class ClipCache:
+	"""LRU cache of CachedClip objects bounded by the total size of their Opus frames."""
+
+	def __init__(self, directory=SOUND_DIR, memory_budget=DEFAULT_MEMORY_BUDGET):
+		self.directory = directory
+		self.memory_budget = memory_budget
+		self._clips = collections.OrderedDict()
+		self._lock = threading.Lock()
+		self._pending = {}
+		self.total_bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.loads = collections.Counter()  # "demuxed" or "transcoded" -> count
+		self.load_seconds = collections.Counter()
+
+	def path_for(self, name):
+		return clip_path(self.directory, name)
+
+	def get_cached(self, name):
+		"""Return the cached clip without loading it, or None on a miss."""
+		with self._lock:
+			clip = self._clips.get(name)
+			if clip is not None:
+				self._clips.move_to_end(name)
+			return clip
+
+	async def get(self, name):
+		"""Return the clip for `name`, demuxing or transcoding it off the event loop on a miss."""
+		clip = self.get_cached(name)
+		if clip is not None:
+			self.hits += 1
+			return clip
+
+		# Concurrent requests for the same cold clip share a single load
+		pending = self._pending.get(name)
+		if pending is None:
+			self.misses += 1
+			loop = asyncio.get_running_loop()
+			pending = loop.run_in_executor(None, self._load, name)
+			self._pending[name] = pending
+			# Cached when the load finishes, even if every caller waiting for it was cancelled meanwhile
+			pending.add_done_callback(lambda future: self._loaded(name, future))
+		return await asyncio.shield(pending)
+
+	def _loaded(self, name, future):
+		if self._pending.get(name) is future:
+			del self._pending[name]
+		if not future.cancelled() and future.exception() is None:
+			self._insert(future.result())
+
+	async def source(self, name):
+		"""Build a fresh playback source for `name`; every source has its own cursor."""
+		clip = await self.get(name)
+		return OpusFrameSource(clip.frames, clip.start_frame)
+
+	async def preload(self, names):
+		"""Warm the cache with `names`, most important first; stops once the budget is full."""
+		for name in names:
+			if self.total_bytes >= self.memory_budget:
+				logger.info(f"Clip cache budget reached, not preloading {name}")
+				break
+			try:
+				await self.get(name)
+			except Exception as e:
+				logger.error(f"Failed to preload clip {name}: {e}")
+
+	def invalidate(self, name=None):
+		"""Drop one clip (or every clip) so it is re-encoded on next use."""
+		with self._lock:
+			names = [name] if name is not None else list(self._clips)
+			for key in names:
+				clip = self._clips.pop(key, None)
+				if clip is not None:
+					self.total_bytes -= clip.nbytes
+
+	def stats(self):
+		with self._lock:
+			return {
+				"clips": len(self._clips),
+				"bytes": self.total_bytes,
+				"memory_budget": self.memory_budget,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"loads": dict(self.loads),
+				"load_ms": {how: round(seconds * 1000, 3) for how, seconds in self.load_seconds.items()},
+			}
+
+	def _load(self, name):
+		path = self.path_for(name)
+		started = time.perf_counter()
+		frames, how = load_frames(path)
+		elapsed = time.perf_counter() - started
+		with self._lock:
+			self.loads[how] += 1
+			self.load_seconds[how] += elapsed
+		clip = CachedClip(name, frames, lead_in_frames(path))
+		logger.info(f"Loaded clip {name} ({how} from {os.path.basename(path)} in {elapsed * 1000:.1f}ms): {len(clip.frames)} frames, {clip.nbytes} bytes")
+		return clip
+
+	def _insert(self, clip):
+		with self._lock:
+			previous = self._clips.pop(clip.name, None)
+			if previous is not None:
+				self.total_bytes -= previous.nbytes
+			self._clips[clip.name] = clip
+			self.total_bytes += clip.nbytes
+			# Always keep the clip that was just loaded, even if it alone exceeds the budget
+			while self.total_bytes > self.memory_budget and len(self._clips) > 1:
+				_, evicted = self._clips.popitem(last=False)
+				self.total_bytes -= evicted.nbytes
+				self.evictions += 1
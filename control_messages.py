@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Diff-based reconciliation of the control messages posted in channels.
+
+The ids of the messages posted in each channel are stored in
+tmp-data/control-messages.json, together with a hash of the buttons each
+one shows. Reconciling a channel compares those hashes with the current
+sound list. Messages that already show the right buttons are left alone,
+changed ones are edited in place through a partial message (no
+fetch_message first), and the 100-message history scan only happens for
+channels with no stored record. That scan only adopts a message whose
+buttons are our own control buttons.
+
+Channels are reconciled concurrently. Every REST call goes through a
+shared token bucket that stays under Discord's global rate limit. Calls
+within one channel stay sequential, since they share that channel's
+per-route bucket. Each run counts its API calls, so the cost of startup
+can be reported. The store is written on the loop's default executor.
+"""
+import asyncio
+import collections
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+
+import discord
+
+STORE_PATH = "tmp-data/control-messages.json"
+# Bump when the layout of ControlView changes so every posted message is edited once
+VIEW_VERSION = 1
+BUTTONS_PER_MESSAGE = 22  # 22 sound buttons + 3 control buttons = 25 total
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_SECOND = 20
+# Buttons every ControlView message has, whatever sounds it lists
+CONTROL_CUSTOM_IDS = frozenset({"join_button", "leave_button", "stop_button"})
+
+
+def chunk_sounds(sound_files, size=BUTTONS_PER_MESSAGE):
+	return [sound_files[i:i + size] for i in range(0, len(sound_files), size)]
+
+
+def is_control_message(message):
+	"""True if `message` carries the control buttons, so it is one of ours to edit."""
+	for row in message.components:
+		for component in getattr(row, "children", [row]):
+			if getattr(component, "custom_id", None) in CONTROL_CUSTOM_IDS:
+				return True
+	return False
+
+
+def view_hash(sounds):
+	payload = json.dumps({"version": VIEW_VERSION, "sounds": list(sounds)})
+	return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class ControlMessageStore:
+	"""{channel_id: [{"id": message_id, "hash": view_hash}, ...]} persisted as JSON."""
+
+	def __init__(self, path=STORE_PATH):
+		self.path = path
+		self.channels = self._load()
+		self._saves = itertools.count()
+		self._written = -1
+		self._write_lock = threading.Lock()
+
+	def _load(self):
+		try:
+			with open(self.path, "r") as store_file:
+				return {int(channel_id): records for channel_id, records in json.load(store_file).items()}
+		except FileNotFoundError:
+			return {}
+		except (OSError, ValueError):
+			# A broken store only costs one history scan per channel
+			return {}
+
+	def get(self, channel_id):
+		return list(self.channels.get(channel_id, []))
+
+	def set(self, channel_id, records):
+		self.channels[channel_id] = records
+
+	def _snapshot(self):
+		return next(self._saves), {str(channel_id): list(records) for channel_id, records in self.channels.items()}
+
+	def _write(self, sequence, snapshot):
+		with self._write_lock:
+			# A save that started later has already written newer records
+			if sequence < self._written:
+				return
+			os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+			temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+			with open(temp_path, "w") as store_file:
+				json.dump(snapshot, store_file)
+			os.replace(temp_path, self.path)
+			self._written = sequence
+
+	def save(self):
+		self._write(*self._snapshot())
+
+	async def save_async(self, executor=None):
+		"""Save without blocking the event loop: the records are copied here and written on `executor`."""
+		await asyncio.get_running_loop().run_in_executor(executor, self._write, *self._snapshot())
+
+
+class RateLimiter:
+	"""Token bucket shared by every REST call the reconciler makes."""
+
+	def __init__(self, rate, burst=None):
+		self.rate = rate
+		self.capacity = burst or rate
+		self.tokens = self.capacity
+		self.updated = time.monotonic()
+		self._lock = asyncio.Lock()
+
+	async def acquire(self):
+		async with self._lock:
+			while True:
+				now = time.monotonic()
+				self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+				self.updated = now
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ControlReconciler:
+	def __init__(self, store, concurrency=DEFAULT_CONCURRENCY, requests_per_second=DEFAULT_REQUESTS_PER_SECOND):
+		self.store = store
+		self.limiter = RateLimiter(requests_per_second)
+		self.semaphore = asyncio.Semaphore(concurrency)
+		self.api_calls = collections.Counter()
+		self.last_report = None
+
+	async def call(self, kind, make_request):
+		await self.limiter.acquire()
+		self.api_calls[kind] += 1
+		return await make_request()
+
+	async def find_existing(self, channel, author):
+		"""First run for a channel: adopt the newest control message the bot posted there."""
+		self.api_calls["history"] += 1
+		await self.limiter.acquire()
+		async for message in channel.history(limit=100):
+			if message.author == author and is_control_message(message):
+				return message.id
+		return None
+
+	async def reconcile_channel(self, channel, sound_files, make_view, author=None, scan_history=True):
+		"""Make `channel` show one control message per chunk of `sound_files`; returns per-action counts."""
+		counts = collections.Counter()
+		chunks = chunk_sounds(sound_files)
+		records = self.store.get(channel.id)
+		if not records and scan_history and author is not None:
+			existing_id = await self.find_existing(channel, author)
+			if existing_id is not None:
+				# Hash unknown, so it is edited once and tracked from then on
+				records = [{"id": existing_id, "hash": None}]
+
+		reconciled = []
+		for idx, chunk in enumerate(chunks):
+			digest = view_hash(chunk)
+			record = records[idx] if idx < len(records) else None
+			if record is not None and record["hash"] == digest:
+				counts["unchanged"] += 1
+				reconciled.append(record)
+				continue
+
+			view = make_view(chunk)
+			if record is not None:
+				message = channel.get_partial_message(record["id"])
+				try:
+					await self.call("edit", lambda: message.edit(content="Click a button to play a sound:", view=view))
+					counts["edited"] += 1
+					reconciled.append({"id": record["id"], "hash": digest})
+					continue
+				except discord.NotFound:
+					# Deleted by hand since we last saw it; post a replacement below
+					pass
+			message = await self.call("send", lambda: channel.send("Controls for wos countdown:", view=view))
+			counts["sent"] += 1
+			reconciled.append({"id": message.id, "hash": digest})
+
+		# Delete extra old messages if we now have fewer groups
+		for record in records[len(chunks):]:
+			message = channel.get_partial_message(record["id"])
+			try:
+				await self.call("delete", message.delete)
+			except discord.NotFound:
+				pass
+			counts["deleted"] += 1
+
+		self.store.set(channel.id, reconciled)
+		return counts
+
+	async def reconcile(self, channels, sound_files, make_view, author=None, on_error=None):
+		"""Reconcile many channels concurrently and return a report of what it cost."""
+		started = time.perf_counter()
+		calls_before = collections.Counter(self.api_calls)
+		totals = collections.Counter()
+		failed = {}
+
+		async def run(channel):
+			async with self.semaphore:
+				try:
+					totals.update(await self.reconcile_channel(channel, sound_files, make_view, author=author))
+				except discord.HTTPException as e:
+					failed[channel.id] = str(e)
+					if on_error:
+						on_error(channel, e)
+
+		await asyncio.gather(*(run(channel) for channel in channels))
+		await self.store.save_async()
+
+		self.last_report = {
+			"channels": len(channels),
+			"failed": failed,
+			"seconds": round(time.perf_counter() - started, 3),
+			"api_calls": sum((self.api_calls - calls_before).values()),
+			"api_calls_by_kind": dict(self.api_calls - calls_before),
+			**{action: totals[action] for action in ("unchanged", "edited", "sent", "deleted")},
+		}
+		return self.last_report
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Local control plane between the bot's shard worker processes.
+
+With "shard-count" set, the bot runs as "shard-processes" worker processes.
+Each one connects its own share of the shards with AutoShardedBot. Discord
+puts a guild on shard (guild_id >> 22) % shard_count, and shards are dealt
+to workers round robin (shard % processes), so every process knows which
+worker owns any guild.
+
+Each worker serves a small request/response protocol on a Unix socket, or
+a local TCP port. It is one JSON object per line: {"id", "op", "args"} in,
+{"id", "result"} or {"id", "error"} out. Requests on one connection are
+handled concurrently and answered in completion order. Worker 0 also runs
+the web server. It uses ShardRouter to send a guild's requests to the
+worker that owns the guild, and to collect results from every worker:
+
+	router = ShardRouter(worker=0, shard_count=4, processes=2, address="unix:tmp-data/control-{worker}.sock", handlers=handlers)
+	await router.serve()
+	payload, status = await router.call(router.owner(guild_id), "play", data)
+	results = await router.gather("guilds")   # [(worker, result or exception), ...]
+
+Addresses are "unix:<path>", where {worker} in the path is replaced by the
+worker index, or "tcp:<host>:<port>", where worker N listens on port + N.
+"""
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = "unix:tmp-data/control-{worker}.sock"
+DEFAULT_TIMEOUT_SECONDS = 10.0
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+
+def shard_for(guild_id, shard_count):
+	return (guild_id >> 22) % shard_count
+
+
+def worker_for_shard(shard_id, processes):
+	return shard_id % processes
+
+
+def worker_shards(worker, shard_count, processes):
+	"""The shard ids worker `worker` connects."""
+	return [shard_id for shard_id in range(shard_count) if worker_for_shard(shard_id, processes) == worker]
+
+
+def worker_address(address, worker):
+	"""Resolve an address template to ("unix", path) or ("tcp", host, port) for one worker."""
+	kind, _, rest = address.partition(":")
+	if kind == "unix":
+		path = rest.format(worker=worker) if "{worker}" in rest else f"{rest}-{worker}"
+		return ("unix", path)
+	if kind == "tcp":
+		host, _, port = rest.rpartition(":")
+		return ("tcp", host or "127.0.0.1", int(port) + worker)
+	raise ValueError(f"Invalid control plane address '{address}', expected unix:<path> or tcp:<host>:<port>")
+
+
+def encode_message(message):
+	return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class ControlServer:
+	"""Answers control plane requests with `handlers`: {op: async handler(args) -> JSON-able result}."""
+
+	def __init__(self, address, handlers):
+		self.address = address
+		self.handlers = handlers
+		self.server = None
+		self.requests = collections.Counter()
+		self.errors = collections.Counter()
+
+	async def start(self):
+		if self.address[0] == "unix":
+			path = self.address[1]
+			os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+			# A socket left behind by a worker that did not shut down cleanly would block the bind
+			if os.path.exists(path):
+				os.remove(path)
+			self.server = await asyncio.start_unix_server(self._serve_client, path, limit=MAX_LINE_BYTES)
+		else:
+			self.server = await asyncio.start_server(self._serve_client, self.address[1], self.address[2], limit=MAX_LINE_BYTES)
+		logger.info(f"Control plane listening on {':'.join(str(part) for part in self.address)}")
+
+	def close(self):
+		if self.server is not None:
+			self.server.close()
+			self.server = None
+			if self.address[0] == "unix" and os.path.exists(self.address[1]):
+				os.remove(self.address[1])
+
+	async def _serve_client(self, reader, writer):
+		tasks = set()
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				task = asyncio.create_task(self._answer(line, writer))
+				tasks.add(task)
+				task.add_done_callback(tasks.discard)
+		except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+			logger.warning(f"Control plane connection closed: {e}")
+		finally:
+			for task in tasks:
+				task.cancel()
+			writer.close()
+
+	async def _answer(self, line, writer):
+		request, request_id = None, None
+		try:
+			request = json.loads(line)
+			request_id = request.get("id")
+			op = request.get("op")
+			handler = self.handlers.get(op)
+			if handler is None:
+				raise ValueError(f"Unknown control plane operation '{op}'")
+			self.requests[op] += 1
+			response = {"id": request_id, "result": await handler(request.get("args"))}
+		except Exception as e:
+			self.errors[str(request.get("op")) if isinstance(request, dict) else "?"] += 1
+			response = {"id": request_id, "error": str(e) or type(e).__name__}
+		try:
+			writer.write(encode_message(response))
+			await writer.drain()
+		except ConnectionError:
+			pass
+
+
+class ControlClient:
+	"""One persistent connection to a worker's control server, shared by concurrent calls."""
+
+	def __init__(self, address, timeout=DEFAULT_TIMEOUT_SECONDS):
+		self.address = address
+		self.timeout = timeout
+		self.reader = None
+		self.writer = None
+		self.pending = {}
+		self.ids = itertools.count(1)
+		self._connect_lock = asyncio.Lock()
+		self._reader_task = None
+
+	async def _connect(self):
+		async with self._connect_lock:
+			if self.writer is not None:
+				return
+			if self.address[0] == "unix":
+				self.reader, self.writer = await asyncio.open_unix_connection(self.address[1], limit=MAX_LINE_BYTES)
+			else:
+				self.reader, self.writer = await asyncio.open_connection(self.address[1], self.address[2], limit=MAX_LINE_BYTES)
+			self._reader_task = asyncio.create_task(self._read_responses(self.reader))
+
+	async def _read_responses(self, reader):
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				response = json.loads(line)
+				future = self.pending.pop(response.get("id"), None)
+				if future is None or future.done():
+					continue
+				if "error" in response:
+					future.set_exception(RuntimeError(response["error"]))
+				else:
+					future.set_result(response.get("result"))
+		except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+			logger.warning(f"Lost control plane connection to {self.address}: {e}")
+		finally:
+			self._disconnected()
+
+	def _disconnected(self):
+		if self.writer is not None:
+			self.writer.close()
+		self.reader = self.writer = None
+		# Calls still waiting fail now; the next call reconnects
+		pending, self.pending = self.pending, {}
+		for future in pending.values():
+			if not future.done():
+				future.set_exception(ConnectionError(f"Control plane connection to {self.address} closed"))
+
+	async def call(self, op, args=None):
+		await self._connect()
+		request_id = next(self.ids)
+		future = asyncio.get_running_loop().create_future()
+		self.pending[request_id] = future
+		try:
+			self.writer.write(encode_message({"id": request_id, "op": op, "args": args}))
+			await self.writer.drain()
+			return await asyncio.wait_for(future, self.timeout)
+		finally:
+			self.pending.pop(request_id, None)
+
+	def close(self):
+		if self._reader_task is not None:
+			self._reader_task.cancel()
+		self._disconnected()
+
+
+class ShardRouter:
+	"""Knows which worker owns each guild and sends requests there, or handles them here if it is this one."""
+
+	def __init__(self, worker, shard_count, processes, address=DEFAULT_ADDRESS, handlers=None, timeout=DEFAULT_TIMEOUT_SECONDS):
+		if not 0 <= worker < processes:
+			raise ValueError(f"Worker {worker} is out of range for {processes} process(es)")
+		if shard_count < processes:
+			raise ValueError(f"{shard_count} shard(s) cannot be split over {processes} processes")
+		self.worker = worker
+		self.shard_count = shard_count
+		self.processes = processes
+		self.address = address
+		self.handlers = handlers or {}
+		self.timeout = timeout
+		self.server = None
+		self.clients = {}
+		self.calls = collections.Counter()
+		self.failures = collections.Counter()
+
+	@property
+	def shard_ids(self):
+		return worker_shards(self.worker, self.shard_count, self.processes)
+
+	def owner(self, guild_id):
+		return worker_for_shard(shard_for(guild_id, self.shard_count), self.processes)
+
+	def is_local(self, guild_id):
+		return self.owner(guild_id) == self.worker
+
+	async def serve(self):
+		"""Start this worker's control server; returns once it is listening."""
+		self.server = ControlServer(worker_address(self.address, self.worker), self.handlers)
+		await self.server.start()
+
+	def client(self, worker):
+		client = self.clients.get(worker)
+		if client is None:
+			client = self.clients[worker] = ControlClient(worker_address(self.address, worker), self.timeout)
+		return client
+
+	async def call(self, worker, op, args=None):
+		"""Run `op` on `worker`: directly if that is this process, otherwise over the control plane."""
+		self.calls[worker] += 1
+		if worker == self.worker:
+			return await self.handlers[op](args)
+		try:
+			return await self.client(worker).call(op, args)
+		except (OSError, asyncio.TimeoutError):
+			self.failures[worker] += 1
+			raise
+
+	async def gather(self, op, args=None):
+		"""Run `op` on every worker at once; returns [(worker, result or exception)] in worker order."""
+		workers = range(self.processes)
+		results = await asyncio.gather(*(self.call(worker, op, args) for worker in workers), return_exceptions=True)
+		return list(zip(workers, results))
+
+	def close(self):
+		if self.server is not None:
+			self.server.close()
+		for client in self.clients.values():
+			client.close()
+
+	def stats(self):
+		return {
+			"worker": self.worker,
+			"processes": self.processes,
+			"shard_count": self.shard_count,
+			"shard_ids": self.shard_ids,
+			"calls": {str(worker): count for worker, count in self.calls.items()},
+			"failures": {str(worker): count for worker, count in self.failures.items()},
+			"served": dict(self.server.requests) if self.server else {},
+			"serve_errors": dict(self.server.errors) if self.server else {},
+		}
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Parallel batch build of a whole countdown catalog for generate-countdown.py.
+
+A manifest lists ranges and languages. The build is a small dependency graph:
+
+1. synthesize: one job per unique (language, number) across every range,
+   run on a thread pool because TTS is network/disk bound.
+2. adjust: one job per unique (language, number). Each number is trimmed,
+   sped up only if its own speech needs it, and placed at the onset offset,
+   so the result is the same for every range that contains it. CPU bound,
+   so it runs on a process pool.
+3. assemble: one job per output file, also on the process pool. Each output
+   gets its onset sidecar, and with opus=True a Discord-native .opus copy.
+
+Both synthesized and adjusted numbers go through the shared content-addressed
+TTSCache, so with --reuse-cache an incremental rebuild only synthesizes and
+adjusts what no earlier run has produced.
+
+Manifest format (JSON):
+
+	{
+		"output-dir": "sound-clips",
+		"jobs": [
+			{"start": 90, "end": 0, "languages": ["en", "de"]},
+			{"start": 10, "end": 0, "language": "fr"}
+		]
+	}
+convert_clips() converts clips already in sound-clips/ (and its segments)
+from MP3 to .opus in bulk. It uses the same process pool and progress output.
+"""
+import concurrent.futures
+import json
+import os
+import time
+
+import numpy as np
+
+from audio_assembly import load_samples, adjust_number, conform, export, write_sidecar, DEFAULT_ONSET_MS, DEFAULT_TAIL_MS
+from tts_cache import TTSCache, synthesis_fields, adjusted_fields
+
+
+def load_manifest(path):
+	"""Return (output_dir, [(start, end, language), ...]) from a manifest file."""
+	with open(path, "r") as manifest_file:
+		manifest = json.load(manifest_file)
+	if isinstance(manifest, list):
+		manifest = {"jobs": manifest}
+
+	ranges = []
+	for job in manifest.get("jobs", []):
+		languages = job.get("languages") or [job.get("language", "en")]
+		for language in languages:
+			ranges.append((int(job["start"]), int(job["end"]), language))
+	# Keep the manifest order but drop duplicates
+	return manifest.get("output-dir", "."), list(dict.fromkeys(ranges))
+
+
+def numbers_in(start, end):
+	return range(start, end - 1, -1)
+
+
+class Progress:
+	"""Prints progress and throughput for one stage of the build."""
+
+	def __init__(self, stage, total):
+		self.stage = stage
+		self.total = total
+		self.done = 0
+		self.step = max(1, total // 10)
+		self.started = time.perf_counter()
+		self.elapsed = 0.0
+
+	def advance(self):
+		self.done += 1
+		self.elapsed = time.perf_counter() - self.started
+		if self.done % self.step == 0 or self.done == self.total:
+			rate = self.done / self.elapsed if self.elapsed > 0 else 0.0
+			print(f"[{self.stage}] {self.done}/{self.total} ({rate:.1f} jobs/s)")
+
+	def summary(self):
+		return {
+			"jobs": self.total,
+			"seconds": round(self.elapsed, 3),
+			"jobs_per_second": round(self.total / self.elapsed, 2) if self.elapsed > 0 else None,
+		}
+
+
+# Workers below run in worker processes, so they only take and return plain values
+
+def synthesize_worker(cache, backend, text, language, reuse_cache):
+	# Runs on the thread pool, so it can use the cache (and its lock) directly
+	fields = synthesis_fields(backend, language, text)
+	return cache.get_or_create(fields, backend.extension, lambda path: backend.synthesize(text, language, path), reuse=reuse_cache)
+
+
+def adjust_worker(path, onset_ms, tail_ms, output_path):
+	samples, sample_rate = load_samples(path)
+	slot, info = adjust_number(samples, sample_rate, onset_ms, tail_ms)
+	export(slot, sample_rate, output_path, format="wav")
+	return output_path, info
+
+
+def assemble_worker(segment_paths, output_file, numbers, placements, onset_ms, opus=False):
+	# Every adjusted number is exactly one second long, so each one is copied straight into its slot
+	segments = [load_samples(path) for path in segment_paths]
+	sample_rate = segments[0][1]
+	channels = max(samples.shape[1] for samples, rate in segments)
+	countdown = np.zeros((len(segments) * sample_rate, channels), dtype=np.float32)
+	for slot, (samples, rate) in enumerate(segments):
+		samples = conform(samples, rate, sample_rate, channels)[:sample_rate]
+		countdown[slot * sample_rate:slot * sample_rate + len(samples)] = samples
+	export(countdown, sample_rate, output_file, format="mp3")
+	if opus:
+		export(countdown, sample_rate, f"{os.path.splitext(output_file)[0]}.opus", format="opus")
+	write_sidecar(output_file, numbers, placements, onset_ms)
+	return len(countdown) * 1000 // sample_rate
+
+
+def convert_worker(path):
+	# Imported here so that only --convert-mp3 needs discord.py, whose libopus binding does the encoding
+	from clip_cache import transcode_to_opus
+	started = time.process_time()
+	output_path = transcode_to_opus(path)
+	return output_path, os.path.getsize(path), os.path.getsize(output_path), time.process_time() - started
+
+
+def run_stage(executor, stage, jobs):
+	"""Submit {key: (fn, *args)} and return {key: result}, reporting progress as jobs finish."""
+	progress = Progress(stage, len(jobs))
+	futures = {executor.submit(fn, *args): key for key, (fn, *args) in jobs.items()}
+	results = {}
+	for future in concurrent.futures.as_completed(futures):
+		results[futures[future]] = future.result()
+		progress.advance()
+	return results, progress
+
+
+def build_catalog(ranges, backend, output_dir=".", reuse_cache=False, threads=8, processes=None, cache=None, onset_ms=DEFAULT_ONSET_MS, tail_ms=DEFAULT_TAIL_MS, opus=False):
+	"""Build every (start, end, language) in `ranges` and return a report dict."""
+	cache = cache or TTSCache()
+	os.makedirs(output_dir, exist_ok=True)
+	started = time.perf_counter()
+	report = {"backend": backend.name, "outputs": [], "stages": {}}
+
+	# Step 1: synthesize every unique (language, number) exactly once
+	synth_jobs = {}
+	for start, end, language in ranges:
+		for number in numbers_in(start, end):
+			synth_jobs[(language, number)] = (synthesize_worker, cache, backend, str(number), language, reuse_cache)
+	with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as io_pool:
+		round1_files, progress = run_stage(io_pool, "synthesize", synth_jobs)
+	report["stages"]["synthesize"] = progress.summary()
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as cpu_pool:
+		# Step 2: adjust each unique (language, number) once; its placement info is kept in the cache index
+		round2_files = {}
+		placements = {}
+		adjust_jobs = {}
+		round2_fields = {
+			key: adjusted_fields(synthesis_fields(backend, key[0], str(key[1])), onset_ms, tail_ms)
+			for key in round1_files
+		}
+		for key, fields in round2_fields.items():
+			cached = cache.get(fields) if reuse_cache else None
+			info = cache.meta(fields) if cached else {}
+			if cached and "onset_ms" in info:
+				round2_files[key] = cached
+				placements[key] = info
+			else:
+				# Workers are separate processes, so they write to a fresh path and the parent adds it
+				adjust_jobs[key] = (adjust_worker, round1_files[key], onset_ms, tail_ms, cache.new_path("wav"))
+		adjusted, progress = run_stage(cpu_pool, "adjust", adjust_jobs)
+		for key, (path, info) in adjusted.items():
+			round2_files[key] = cache.add(round2_fields[key], path, **info)
+			placements[key] = info
+		report["stages"]["adjust"] = progress.summary()
+
+		# Step 3: assemble every output file
+		assemble_jobs = {}
+		for start, end, language in ranges:
+			numbers = list(numbers_in(start, end))
+			segment_paths = [round2_files[(language, number)] for number in numbers]
+			output_file = os.path.join(output_dir, f"countdown-{language}-{start}-{end}.mp3")
+			assemble_jobs[(start, end, language)] = (
+				assemble_worker, segment_paths, output_file, numbers,
+				[placements[(language, number)] for number in numbers], onset_ms, opus,
+			)
+		lengths, progress = run_stage(cpu_pool, "assemble", assemble_jobs)
+		report["stages"]["assemble"] = progress.summary()
+
+	for start, end, language in ranges:
+		expected_length = (start - end + 1) * 1000
+		report["outputs"].append({
+			"file": os.path.join(output_dir, f"countdown-{language}-{start}-{end}.mp3"),
+			"length_ms": lengths[(start, end, language)],
+			"expected_ms": expected_length,
+		})
+
+	total = time.perf_counter() - started
+	seconds_of_audio = sum(output["length_ms"] for output in report["outputs"]) / 1000
+	report["seconds"] = round(total, 3)
+	report["unique_numbers"] = len(synth_jobs)
+	report["numbers_requested"] = sum(len(numbers_in(start, end)) for start, end, language in ranges)
+	report["audio_seconds_per_second"] = round(seconds_of_audio / total, 2) if total > 0 else None
+
+	report["cache"] = cache.stats()
+	cache.save()
+	return report
+
+
+def convert_clips(directory="sound-clips", processes=None, force=False):
+	"""Write a .opus next to every .mp3 under `directory` that has none (or an older one); returns a report dict."""
+	convert_jobs = {}
+	skipped = 0
+	for root, _, filenames in os.walk(directory):
+		for filename in sorted(filenames):
+			stem, extension = os.path.splitext(filename)
+			if extension != ".mp3":
+				continue
+			path = os.path.join(root, filename)
+			opus_path = os.path.join(root, f"{stem}.opus")
+			if not force and os.path.exists(opus_path) and os.path.getmtime(opus_path) >= os.path.getmtime(path):
+				skipped += 1
+				continue
+			convert_jobs[path] = (convert_worker, path)
+
+	started = time.perf_counter()
+	with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as cpu_pool:
+		converted, progress = run_stage(cpu_pool, "convert", convert_jobs)
+	return {
+		"seconds": round(time.perf_counter() - started, 3),
+		"converted": [
+			{"file": output_path, "mp3_bytes": mp3_bytes, "opus_bytes": opus_bytes, "cpu_seconds": round(cpu_seconds, 3)}
+			for output_path, mp3_bytes, opus_bytes, cpu_seconds in converted.values()
+		],
+		"skipped": skipped,
+		"stage": progress.summary(),
+	}
+
+
+def print_conversion_report(report):
+	print(f"\nConverted {len(report['converted'])} clip(s) to Ogg/Opus in {report['seconds']}s, {report['skipped']} already up to date")
+	for output in sorted(report["converted"], key=lambda output: output["file"]):
+		print(f"  {output['file']}: {output['mp3_bytes'] // 1024} KiB mp3 -> {output['opus_bytes'] // 1024} KiB opus")
+
+
+def print_report(report):
+	print(f"\nBuilt {len(report['outputs'])} file(s) with the '{report['backend']}' backend in {report['seconds']}s")
+	print(f"Needed {report['unique_numbers']} unique numbers for {report['numbers_requested']} requested")
+	for stage, summary in report["stages"].items():
+		print(f"  {stage:<10} {summary['jobs']:>5} jobs  {summary['seconds']:>8}s  {summary['jobs_per_second']} jobs/s")
+	print(f"Throughput: {report['audio_seconds_per_second']} seconds of countdown audio per second")
+	cache = report["cache"]
+	print(f"Cache: {cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evicted, {cache['entries']} entries ({cache['bytes'] // 1024} KiB)")
+	for output in report["outputs"]:
+		flag = "" if abs(output["length_ms"] - output["expected_ms"]) <= 1 else f"  (expected {output['expected_ms']}ms)"
+		print(f"  {output['file']}: {output['length_ms']}ms{flag}")
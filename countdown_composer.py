@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Compose countdowns of any length at play time from cached one-second number segments.
+
+Segments come from the pre-padded round-2 files that generate-countdown.py
+writes to sound-clips/segments/<language>/<number>.mp3 (and .opus) with --export-segments.
+Numbers with no segment file are cut out of the longest pre-rendered
+countdown-<language>-<start>-0 clip instead, which holds one number per second.
+Every segment is normalized to exactly one second of Opus frames, so a
+countdown N -> M is just the list of segments N..M handed to a
+FrameSequenceSource, with no intermediate file.
+"""
+import asyncio
+import logging
+import os
+import re
+
+from discord.opus import OPUS_SILENCE
+
+from clip_cache import FRAME_LENGTH_MS, FrameSequenceSource
+from sound_catalog import CLIP_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_DIR = "segments"
+FRAMES_PER_SECOND = 1000 // FRAME_LENGTH_MS
+# The longest countdown the slash command and the web API accept, in seconds
+MAX_COUNTDOWN = 3600
+COUNTDOWN_PATTERN = re.compile(r"^countdown-(?P<language>[\w-]+?)-(?P<start>\d+)-(?P<end>\d+)$")
+# Languages come from requests and name a folder, so they are plain names only
+LANGUAGE_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def check_language(language):
+	"""Raise ValueError unless `language` is a plain name that cannot leave the segments folder."""
+	if not isinstance(language, str) or not LANGUAGE_PATTERN.match(language):
+		raise ValueError(f"Invalid countdown language '{language}'")
+	return language
+
+
+def fit_to_second(frames):
+	"""Trim or pad a segment to exactly one second of frames."""
+	frames = tuple(frames[:FRAMES_PER_SECOND])
+	if len(frames) < FRAMES_PER_SECOND:
+		frames += (OPUS_SILENCE,) * (FRAMES_PER_SECOND - len(frames))
+	return frames
+
+
+class SegmentTable:
+	"""Per-language table of {number: one second of Opus frames}, built from the clip cache."""
+
+	def __init__(self, clip_cache):
+		self.clip_cache = clip_cache
+		self._tables = {}
+
+	def segment_names(self, language):
+		"""Map number -> clip cache name for every exported segment of `language`."""
+		directory = os.path.join(self.clip_cache.directory, SEGMENT_DIR, language)
+		if not os.path.isdir(directory):
+			return {}
+		names = {}
+		for filename in os.listdir(directory):
+			stem, extension = os.path.splitext(filename)
+			if extension in CLIP_EXTENSIONS and stem.isdigit():
+				names[int(stem)] = f"{SEGMENT_DIR}/{language}/{stem}"
+		return names
+
+	def longest_countdown(self, language):
+		"""Return (name, start) of the longest countdown-<language>-<start>-0 clip, or (None, -1)."""
+		best = (None, -1)
+		for filename in os.listdir(self.clip_cache.directory):
+			stem, extension = os.path.splitext(filename)
+			match = COUNTDOWN_PATTERN.match(stem) if extension in CLIP_EXTENSIONS else None
+			if match and match["language"] == language and int(match["end"]) == 0:
+				start = int(match["start"])
+				if start > best[1]:
+					best = (stem, start)
+		return best
+
+	async def load(self, language):
+		"""Build (or return the already built) segment table for `language`.
+
+		Raises ValueError for an invalid language, or one with neither segments nor a countdown clip.
+		"""
+		table = self._tables.get(language)
+		if table is not None:
+			return table
+		check_language(language)
+
+		# Directory listings go to the executor, like the clip loads themselves
+		loop = asyncio.get_running_loop()
+		segment_names = await loop.run_in_executor(None, self.segment_names, language)
+		name, start = await loop.run_in_executor(None, self.longest_countdown, language)
+		# Not stored, so the tables only ever hold languages that have clips
+		if not segment_names and name is None:
+			raise ValueError(f"No countdown clips for language '{language}'")
+
+		table = {}
+		for number, segment_name in segment_names.items():
+			clip = await self.clip_cache.get(segment_name)
+			table[number] = fit_to_second(clip.frames)
+
+		missing = [number for number in range(start + 1) if number not in table]
+		if name and missing:
+			clip = await self.clip_cache.get(name)
+			for number in missing:
+				offset = (start - number) * FRAMES_PER_SECOND
+				table[number] = fit_to_second(clip.frames[offset:offset + FRAMES_PER_SECOND])
+			logger.info(f"Cut {len(missing)} '{language}' countdown segments out of {name}")
+
+		self._tables[language] = table
+		return table
+
+	def invalidate(self, language=None):
+		if language is None:
+			self._tables.clear()
+		else:
+			self._tables.pop(language, None)
+
+	async def compose(self, start, end=0, language="en"):
+		"""Return a source that counts from `start` down (or up) to `end`, one number per second."""
+		table = await self.load(language)
+		# Checked before building the list, so a huge number costs nothing
+		lowest, highest = (min(table), max(table)) if table else (0, -1)
+		outside = [number for number in (start, end) if not lowest <= number <= highest]
+		if outside:
+			raise ValueError(f"No '{language}' countdown segment for number(s): {', '.join(map(str, outside))}")
+		step = -1 if start >= end else 1
+		numbers = range(start, end + step, step)
+		unavailable = [number for number in numbers if number not in table]
+		if unavailable:
+			raise ValueError(f"No '{language}' countdown segment for number(s): {', '.join(map(str, unavailable[:10]))}")
+		return FrameSequenceSource([table[number] for number in numbers])
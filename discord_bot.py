@@ -2,32 +2,95 @@
 import logging
 import os
 import discord
+from discord import app_commands
 from discord.ext import commands
 from discord.ui import Button, View
-import json
-import datetime
-import re
-
-# Load configuration from config.json
-with open("config.json", "r") as config_file:
-	config = json.load(config_file)
-
-# Configure logging
-logging.basicConfig(
-	level=logging.DEBUG,
-	format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-	handlers=[logging.StreamHandler()]
-)
+import asyncio
+import time
+import atexit
+from app_config import load_config
+from clip_cache import ClipCache, OpusFrameSource
+from log_store import LogRing, DEFAULT_CAPACITY
+from log_stream import LogStream, DEFAULT_QUEUE_SIZE
+from log_archive import LogArchive, DEFAULT_ARCHIVE_DIR, DEFAULT_SEGMENT_BYTES, DEFAULT_MAX_BYTES, DEFAULT_FLUSH_SECONDS
+from log_pipeline import LogPipeline, LogRingSink, LEVELS, LOG_FORMAT, DEFAULT_QUEUE_SIZE as DEFAULT_LOG_QUEUE_SIZE
+from latency import LatencyTracker
+from scheduler import StartScheduler, DEFAULT_ARM_SECONDS
+from countdown_composer import SegmentTable, MAX_COUNTDOWN, check_language
+from sound_catalog import SoundCatalog, DEFAULT_POLL_SECONDS
+from permissions import RoleIndex
+from control_messages import ControlMessageStore, ControlReconciler, chunk_sounds, DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_SECOND, STORE_PATH as CONTROL_STORE_PATH
+from loop_monitor import LoopMonitor, BlockingExecutor, DEFAULT_SLOW_CALLBACK_MS
+from guild_snapshot import GuildSnapshot
+from sequencer import Sequencer, sequence_sounds, describe as describe_sequence
+from playback_actor import PlaybackActors, DEFAULT_WINDOW_MS, LAST_WRITER_WINS
+from control_plane import shard_for, worker_for_shard, worker_shards
+from voice_pool import VoicePool, VoiceChannelStore, STORE_PATH as VOICE_STORE_PATH, DEFAULT_BACKOFF_MIN_SECONDS, DEFAULT_BACKOFF_MAX_SECONDS, DEFAULT_CHECK_SECONDS, DEFAULT_CONCURRENCY as DEFAULT_VOICE_CONCURRENCY
+
+started_at = time.perf_counter()
+
+# Load configuration from config.json (parsed once per process)
+config = load_config()
+
 logger = logging.getLogger(__name__)
-global_logs = {}
-log_counter = 0  # Counter to generate unique IDs for logs
 
 # Configuration values
 bot_token = config.get("token")
 allowed_roles = config.get("roles-allowed-to-control-bot", [])
 purge_channel_ids = config.get("purge-and-repost-on-channel-ids", [])
 log_messages_to_keep = config.get("log-messages-to-keep",0)
+# Log ids are assigned by the ring buffer; 0 keeps the default capacity rather than growing forever
+global_logs = LogRing(log_messages_to_keep if log_messages_to_keep > 0 else DEFAULT_CAPACITY)
+log_stream = LogStream(config.get("log-stream-queue-size", DEFAULT_QUEUE_SIZE))
 debug = config.get("debug", True)
+clip_cache_memory_mb = config.get("clip-cache-memory-mb", 64)
+clip_cache_preload = config.get("clip-cache-preload", True)
+countdown_language = config.get("countdown-language", "en")
+sound_catalog_poll_seconds = config.get("sound-catalog-poll-seconds", DEFAULT_POLL_SECONDS)
+# With "shard-count", main.py starts "shard-processes" workers and tells each one its index
+shard_count = config.get("shard-count", 0)
+shard_processes = config.get("shard-processes", 1) if shard_count else 1
+shard_worker = int(os.getenv("SHARD_WORKER", "0"))
+
+# Helper function giving every worker but the first its own copy of a file or directory in tmp-data
+def worker_path(path):
+	if shard_worker == 0:
+		return path
+	root, extension = os.path.splitext(path)
+	return f"{root}-worker-{shard_worker}{extension}"
+
+# Configure logging: records are queued on the calling thread and formatted and written by a listener thread
+console_sink = logging.StreamHandler()
+console_sink.setFormatter(logging.Formatter(LOG_FORMAT))
+# The in-memory log only keeps our own entries and discord.py's, as before
+def keep_in_log(record):
+	return hasattr(record, "category") or record.name.split(".")[0] == "discord"
+ring_sink = LogRingSink(global_logs, log_stream, accept=keep_in_log)
+log_sinks = [console_sink, ring_sink]
+# The same entries are archived to disk in batches by the archive's own thread
+log_archive = None
+if config.get("log-archive", True):
+	log_archive = LogArchive(
+		worker_path(config.get("log-archive-dir", DEFAULT_ARCHIVE_DIR)),
+		segment_bytes=config.get("log-archive-segment-mb", DEFAULT_SEGMENT_BYTES // (1024 * 1024)) * 1024 * 1024,
+		segment_seconds=config.get("log-archive-segment-hours", 24) * 3600,
+		max_bytes=config.get("log-archive-max-mb", DEFAULT_MAX_BYTES // (1024 * 1024)) * 1024 * 1024,
+		flush_seconds=config.get("log-archive-flush-seconds", DEFAULT_FLUSH_SECONDS),
+	)
+	log_archive.start()
+	# atexit runs in reverse order, so the pipeline drains into the archive before it is closed
+	atexit.register(log_archive.close)
+	log_sinks.append(LogRingSink(log_archive, accept=keep_in_log))
+log_pipeline = LogPipeline(
+	log_sinks,
+	levels=config.get("log-levels", {}),
+	sample_per_second=config.get("log-sample-per-second", {}),
+	queue_size=config.get("log-queue-size", DEFAULT_LOG_QUEUE_SIZE),
+	default_level=logging.DEBUG if debug else logging.INFO,
+)
+log_pipeline.attach()
+log_pipeline.start()
+atexit.register(log_pipeline.stop)
 
 # Enable the required intents
 intents = discord.Intents.default()
@@ -36,69 +99,104 @@ intents.guilds = True
 intents.members = True  # so we can get new roles added/removed
 intents.voice_states = True
 
-def extract_number(filename):
-	"""Extract numerical values from a filename for proper sorting."""
-	match = re.search(r'\d+', filename)
-	return int(match.group()) if match else float('inf')
-
-# Helper function to sort files numerically when they contain numbers
+# Helper function to sort files numerically when they contain numbers; the keys are precomputed by the catalog
 def sort_sound_files(files):
-	return sorted(files, key=extract_number)
+	return sorted(files, key=sound_catalog.sort_key)
 
-# Helper function to log messages
-def log_message(message, severity="info", category="catchall"):
-	global log_counter
-	log_id = log_counter
-	log_counter += 1
-	timestamp = datetime.datetime.now().isoformat()
-	log_entry = {
-		"id": log_id,
-		"timestamp": timestamp,
-		"severity": severity,
-		"category": category,
-		"message": message
-	}
-	global_logs[log_id] = log_entry
-	
-	# Check if we need to prune logs based on the config
-	if log_messages_to_keep > 0 and len(global_logs) > log_messages_to_keep:
-		# Remove the oldest log entry
-		oldest_log_id = min(global_logs.keys())
-		del global_logs[oldest_log_id]
-
-
-	if severity.lower() == "debug":
-		logger.debug(message)
-	elif severity.lower() == "info":
-		logger.info(message)
-	elif severity.lower() == "warning":
-		logger.warning(message)
-	elif severity.lower() == "error":
-		logger.error(message)
-	elif severity.lower() == "critical":
-		logger.critical(message)
-	else:
-		logger.info(message)
-	return log_id
+# Helper function listing every button the control messages show: the sounds, then the configured sequences
+def control_items():
+	return sound_catalog.names() + [f"{SEQUENCE_ITEM_PREFIX}{name}" for name in sequencer.sequences]
 
-# Custom log handler to link with global logs
-class CustomLogHandler(logging.Handler):
-	def emit(self, record):
-		message = self.format(record)
-		severity = record.levelname.lower()
-		log_message(message, severity=severity, category=record.name)
+# Helper function to log messages; filtering happens here, formatting and storage on the pipeline's thread.
+# An entry only gets its id once the pipeline stores it, so unlike before this returns nothing.
+def log_message(message, severity="info", category="catchall"):
+	level = LEVELS.get(severity.lower(), logging.INFO)
+	if log_pipeline.is_enabled(category, level) and logger.isEnabledFor(level):
+		# Built directly instead of with logger.log, which would look up the calling frame for fields LOG_FORMAT never shows
+		logger.handle(logger.makeRecord(logger.name, level, "log_message", 0, message, None, None, extra={"category": category}))
 
+# discord.py's loggers propagate to the root logger, so their records go through the same pipeline
 discord_logger = logging.getLogger('discord')
-discord_logger.addHandler(CustomLogHandler())
 discord_logger.setLevel(logging.DEBUG)
 
+# Scanned once at startup; afterwards only changed files are re-read
+sound_catalog = SoundCatalog('sound-clips')
+sound_catalog.scan()
+# Shared by the bot and the web server so each clip is only ever encoded once
+clip_cache = ClipCache('sound-clips', memory_budget=clip_cache_memory_mb * 1024 * 1024)
+latency_tracker = LatencyTracker()
+segment_table = SegmentTable(clip_cache)
+# Posted control message ids survive restarts, so unchanged messages are never touched again
+control_store = ControlMessageStore(worker_path(CONTROL_STORE_PATH))
+# Allowed role ids per guild, resolved from the configured role names and kept current by role events
+role_index = RoleIndex(allowed_roles, config.get("guild-permissions", {}), config.get("sound-permissions", {}))
+control_reconciler = ControlReconciler(
+	control_store,
+	concurrency=config.get("control-reconcile-concurrency", DEFAULT_CONCURRENCY),
+	requests_per_second=config.get("control-requests-per-second", DEFAULT_REQUESTS_PER_SECOND),
+)
+# Named playlists from config, played as one gapless source; each also gets a control button
+sequencer = Sequencer(clip_cache, sound_catalog, config.get("sequences", {}))
+# Control messages list the sequence buttons after every sound, marked with this prefix
+SEQUENCE_ITEM_PREFIX = "sequence:"
+# Every play and stop goes through its guild's playback actor, which runs them one at a time and coalesces bursts of clicks
+playback_actors = PlaybackActors(
+	lambda guild_id: voice_client_for(guild_id),
+	window=config.get("playback-coalesce-ms", DEFAULT_WINDOW_MS) / 1000,
+	policy=config.get("playback-policy", LAST_WRITER_WINS),
+)
+# Scheduled starts are armed through the playback actors, so a stop in a guild cancels them there
+start_scheduler = StartScheduler(clip_cache, playback_actors, arm_seconds=config.get("schedule-arm-seconds", DEFAULT_ARM_SECONDS))
+# The voice channel each guild wants the bot in is remembered, joined at startup and rejoined after a drop
+voice_pool = VoicePool(
+	lambda guild_id, channel_id: voice_channel_for(guild_id, channel_id),
+	lambda guild_id: voice_client_for(guild_id),
+	# One file for all workers, keyed by guild; each worker loads the guilds its shards own
+	VoiceChannelStore(VOICE_STORE_PATH, owns=lambda guild_id: not shard_count or worker_for_shard(shard_for(guild_id, shard_count), shard_processes) == shard_worker),
+	backoff_min=config.get("voice-reconnect-min-seconds", DEFAULT_BACKOFF_MIN_SECONDS),
+	backoff_max=config.get("voice-reconnect-max-seconds", DEFAULT_BACKOFF_MAX_SECONDS),
+	concurrency=config.get("voice-connect-concurrency", DEFAULT_VOICE_CONCURRENCY),
+	on_event=lambda message, severity="info": log_message(message, severity=severity, category="voice_pool"),
+	rejoin_after_kick=config.get("voice-rejoin-after-kick", False),
+)
+voice_check_seconds = config.get("voice-check-seconds", DEFAULT_CHECK_SECONDS)
+# What users are told when their play request did not start playback
+PLAYBACK_STATUS_MESSAGES = {
+	"coalesced": "A newer request replaced this one.",
+	"rejected": "Something is already playing. Press Stop first.",
+}
+
+# Helper function to tell users why a request did not start playback, whatever the status
+def playback_status_message(status):
+	return PLAYBACK_STATUS_MESSAGES.get(status, "The sound could not be played.")
+# Guilds, voice channels and sounds as the web interface shows them, kept current by events and serialized once per change
+guild_snapshot = GuildSnapshot()
+guild_snapshot.set_sounds(sound_catalog.names())
+# Clip decoding, catalog scans, archive queries and large JSON bodies run here instead of on the event loop
+blocking_executor = BlockingExecutor(config.get("blocking-executor-workers", 4), thread_name_prefix="blocking")
+# Watches how late the shared event loop runs and which callbacks held it up
+loop_monitor = None
+if config.get("loop-monitor", True):
+	loop_monitor = LoopMonitor(
+		interval=config.get("loop-monitor-interval-ms", 50) / 1000,
+		slow_callback_ms=config.get("loop-slow-callback-ms", DEFAULT_SLOW_CALLBACK_MS),
+		slow_callbacks=config.get("loop-monitor-slow-callbacks", False),
+	)
+
 # Define the bot class
-class MyBot(commands.Bot):
+# Sharded, each worker process connects only its own shards (see control_plane.py)
+BotBase = commands.AutoShardedBot if shard_count else commands.Bot
+
+class MyBot(BotBase):
 	def __init__(self):
-		super().__init__(command_prefix="!", intents=intents)
+		shard_options = {"shard_count": shard_count, "shard_ids": worker_shards(shard_worker, shard_count, shard_processes)} if shard_count else {}
+		super().__init__(command_prefix="!", intents=intents, **shard_options)
 	
 	async def setup_hook(self):
 		log_message("setup_hook called", category="setup_hook")
+		# Slash commands are global, so one worker registering them is enough
+		if shard_worker != 0:
+			return
 		try:
 			await self.sync_commands()
 		except Exception as e:
@@ -125,27 +223,138 @@ async def post_controls(interaction: discord.Interaction):
 	await interaction.response.send_message("Control buttons posted successfully.", ephemeral=True)
 	log_message("Control buttons posted successfully.", category="post_controls")
 
+# Slash command to play a countdown of any length
+@bot.tree.command(name="countdown", description="Play a countdown of any length in the bot's voice channel")
+@app_commands.describe(start="Number to count down from", end="Number to count down to (default 0)", language="Countdown language (default from config)")
+async def countdown_command(interaction: discord.Interaction, start: app_commands.Range[int, 0, MAX_COUNTDOWN], end: app_commands.Range[int, 0, MAX_COUNTDOWN] = 0, language: str = None):
+	"""Slash command to compose and play a countdown from start to end."""
+	trace = latency_tracker.start(interaction.guild_id, f"countdown-{start}-{end}", "discord")
+	log_message(f"Received /countdown {start} {end} from user {interaction.user.display_name}", category="countdown_command")
+	if not user_has_permission(interaction.user):
+		await interaction.response.send_message("You don't have permission to play a countdown.", ephemeral=True)
+		return
+	trace.mark("permission_check")
+	if not interaction.guild.voice_client:
+		await interaction.response.send_message("I'm not connected to a voice channel.", ephemeral=True)
+		return
+
+	try:
+		if language is not None:
+			check_language(language)
+		status = await play_countdown(start, end, interaction.guild, language, trace=trace)
+	except ValueError as e:
+		await interaction.response.send_message(str(e), ephemeral=True)
+		log_message(f"Countdown {start}-{end} failed: {str(e)}", severity="warning", category="countdown_command")
+		return
+	if status != "played":
+		await interaction.response.send_message(playback_status_message(status), ephemeral=True)
+		return
+	await interaction.response.send_message(f"Counting down from {start} to {end}.", ephemeral=True)
+
+# Slash command to play several clips back to back without gaps
+@bot.tree.command(name="sequence", description="Play clips back to back without gaps, e.g. refill-in, 500ms, countdown-en-30-0")
+@app_commands.describe(items="A configured sequence name, or clips and silences (like 500ms or 1.5s) separated by commas")
+async def sequence_command(interaction: discord.Interaction, items: str):
+	"""Slash command to play a configured sequence or an ad-hoc list of clips and silences."""
+	trace = latency_tracker.start(interaction.guild_id, "sequence", "discord")
+	log_message(f"Received /sequence {items} from user {interaction.user.display_name}", category="sequence_command")
+	name = items.strip() if items.strip() in sequencer.sequences else None
+	try:
+		parsed = sequencer.resolve(items, name=name)
+	except ValueError as e:
+		await interaction.response.send_message(str(e), ephemeral=True)
+		return
+	if not all(user_has_permission(interaction.user, sound) for sound in sequence_sounds(parsed)):
+		await interaction.response.send_message("You don't have permission to play this sequence.", ephemeral=True)
+		return
+	trace.mark("permission_check")
+
+	try:
+		status, seconds = await play_sequence(items, interaction.guild, name=name, trace=trace)
+	except ValueError as e:
+		await interaction.response.send_message(str(e), ephemeral=True)
+		log_message(f"Sequence {items} failed: {str(e)}", severity="warning", category="sequence_command")
+		return
+	if status != "played":
+		await interaction.response.send_message(playback_status_message(status), ephemeral=True)
+		return
+	await interaction.response.send_message(f"Playing {describe_sequence(parsed)} ({seconds:.1f}s).", ephemeral=True)
+
 # Helper function to check user permissions
-def user_has_permission(member: discord.Member):
-	log_message(f"Checking permissions for user {member.display_name}", category="user_has_permission")
-	if not allowed_roles:
-		log_message("No specific roles defined, allowing all users.", category="user_has_permission")
+def user_has_permission(member: discord.Member, sound: str = None):
+	# A set intersection against the role index; only denials are logged
+	if role_index.check(member, sound):
 		return True
-	for role in member.roles:
-		if role.name in allowed_roles:
-			log_message(f"User {member.display_name} allowed: found role {role.name}", category="user_has_permission")
-			return True
-	log_message(f"User {member.display_name} not allowed: no matching roles", category="user_has_permission")
+	target = f" to play {sound}" if sound else ""
+	log_message(f"User {member.display_name} not allowed{target}: no matching roles", category="user_has_permission")
 	return False
-posted_messages = {}
+
+# Keep the role index current as roles change
+@bot.event
+async def on_guild_role_create(role):
+	role_index.rebuild_guild(role.guild)
+
+@bot.event
+async def on_guild_role_delete(role):
+	role_index.rebuild_guild(role.guild)
+
+@bot.event
+async def on_guild_role_update(before, after):
+	if before.name != after.name:
+		role_index.rebuild_guild(after.guild)
+
+@bot.event
+async def on_guild_remove(guild):
+	role_index.remove_guild(guild.id)
+	playback_actors.remove(guild.id)
+	voice_pool.forget(guild.id)
+	if guild_snapshot.remove_guild(guild.id):
+		log_stream.publish_event("guilds", {"guild_id": str(guild.id)})
+
+# Keep the web interface's guild snapshot current; only voice channel and name changes produce an update
+def refresh_guild_snapshot(guild):
+	if guild_snapshot.update_guild(guild):
+		log_stream.publish_event("guilds", {"guild_id": str(guild.id)})
+
+@bot.event
+async def on_guild_update(before, after):
+	refresh_guild_snapshot(after)
+
+@bot.event
+async def on_guild_channel_create(channel):
+	refresh_guild_snapshot(channel.guild)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+	refresh_guild_snapshot(channel.guild)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+	refresh_guild_snapshot(after.guild)
+
+# Follow the bot's own voice state: a drop starts a reconnect, a move by someone else becomes the wanted channel
+@bot.event
+async def on_voice_state_update(member, before, after):
+	if bot.user is None or member.id != bot.user.id:
+		return
+	if after.channel is None:
+		if before.channel is not None:
+			outcome = voice_pool.disconnected(member.guild.id)
+			if outcome == "left":
+				log_message(f"Disconnected from voice in guild {member.guild.name} (ID: {member.guild.id}) by someone else, not rejoining", severity="warning", category="voice_pool")
+			elif outcome == "dropped":
+				log_message(f"Disconnected from voice in guild {member.guild.name} (ID: {member.guild.id}) by someone else, rejoining", severity="warning", category="voice_pool")
+	elif before.channel is None or before.channel.id != after.channel.id:
+		voice_pool.moved(member.guild.id, after.channel.id)
 
 # Persistent view for control buttons
 class ControlView(View):
 	def __init__(self, sound_files):
 		super().__init__(timeout=None)
 
-		# Sort sound files numerically
-		sorted_sounds = sort_sound_files(sound_files)
+		# Sort sound files numerically; sequence buttons keep their configured order after them
+		sequences = [item[len(SEQUENCE_ITEM_PREFIX):] for item in sound_files if item.startswith(SEQUENCE_ITEM_PREFIX)]
+		sorted_sounds = sort_sound_files([item for item in sound_files if not item.startswith(SEQUENCE_ITEM_PREFIX)])
 
 		# Add control buttons (Join, Leave, Stop)
 		join_button = Button(label="Join", style=discord.ButtonStyle.success, custom_id="join_button")
@@ -165,6 +374,10 @@ class ControlView(View):
 			button = Button(label=sound, style=discord.ButtonStyle.primary, custom_id=f"sound_{sound}")
 			button.callback = lambda interaction, s=sound: self.play_sound_callback(interaction, s)
 			self.add_item(button)
+		for name in sequences[:22 - len(sorted_sounds[:22])]:
+			button = Button(label=name, style=discord.ButtonStyle.success, custom_id=f"sequence_{name}")
+			button.callback = lambda interaction, n=name: self.play_sequence_callback(interaction, n)
+			self.add_item(button)
 
 
 	async def join_callback(self, interaction: discord.Interaction):
@@ -172,7 +385,7 @@ class ControlView(View):
 		if interaction.user.voice:
 			vc_channel = interaction.user.voice.channel
 			log_message(f"Attempting to join the voice channel {vc_channel}", category="join_callback")
-			await vc_channel.connect()
+			await voice_pool.join(vc_channel)
 			log_message("Successfully connected to the voice channel.", category="join_callback")
 			await interaction.response.defer()
 		else:
@@ -184,7 +397,8 @@ class ControlView(View):
 		voice_client = discord.utils.get(bot.voice_clients, guild=interaction.guild)
 		if voice_client:
 			log_message(f"Leaving the voice channel {voice_client.channel}", category="leave_callback")
-			await voice_client.disconnect()
+			# Also stops the bot from rejoining it after a restart
+			await voice_pool.leave(interaction.guild.id)
 			await interaction.response.defer()
 		else:
 			await interaction.response.send_message("I'm not connected to a voice channel.", ephemeral=True)
@@ -196,13 +410,38 @@ class ControlView(View):
 		await interaction.response.send_message("Stopped the current sound.", ephemeral=True)
 
 	async def play_sound_callback(self, interaction: discord.Interaction, sound: str):
+		trace = latency_tracker.start(interaction.guild_id, sound, "discord")
 		log_message(f"play_sound_callback called for sound: {sound}", category="play_sound_callback")
-		if not user_has_permission(interaction.user):
+		if not user_has_permission(interaction.user, sound):
 			await interaction.response.send_message("You don't have permission to play this sound.", ephemeral=True)
 			log_message(f"User {interaction.user.display_name} does not have permission to play {sound}.", category="play_sound_callback")
 			return
+		trace.mark("permission_check")
+
+		status = await play_sound(sound, interaction.guild, trace=trace)
+		if status == "rejected":
+			await interaction.response.send_message(playback_status_message(status), ephemeral=True)
+			return
+		await interaction.response.defer()
 
-		await play_sound(sound, interaction.guild)
+	async def play_sequence_callback(self, interaction: discord.Interaction, name: str):
+		trace = latency_tracker.start(interaction.guild_id, f"sequence-{name}", "discord")
+		log_message(f"play_sequence_callback called for sequence: {name}", category="play_sequence_callback")
+		sounds = sequence_sounds(sequencer.sequences.get(name, []))
+		if not all(user_has_permission(interaction.user, sound) for sound in sounds):
+			await interaction.response.send_message("You don't have permission to play this sequence.", ephemeral=True)
+			return
+		trace.mark("permission_check")
+
+		try:
+			status, _ = await play_sequence(guild=interaction.guild, name=name, trace=trace)
+		except ValueError as e:
+			await interaction.response.send_message(str(e), ephemeral=True)
+			log_message(f"Sequence {name} failed: {str(e)}", severity="warning", category="play_sequence_callback")
+			return
+		if status == "rejected":
+			await interaction.response.send_message(playback_status_message(status), ephemeral=True)
+			return
 		await interaction.response.defer()
 
 # Register the view with the bot
@@ -210,90 +449,211 @@ class ControlView(View):
 async def on_ready():
 	log_message(f"{bot.user} has connected to Discord.", category="on_ready")
 
-	# Get all sound file names (without .mp3)
-	sound_files = sorted([f[:-4] for f in os.listdir('sound-clips') if f.endswith('.mp3')])
-
-	# Register the ControlView with sound files
-	bot.add_view(ControlView(sound_files))
-
-	await cleanup_orphaned_voice_connections()
-	await sync_voice_connections()
-	await purge_and_repost_controls()
-
-
-
-# Helper function to post control buttons in a channel
-async def post_controls_helper(channel, existing_message=None):
-	log_message(f"Posting controls to {channel}", "info", "post_controls")
-
-	# Get all sound file names (without .mp3)
-	sound_files = sorted([f[:-4] for f in os.listdir('sound-clips') if f.endswith('.mp3')])
-
-	# Ensure we don't exceed Discord's button limit (max 25 per message)
-	buttons_per_message = 22  # 22 sound buttons + 3 control buttons = 25 total
-	chunks = [sound_files[i:i + buttons_per_message] for i in range(0, len(sound_files), buttons_per_message)]
-
-	existing_messages = posted_messages.get(channel.id, [])
+	# Resolve the allowed role names to ids in every guild once
+	for guild in bot.guilds:
+		role_index.rebuild_guild(guild)
+	guild_snapshot.rebuild(bot.guilds)
+	log_stream.publish_event("guilds", {})
 
-	for idx, chunk in enumerate(chunks):
-		view = ControlView(chunk)  # Pass only a subset of sound buttons
+	# Get all sound names from the catalog, already in numeric order
+	sound_files = sound_catalog.names()
 
-		if existing_message and idx == 0:
-			# If we have an existing message, update it instead of creating a new one
-			message = await channel.fetch_message(existing_message.id)
-			await message.edit(content="Click a button to play a sound:", view=view)
-		elif idx < len(existing_messages):
-			# Update existing messages if they exist
-			message = await channel.fetch_message(existing_messages[idx])
-			await message.edit(content="Click a button to play a sound:", view=view)
-		else:
-			# Send a new message if there aren't enough existing ones
-			message = await channel.send("Controls for wos countdown:", view=view)
-			existing_messages.append(message.id)
+	# Register one ControlView per control message so every sound and sequence button is handled after a restart
+	register_control_views(control_items())
 
-	# Delete extra old messages if we now have fewer groups
-	for extra_msg_id in existing_messages[len(chunks):]:
-		msg_to_delete = await channel.fetch_message(extra_msg_id)
-		await msg_to_delete.delete()
+	if clip_cache_preload:
+		bot.preload_task = asyncio.create_task(clip_cache.preload(sound_files))
+		bot.segment_preload_task = asyncio.create_task(preload_segments())
 
-	posted_messages[channel.id] = existing_messages[:len(chunks)]
+	# Pick up clips added, replaced or removed while running
+	if sound_catalog_poll_seconds > 0 and getattr(bot, "catalog_task", None) is None:
+		bot.catalog_task = asyncio.create_task(sound_catalog.watch(sound_catalog_poll_seconds))
 
+	await cleanup_orphaned_voice_connections()
+	await sync_voice_connections()
+	if voice_check_seconds > 0 and getattr(bot, "voice_watch_task", None) is None:
+		bot.voice_watch_task = asyncio.create_task(voice_pool.watch(voice_check_seconds))
+	await purge_and_repost_controls()
 
 
 
+# Helper function to register the persistent views for every control message
+def register_control_views(sound_files):
+	for chunk in chunk_sounds(sound_files):
+		bot.add_view(ControlView(chunk))
 
-# Function to play sound
-async def play_sound(sound: str, guild: discord.Guild):
+# Helper function to post control buttons in a channel, editing only the messages whose buttons changed
+async def post_controls_helper(channel):
+	log_message(f"Posting controls to {channel}", "info", "post_controls")
+	counts = await control_reconciler.reconcile_channel(channel, control_items(), ControlView, author=bot.user)
+	await control_store.save_async(blocking_executor)
+	log_message(f"Controls in {channel}: {dict(counts)}", category="post_controls")
+
+# Keep caches and control messages in step with the sound catalog
+async def on_sound_catalog_change(added, removed, changed):
+	log_message(f"Sound clips changed: added {added}, removed {removed}, changed {changed}", category="sound_catalog")
+	for sound in removed + changed:
+		clip_cache.invalidate(sound)
+	if any(sound.startswith("countdown-") for sound in added + removed + changed):
+		segment_table.invalidate()
+
+	# Re-register the persistent views so buttons for new clips are handled, then update posted controls
+	register_control_views(control_items())
+	channels = [bot.get_channel(channel_id) for channel_id in list(control_store.channels)]
+	report = await control_reconciler.reconcile(
+		[channel for channel in channels if channel], control_items(), ControlView,
+		on_error=lambda channel, e: log_message(f"Failed to update controls in {channel}: {str(e)}", severity="error", category="sound_catalog"),
+	)
+	log_message(f"Updated controls: {report['edited']} edited, {report['sent']} sent, {report['deleted']} deleted, {report['api_calls']} API calls", category="sound_catalog")
+
+	guild_snapshot.set_sounds(sound_catalog.names())
+	log_stream.publish_event("sounds", {"sounds": sound_catalog.names(), "added": added, "removed": removed, "changed": changed})
+
+sound_catalog.add_listener(on_sound_catalog_change)
+
+# Function to play sound through the guild's playback actor; returns its status ("played", "coalesced" or "rejected"), or None on errors
+async def play_sound(sound: str, guild: discord.Guild, trace=None):
 	log_message(f"play_sound called with sound: {sound}", category="play_sound")
+	if trace is None:
+		trace = latency_tracker.start(guild.id, sound, "play_sound")
 	voice_client = discord.utils.get(bot.voice_clients, guild=guild)
 	if not voice_client:
 		log_message("Bot is not connected to a voice channel.", severity="warning", category="play_sound")
 		return
 
-	sound_path = f'sound-clips/{sound}.mp3'
-	if not os.path.isfile(sound_path):
+	if sound not in sound_catalog:
 		log_message(f"Sound '{sound}' not found.", severity="error", category="play_sound")
 		return
 
-	if voice_client.is_playing():
-		voice_client.stop()
-		log_message("Stopped the currently playing sound.", category="play_sound")
+	async def prepare():
+		return await clip_cache.source(sound), None
 
-	audio_source = discord.FFmpegPCMAudio(sound_path)
-	voice_client.play(audio_source)
-	log_message(f"Playing {sound}.mp3", category="play_sound")
+	try:
+		status, _ = await playback_actors.play(guild.id, sound, prepare, trace)
+	except Exception as e:
+		log_message(f"Failed to play sound '{sound}': {str(e)}", severity="error", category="play_sound")
+		return
+	log_playback(status, sound, "play_sound")
+	return status
+
+# Function to play a countdown of any length, composed from cached one-second segments
+async def play_countdown(start: int, end: int, guild: discord.Guild, language=None, trace=None):
+	language = language or countdown_language
+	log_message(f"play_countdown called with start: {start}, end: {end}, language: {language}", category="play_countdown")
+	if trace is None:
+		trace = latency_tracker.start(guild.id, f"countdown-{language}-{start}-{end}", "play_countdown")
+	voice_client = discord.utils.get(bot.voice_clients, guild=guild)
+	if not voice_client:
+		# The voice client can go away after the caller checked it
+		raise ValueError("Bot is not connected to a voice channel.")
+
+	# Raises ValueError if a number has no segment, so callers can report it
+	async def prepare():
+		return await segment_table.compose(start, end, language), None
+
+	status, _ = await playback_actors.play(guild.id, f"countdown {start}-{end}", prepare, trace)
+	log_playback(status, f"countdown {start}-{end} ({language})", "play_countdown")
+	return status
+
+# Function to play clips and silences back to back as one source, either given as items or a configured sequence name.
+# Returns (status, seconds) from the guild's playback actor.
+async def play_sequence(items=None, guild: discord.Guild = None, name=None, trace=None):
+	log_message(f"play_sequence called with {f'sequence: {name}' if name else f'items: {items}'}", category="play_sequence")
+	# Raises ValueError for unknown sequences or sounds and invalid silences, so callers can report it
+	parsed = sequencer.resolve(items, name=name)
+	if trace is None:
+		trace = latency_tracker.start(guild.id, f"sequence-{name}" if name else "sequence", "play_sequence")
+	voice_client = discord.utils.get(bot.voice_clients, guild=guild)
+	if not voice_client:
+		raise ValueError("Bot is not connected to a voice channel.")
+
+	status, seconds = await playback_actors.play(guild.id, f"sequence {name or items}", lambda: sequencer.build(parsed), trace)
+	log_playback(status, f"sequence {describe_sequence(parsed)}" + (f" ({seconds:.2f}s)" if seconds is not None else ""), "play_sequence")
+	return status, seconds
+
+# Helper function the playback actors use to find a guild's current voice client
+def voice_client_for(guild_id):
+	guild = bot.get_guild(guild_id)
+	return guild.voice_client if guild else None
+
+# Helper function the voice pool uses to find a wanted channel: None while the guild is unavailable
+def voice_channel_for(guild_id, channel_id):
+	guild = bot.get_guild(guild_id)
+	if guild is None:
+		return None
+	channel = guild.get_channel(channel_id)
+	if not isinstance(channel, discord.VoiceChannel):
+		raise LookupError(f"Voice channel {channel_id} no longer exists")
+	return channel
+
+# Helper function to log what a guild's playback actor did with a play request
+def log_playback(status, description, category):
+	if status == "played":
+		log_message(f"Playing {description}", category=category)
+	else:
+		log_message(f"Not playing {description}: {playback_status_message(status)}", category=category)
+
+# Function to play one sound in many guilds at once. The clip is fetched from the cache
+# once and every voice client gets its own cursor over the same frames.
+async def broadcast_sound(sound: str, guild_ids=None):
+	log_message(f"broadcast_sound called with sound: {sound}, guilds: {guild_ids if guild_ids is not None else 'all connected'}", category="broadcast_sound")
+	if sound not in sound_catalog:
+		raise ValueError(f"Sound '{sound}' not found.")
+
+	if guild_ids is None:
+		guild_ids = [voice_client.guild.id for voice_client in bot.voice_clients]
+	traces = {guild_id: latency_tracker.start(guild_id, sound, "broadcast") for guild_id in guild_ids}
+	clip = await clip_cache.get(sound)
+
+	async def prepare():
+		return OpusFrameSource(clip.frames, clip.start_frame), None
+
+	# Immediate, so no guild waits out its coalescing window; a guild still starts only after a
+	# play it is already building, and the reject policy can still refuse it
+	async def play_in(guild_id):
+		if not voice_client_for(guild_id):
+			return "Bot is not connected to a voice channel"
+		try:
+			status, _ = await playback_actors.play(guild_id, sound, prepare, traces[guild_id], immediate=True)
+		except Exception as e:
+			log_message(f"Failed to broadcast {sound} in guild {guild_id}: {str(e)}", severity="error", category="broadcast_sound")
+			return str(e)
+		return "playing" if status == "played" else status
+
+	results = dict(zip(guild_ids, await asyncio.gather(*(play_in(guild_id) for guild_id in guild_ids))))
+	playing = sum(1 for result in results.values() if result == "playing")
+	log_message(f"Broadcasting {sound} in {playing} of {len(guild_ids)} guild(s)", category="broadcast_sound")
+	return results
+
+# Function to start a sound in several guilds at the same wall-clock time
+async def schedule_sound(sound: str, guild_ids, start_at: float):
+	log_message(f"schedule_sound called with sound: {sound}, guilds: {guild_ids}, start_at: {start_at}", category="schedule_sound")
+	if sound not in sound_catalog:
+		raise ValueError(f"Sound '{sound}' not found.")
+
+	connected = [guild_id for guild_id in guild_ids if voice_client_for(guild_id)]
+	missing = [guild_id for guild_id in guild_ids if guild_id not in connected]
+	if not connected:
+		raise ValueError("Bot is not connected to a voice channel in any of the requested guilds.")
+
+	scheduled = await start_scheduler.schedule(sound, connected, start_at)
+	for guild_id in missing:
+		scheduled.errors[guild_id] = "Bot is not connected to a voice channel"
+		log_message(f"Schedule {scheduled.id}: bot is not connected to a voice channel in guild {guild_id}", severity="warning", category="schedule_sound")
+	log_message(f"Scheduled {sound} as schedule {scheduled.id} in {len(connected)} guild(s)", category="schedule_sound")
+	return scheduled
 
 # Function to stop sound
 async def stop_sound(guild: discord.Guild):
 	log_message("stop_sound called", category="stop_sound")
-	voice_client = discord.utils.get(bot.voice_clients, guild=guild)
-	if voice_client and voice_client.is_playing():
-		voice_client.stop()
+	# Also drops any plays still waiting in the guild's actor
+	_, was_playing = await playback_actors.stop(guild.id)
+	if was_playing:
 		log_message("Sound stopped successfully.", category="stop_sound")
 	else:
 		log_message("No sound is currently playing.", category="stop_sound")
 
-# Function to synchronize existing voice connections
+# Function to synchronize existing voice connections and rejoin the channels guilds want the bot in
 async def sync_voice_connections():
 	log_message(f"sync_voice_connections being called")
 	log_message("Synchronizing existing voice connections...", category="sync_voice_connections")
@@ -301,8 +661,20 @@ async def sync_voice_connections():
 		voice_client = discord.utils.get(bot.voice_clients, guild=guild)
 		if voice_client:
 			log_message(f"sync_voice_connections Bot is already connected to a voice channel in guild: {guild.name} (ID: {guild.id})", category="sync_voice_connections")
+		elif guild.id in voice_pool.wanted:
+			log_message(f"sync_voice_connections Rejoining voice channel {voice_pool.wanted[guild.id]} in guild: {guild.name} (ID: {guild.id})", category="sync_voice_connections")
 		else:
 			log_message(f" sync_voice_connections Bot is not connected to any voice channel in guild: {guild.name} (ID: {guild.id})", category="sync_voice_connections")
+	# Joins run in the background, a few at a time, retrying with backoff
+	started = voice_pool.restore()
+	log_message(f"Rejoining {started} of {len(voice_pool.wanted)} wanted voice channel(s)", category="sync_voice_connections")
+
+# Function to build the default language's countdown segments ahead of the first countdown
+async def preload_segments():
+	try:
+		await segment_table.load(countdown_language)
+	except ValueError as e:
+		log_message(f"Not preloading countdown segments: {str(e)}", severity="warning", category="preload_segments")
 
 # Function to clean up any orphaned voice connections
 async def cleanup_orphaned_voice_connections():
@@ -312,7 +684,8 @@ async def cleanup_orphaned_voice_connections():
 		if not voice_client and guild.voice_client:
 			try:
 				log_message(f"Detected an orphaned voice connection in guild: {guild.name} (ID: {guild.id}). Attempting to disconnect.", category="cleanup_orphaned_voice_connections")
-				await guild.voice_client.disconnect(force=True)
+				# Our own disconnect: the guild stays wanted and is rejoined by sync_voice_connections
+				await voice_pool.disconnect(guild.id, guild.voice_client, force=True)
 				log_message(f"Successfully disconnected from an orphaned voice channel in guild: {guild.name} (ID: {guild.id})", category="cleanup_orphaned_voice_connections")
 			except Exception as e:
 				log_message(f"Failed to disconnect from orphaned voice channel in guild: {guild.name} (ID: {guild.id}): {str(e)}", severity="error", category="cleanup_orphaned_voice_connections")
@@ -320,24 +693,37 @@ async def cleanup_orphaned_voice_connections():
 @bot.event
 async def on_guild_join(guild):
 	log_message(f"Joined new guild: {guild.name} (ID: {guild.id}). Syncing commands...", category="on_guild_join")
+	role_index.rebuild_guild(guild)
+	refresh_guild_snapshot(guild)
 	await bot.sync_commands()
 
-# Function to purge and repost control buttons
+# Function to reconcile the control messages in every configured channel at startup
 async def purge_and_repost_controls():
 	log_message(f"Starting purge_and_repost_controls, purge_channel_ids: {purge_channel_ids}", category="purge_and_repost_controls")
+	channels = []
 	for channel_id in purge_channel_ids:
 		channel = bot.get_channel(channel_id)
 		if not channel:
 			log_message(f"Channel with ID {channel_id} not found.", category="purge_and_repost_controls")
 			continue
-
-		existing_message = None
-		async for message in channel.history(limit=100):
-			if message.author == bot.user:
-				existing_message = message
-				break
-
-		await post_controls_helper(channel, existing_message)
+		channels.append(channel)
+
+	report = await control_reconciler.reconcile(
+		channels, control_items(), ControlView, author=bot.user,
+		on_error=lambda channel, e: log_message(f"Failed to post controls in {channel}: {str(e)}", severity="error", category="purge_and_repost_controls"),
+	)
+	log_message(
+		f"Reconciled controls in {report['channels']} channel(s) in {report['seconds']}s with {report['api_calls']} API calls "
+		f"({report['unchanged']} unchanged, {report['edited']} edited, {report['sent']} sent, {report['deleted']} deleted); "
+		f"ready {time.perf_counter() - started_at:.2f}s after startup",
+		category="purge_and_repost_controls",
+	)
 
 async def main_bot():
+	# The bot and the web server share this loop, so this also covers the web server's blocking work
+	loop = asyncio.get_running_loop()
+	if loop_monitor is not None:
+		loop_monitor.start(loop, blocking_executor)
+	else:
+		loop.set_default_executor(blocking_executor)
 	await bot.start(bot_token)
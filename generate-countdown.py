@@ -1,88 +1,78 @@
 #!/usr/bin/env python3
 
 import argparse
-from gtts import gTTS
 from gtts.lang import tts_langs
-from pydub import AudioSegment
 import os
+from tts_backends import BACKENDS, get_backend
+from tts_cache import TTSCache, DEFAULT_MAX_BYTES, synthesis_fields
+from countdown_batch import load_manifest, build_catalog, print_report, convert_clips, print_conversion_report
+from audio_assembly import load_samples, assemble_countdown, export, write_sidecar, DEFAULT_ONSET_MS, DEFAULT_TAIL_MS
 
 # Configuration options
 debug = False  # Enable debug mode to print additional information
-def generate_countdown(start_num, end_num, output_file, language, reuse_cache, verify_final_file):
-	countdown_audio = AudioSegment.silent(duration=0)  # Initialize empty audio segment
-
-	# Create tmp-data directory if it doesn't exist
-	if not os.path.exists("tmp-data"):
-		os.makedirs("tmp-data")
-		if debug: print("Created directory: tmp-data")
-
-	# Preload all file paths and load audio into memory
-	round1_files = {i: f"tmp-data/countdown-{start_num}-{end_num}-round1_{i}.mp3" for i in range(start_num, end_num - 1, -1)}
-	round2_files = {i: f"tmp-data/countdown-{start_num}-{end_num}-round2_{i}.mp3" for i in range(start_num, end_num - 1, -1)}
-	audio_segments = {}
-
-	# Step 1: Check for existing round 2 files first
-	durations = []
-	for i in range(start_num, end_num - 1, -1):
-		if reuse_cache and os.path.exists(round2_files[i]):
-			if debug: print(f"Reusing cached adjusted file: {round2_files[i]}")
-			audio_segments[i] = AudioSegment.from_mp3(round2_files[i])
-		else:
-			if reuse_cache and os.path.exists(round1_files[i]):
-				if debug: print(f"Reusing cached file: {round1_files[i]}")
-			else:
-				if debug: print(f"Generating speech for number {i} with language '{language}'")
-				tts = gTTS(text=str(i), lang=language)
-				tts.save(round1_files[i])
-
-			audio_segments[i] = AudioSegment.from_mp3(round1_files[i])
-			duration = len(audio_segments[i])
-			durations.append(duration)
-			if debug: print(f"Number {i}: Speech duration: {duration}ms")
-
-	# Step 2: Determine the longest duration and calculate the required speed factor
-	max_duration = max(durations)
-	speed_factor = max_duration / 1000  # Use 1 second as the interval
-	if debug: print(f"Maximum duration among all numbers: {max_duration}ms, Speed factor: {speed_factor:.2f}")
-
-	# Step 3: Adjust speed and pad to exactly fit 1 second for all numbers
-	for i in range(start_num, end_num - 1, -1):
-		if reuse_cache and os.path.exists(round2_files[i]):
-			if debug: print(f"Reusing cached adjusted file: {round2_files[i]}")
-		else:
-			audio_segments[i] = audio_segments[i].speedup(playback_speed=speed_factor)
-			if debug: print(f"Number {i}: Adjusted speed with factor {speed_factor:.2f}")
-
-			duration = len(audio_segments[i])
-			if duration < 1000:
-				silence_duration = 1000 - duration
-				audio_segments[i] += AudioSegment.silent(duration=silence_duration)
-				if debug: print(f"Number {i}: Padding with {silence_duration}ms of silence")
-
-			audio_segments[i].export(round2_files[i], format="mp3")
-			if debug: print(f"Number {i}: Saved adjusted audio as {round2_files[i]}")
-
-		countdown_audio += audio_segments[i]
-
-	# Step 4: Export the final countdown audio to mp3 with proper naming
-	countdown_audio.export(output_file, format="mp3")
-	print(f"Final countdown saved as {output_file}")
-
-	# Step 5: Verify final file length
+def generate_countdown(start_num, end_num, output_file, language, reuse_cache, verify_final_file, segments_dir=None, backend=None, cache=None, output_format="mp3", onset_ms=DEFAULT_ONSET_MS, tail_ms=DEFAULT_TAIL_MS, opus=False):
+	backend = backend or get_backend("gtts")
+	cache = cache or TTSCache()
+
+	if segments_dir and not os.path.exists(segments_dir):
+		os.makedirs(segments_dir)
+		if debug: print(f"Created directory: {segments_dir}")
+
+	# Speech lives in the shared content-addressed cache in tmp-data/tts-cache,
+	# keyed by backend, language and text, so any range can reuse it safely
+	numbers = list(range(start_num, end_num - 1, -1))
+	round1_fields = {}
+	round1_files = {}
+
+	# Step 1: Synthesize (or reuse) every number
+	for i in numbers:
+		round1_fields[i] = synthesis_fields(backend, language, str(i))
+		round1_files[i] = cache.get_or_create(
+			round1_fields[i], backend.extension,
+			lambda path: backend.synthesize(str(i), language, path),
+			reuse=reuse_cache,
+		)
+		if debug: print(f"Number {i}: speech in {round1_files[i]}")
+	cache.save()
+
+	# Step 2: Decode each number once, trim its silence, speed it up only if its speech does not fit,
+	# and place its onset onset_ms into its own one-second slot
+	segments = [load_samples(round1_files[i]) for i in numbers]
+	sample_rate = segments[0][1]
+	countdown, placements = assemble_countdown(segments, sample_rate, onset_ms=onset_ms, tail_ms=tail_ms)
+	if debug:
+		for i, info in zip(numbers, placements):
+			print(f"Number {i}: speech {info['speech_ms']}ms, speed factor {info['speed']:.2f}, onset at {info['onset_ms']}ms")
+	sped_up = sum(1 for info in placements if info["speed"] > 1)
+	if debug: print(f"Assembled {len(numbers)} numbers at {sample_rate}Hz, {sped_up} of them sped up")
+
+	# The one-second segments are what the bot composes arbitrary countdowns from
+	if segments_dir:
+		for slot, i in enumerate(numbers):
+			export(countdown[slot * sample_rate:(slot + 1) * sample_rate], sample_rate, f"{segments_dir}/{i}.mp3")
+			if opus:
+				export(countdown[slot * sample_rate:(slot + 1) * sample_rate], sample_rate, f"{segments_dir}/{i}.opus", format="opus")
+			write_sidecar(f"{segments_dir}/{i}.mp3", [i], placements[slot:slot + 1], onset_ms)
+			if debug: print(f"Number {i}: Exported segment to {segments_dir}/{i}.mp3")
+
+	# Step 3: Encode the final countdown once, to mp3 with proper naming, and record where every number starts
+	export(countdown, sample_rate, output_file, format=output_format)
+	# The Ogg/Opus copy shares the sidecar, and the bot plays its packets without transcoding
+	opus_file = f"{os.path.splitext(output_file)[0]}.opus"
+	if opus and opus_file != output_file:
+		export(countdown, sample_rate, opus_file, format="opus")
+	write_sidecar(output_file, numbers, placements, onset_ms)
+	print(f"Final countdown saved as {output_file}" + (f" and {opus_file}" if opus and opus_file != output_file else ""))
+
+	# Step 4: Verify final file length
 	expected_length = (start_num - end_num + 1) * 1000
-	final_length = len(countdown_audio)
+	final_length = len(countdown) * 1000 // sample_rate
 	if verify_final_file or debug:
 		if debug or abs(final_length - expected_length) > 1:
 			print(f"Warning: Expected length {expected_length}ms, but got {final_length}ms")
 			if not debug:
 				exit(1)
 
-	# Step 6: Cleanup temporary files if debug is False and reuse_cache is not set
-	if not debug and not reuse_cache:
-		for i in range(start_num, end_num - 1, -1):
-			os.remove(round1_files[i])
-			os.remove(round2_files[i])
-
 if __name__ == "__main__":
 	# Fetch supported languages for help text
 	languages = tts_langs()
@@ -93,23 +83,47 @@ if __name__ == "__main__":
 		description="Generate a countdown MP3 with specified start and end numbers.\n" + language_help_text,
 		formatter_class=argparse.RawTextHelpFormatter
 	)
-	parser.add_argument("--start", type=int, required=True, help="The starting number of the countdown.")
-	parser.add_argument("--end", type=int, required=True, help="The ending number of the countdown.")
+	parser.add_argument("--start", type=int, help="The starting number of the countdown.")
+	parser.add_argument("--end", type=int, help="The ending number of the countdown.")
+	parser.add_argument("--manifest", type=str, help="Build every range and language listed in this JSON manifest in parallel instead of a single --start/--end.")
+	parser.add_argument("--tts-backend", type=str, default="gtts", choices=sorted(BACKENDS), help="Speech synthesis backend. 'tone' is an offline stand-in for testing. Default is 'gtts'.")
+	parser.add_argument("--threads", type=int, default=8, help="Batch mode: number of concurrent speech synthesis jobs. Default is 8.")
+	parser.add_argument("--processes", type=int, default=None, help="Batch mode: number of audio processing worker processes. Default is one per CPU.")
 	parser.add_argument("--language", type=str, default="en", help="The language for the countdown speech. Default is 'en' (US English).")
-	parser.add_argument("--debug", action="store_true", help="Enable debug mode to print process and keep temp files.")
-	parser.add_argument("--reuse-cache", action="store_true", help="Reuse existing audio files to avoid redundant processing.")
+	parser.add_argument("--debug", action="store_true", help="Enable debug mode to print process details.")
+	parser.add_argument("--reuse-cache", action="store_true", help="Reuse numbers already synthesized and adjusted by earlier runs (shared across ranges, in tmp-data/tts-cache).")
+	parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="Size limit of tmp-data/tts-cache; least recently used entries are evicted beyond it. Default is 512.")
 	parser.add_argument("--verify-final-file", action="store_true", help="Verify the final audio length to match the expected value.")
+	parser.add_argument("--onset-ms", type=int, default=DEFAULT_ONSET_MS, help=f"Where each number's speech starts within its second, in ms. Default is {DEFAULT_ONSET_MS}.")
+	parser.add_argument("--tail-ms", type=int, default=DEFAULT_TAIL_MS, help=f"Minimum silence kept at the end of each second; longer numbers are sped up. Default is {DEFAULT_TAIL_MS}.")
+	parser.add_argument("--opus", action="store_true", help="Also write a Discord-native Ogg/Opus copy (.opus, 48 kHz, 20 ms packets) of every output, which the bot plays without transcoding.")
+	parser.add_argument("--convert-mp3", type=str, nargs="?", const="sound-clips", metavar="DIR", help="Convert every MP3 under DIR (default sound-clips) to .opus, skipping those already converted, and exit.")
+	parser.add_argument("--export-segments", action="store_true", help="Also export each one-second number to sound-clips/segments/<language>/ so the bot can compose countdowns of any length.")
 	args = parser.parse_args()
 
 	# Set global debug variable based on the command-line argument
 	debug = args.debug
+	backend = get_backend(args.tts_backend)
+	cache = TTSCache(max_bytes=args.cache_max_mb * 1024 * 1024)
+
+	if args.convert_mp3:
+		print_conversion_report(convert_clips(args.convert_mp3, args.processes))
+		exit(0)
+	if args.manifest:
+		output_dir, ranges = load_manifest(args.manifest)
+		report = build_catalog(ranges, backend, output_dir, args.reuse_cache, args.threads, args.processes, cache, onset_ms=args.onset_ms, tail_ms=args.tail_ms, opus=args.opus)
+		print_report(report)
+		exit(0)
+	if args.start is None or args.end is None:
+		parser.error("--start and --end are required unless --manifest is given")
 
 	start_num = args.start
 	end_num = args.end
 	language = args.language
 	reuse_cache = args.reuse_cache
 	verify_final_file = args.verify_final_file
+	segments_dir = f"sound-clips/segments/{language}" if args.export_segments else None
 
 	# Generate countdown with provided arguments
-	generate_countdown(start_num, end_num, f"countdown-{language}-{start_num}-{end_num}.mp3", language, reuse_cache, verify_final_file)
+	generate_countdown(start_num, end_num, f"countdown-{language}-{start_num}-{end_num}.mp3", language, reuse_cache, verify_final_file, segments_dir, backend, cache, onset_ms=args.onset_ms, tail_ms=args.tail_ms, opus=args.opus)
 
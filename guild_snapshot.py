@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Event-maintained snapshot of guilds, their voice channels and the sound list.
+
+The web interface polls these, so rebuilding them from bot.guilds on every
+request is wasted work. Instead the bot's guild, channel and catalog events
+update the snapshot, and each response body is serialized once, on the
+first request after a change, with an ETag derived from its content. Web
+handlers can then answer If-None-Match with 304 without touching discord.py
+objects.
+
+	snapshot.update_guild(guild)          # on_guild_join / on_guild_update / channel events
+	snapshot.remove_guild(guild_id)       # on_guild_remove
+	snapshot.set_sounds(names)            # on startup and catalog changes
+	body, etag = snapshot.channels_json(guild_id)
+"""
+import hashlib
+import json
+import threading
+
+import discord
+
+
+def voice_channels(guild):
+	return [{"id": str(channel.id), "name": channel.name} for channel in guild.channels if isinstance(channel, discord.VoiceChannel)]
+
+
+def encode(payload):
+	body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+	return body, f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+class GuildSnapshot:
+	def __init__(self):
+		self.guilds = {}  # guild id -> {"id", "name", "channels"}, in join order
+		self.sounds = []
+		self.version = 0
+		self._bodies = {}  # cache key -> (body, etag), cleared on every change
+		self._lock = threading.Lock()
+
+	def _changed(self):
+		self.version += 1
+		self._bodies = {}
+
+	def rebuild(self, guilds):
+		with self._lock:
+			self.guilds = {guild.id: {"id": str(guild.id), "name": guild.name, "channels": voice_channels(guild)} for guild in guilds}
+			self._changed()
+
+	def update_guild(self, guild):
+		"""Refresh one guild; returns False if nothing the web interface shows changed."""
+		entry = {"id": str(guild.id), "name": guild.name, "channels": voice_channels(guild)}
+		with self._lock:
+			if self.guilds.get(guild.id) == entry:
+				return False
+			self.guilds[guild.id] = entry
+			self._changed()
+			return True
+
+	def remove_guild(self, guild_id):
+		with self._lock:
+			if self.guilds.pop(guild_id, None) is None:
+				return False
+			self._changed()
+			return True
+
+	def set_sounds(self, names):
+		with self._lock:
+			if list(names) == self.sounds:
+				return False
+			self.sounds = list(names)
+			self._changed()
+			return True
+
+	def entries(self):
+		"""Every guild as {"id", "name", "channels"}, e.g. for another shard worker to merge."""
+		with self._lock:
+			return list(self.guilds.values())
+
+	def __contains__(self, guild_id):
+		return guild_id in self.guilds
+
+	def _cached(self, key, build):
+		with self._lock:
+			cached = self._bodies.get(key)
+			if cached is None:
+				cached = self._bodies[key] = encode(build())
+			return cached
+
+	def guilds_json(self):
+		return self._cached("guilds", lambda: [{"id": entry["id"], "name": entry["name"]} for entry in self.guilds.values()])
+
+	def channels_json(self, guild_id):
+		"""Return (body, etag) for one guild's voice channels, or None if the guild is unknown."""
+		if guild_id not in self.guilds:
+			return None
+		return self._cached(("channels", guild_id), lambda: self.guilds.get(guild_id, {}).get("channels", []))
+
+	def sounds_json(self):
+		return self._cached("sounds", lambda: self.sounds)
+
+	def bootstrap_json(self):
+		"""Everything the web page needs in one body: guilds with their channels, and the sounds."""
+		return self._cached("bootstrap", lambda: {"guilds": list(self.guilds.values()), "sounds": self.sounds})
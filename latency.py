@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Click-to-first-packet latency tracing for every playback path.
+
+A PlayTrace is started as soon as a play request arrives (button interaction or
+POST /api/play) and stamped at each stage on the way to the voice client. The
+final stage, first_read, is stamped by TracedSource from the audio player
+thread when the first packet is pulled, and the finished trace is folded into
+per-guild and per-backend sample windows by LatencyTracker.
+"""
+import collections
+import math
+import threading
+import time
+
+import discord
+
+# Stages in the order they normally happen; each is milliseconds since the request arrived
+STAGES = ["permission_check", "dequeued", "stop_previous", "source_built", "first_read"]
+PERCENTILES = [50, 95, 99]
+DEFAULT_WINDOW = 512
+
+
+def percentile(sorted_samples, pct):
+	"""Nearest-rank percentile of an already sorted list."""
+	if not sorted_samples:
+		return None
+	rank = max(0, min(len(sorted_samples) - 1, math.ceil(pct / 100 * len(sorted_samples)) - 1))
+	return sorted_samples[rank]
+
+
+class PlayTrace:
+	"""Timestamps for a single play request, relative to when it was received."""
+
+	def __init__(self, tracker, guild_id, sound, origin):
+		self.tracker = tracker
+		self.guild_id = guild_id
+		self.sound = sound
+		self.origin = origin
+		self.backend = None
+		self.received = time.perf_counter()
+		self.stages = {}
+
+	def mark(self, stage):
+		self.stages[stage] = (time.perf_counter() - self.received) * 1000
+
+	def finish(self):
+		self.mark("first_read")
+		self.tracker.record(self)
+
+	def wrap(self, source):
+		"""Wrap the source about to be played so its first read completes this trace."""
+		self.backend = type(source).__name__
+		return TracedSource(source, self)
+
+
+class TracedSource(discord.AudioSource):
+	"""Delegating AudioSource that reports the first read() back to its PlayTrace."""
+
+	def __init__(self, source, trace):
+		self.source = source
+		self.trace = trace
+
+	def read(self):
+		data = self.source.read()
+		if self.trace is not None:
+			trace, self.trace = self.trace, None
+			trace.finish()
+		return data
+
+	def is_opus(self):
+		return self.source.is_opus()
+
+	def cleanup(self):
+		self.source.cleanup()
+
+
+class LatencyTracker:
+	"""Keeps the most recent stage timings per guild and per playback backend."""
+
+	def __init__(self, window=DEFAULT_WINDOW):
+		self.window = window
+		self._lock = threading.Lock()
+		self._guilds = {}
+		self._backends = {}
+		self.completed = 0
+
+	def start(self, guild_id, sound, origin):
+		return PlayTrace(self, guild_id, sound, origin)
+
+	def record(self, trace):
+		# Called from the audio player thread, hence the lock
+		with self._lock:
+			self.completed += 1
+			for table, key in ((self._guilds, trace.guild_id), (self._backends, trace.backend)):
+				stages = table.setdefault(key, {})
+				for stage, elapsed in trace.stages.items():
+					stages.setdefault(stage, collections.deque(maxlen=self.window)).append(elapsed)
+
+	def snapshot(self):
+		"""Return p50/p95/p99/max per stage for every guild and backend, in milliseconds."""
+		with self._lock:
+			return {
+				"completed": self.completed,
+				"guilds": {str(key): self._summarize(stages) for key, stages in self._guilds.items()},
+				"backends": {str(key): self._summarize(stages) for key, stages in self._backends.items()},
+			}
+
+	@staticmethod
+	def _summarize(stages):
+		summary = {}
+		for stage in STAGES:
+			samples = sorted(stages.get(stage, ()))
+			if not samples:
+				continue
+			summary[stage] = {f"p{pct}": round(percentile(samples, pct), 3) for pct in PERCENTILES}
+			summary[stage]["max"] = round(samples[-1], 3)
+			summary[stage]["count"] = len(samples)
+		return summary
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""Segmented, append-only on-disk archive of log entries.
+
+Entries outlive the in-memory ring and restarts. Each segment is a pair of
+files named after the first id it holds:
+
+- segment-<id>.log: one JSON entry per line.
+- segment-<id>.idx: one fixed-size record per entry, holding the id,
+  timestamp, byte offset, length, category code and severity code.
+
+A new segment starts once the current one passes its size limit or its
+age limit. The oldest segments are deleted when the archive outgrows its
+total size. Category names are mapped to small integer codes in
+categories.json.
+
+append() only adds the entry to an in-memory batch. A flusher thread writes
+and fsyncs each batch, log file first and index second, so a reader never
+sees an index record whose line is not yet on disk. Queries mmap the index
+files. They skip segments outside the time range, binary-search the
+timestamp (or compute the position straight from the id), and compare
+integer codes. Only the matching lines are read from the log file.
+"""
+import datetime
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+DEFAULT_ARCHIVE_DIR = "tmp-data/log-archive"
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_SEGMENT_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_FLUSH_SECONDS = 1.0
+DEFAULT_BATCH_SIZE = 500
+
+# id, timestamp, offset, length, category code, severity code
+INDEX_RECORD = struct.Struct("<QdQIHBx")
+SEVERITIES = ("debug", "info", "warning", "error", "critical")
+SEVERITY_CODES = {severity: code for code, severity in enumerate(SEVERITIES)}
+UNKNOWN_SEVERITY = len(SEVERITIES)
+
+
+def segment_name(first_id):
+	return f"segment-{first_id:016d}"
+
+
+def entry_timestamp(entry):
+	try:
+		return datetime.datetime.fromisoformat(entry["timestamp"]).timestamp()
+	except (KeyError, TypeError, ValueError):
+		return time.time()
+
+
+class LogArchive:
+	def __init__(self, directory=DEFAULT_ARCHIVE_DIR, segment_bytes=DEFAULT_SEGMENT_BYTES, segment_seconds=DEFAULT_SEGMENT_SECONDS,
+			max_bytes=DEFAULT_MAX_BYTES, flush_seconds=DEFAULT_FLUSH_SECONDS, batch_size=DEFAULT_BATCH_SIZE):
+		self.directory = directory
+		self.segment_bytes = segment_bytes
+		self.segment_seconds = segment_seconds
+		self.max_bytes = max_bytes
+		self.flush_seconds = flush_seconds
+		self.batch_size = batch_size
+		self.categories_path = os.path.join(directory, "categories.json")
+		self.flushes = 0
+		self.fsync_seconds = 0.0
+		self._pending = []
+		self._lock = threading.Lock()
+		self._write_lock = threading.Lock()
+		self._wake = threading.Event()
+		self._stopped = threading.Event()
+		self._thread = None
+
+		os.makedirs(directory, exist_ok=True)
+		self.categories = self._load_categories()
+		self._categories_dirty = False
+		self.segments = sorted(
+			int(name[len("segment-"):-len(".idx")]) for name in os.listdir(directory)
+			if name.startswith("segment-") and name.endswith(".idx")
+		)
+		self.next_id = 0
+		self._last_timestamp = 0.0
+		self._log_file = None
+		self._index_file = None
+		if self.segments:
+			self._recover(self.segments[-1])
+
+	def _path(self, first_id, extension):
+		return os.path.join(self.directory, f"{segment_name(first_id)}.{extension}")
+
+	def _load_categories(self):
+		try:
+			with open(self.categories_path, "r") as categories_file:
+				return json.load(categories_file)
+		except (OSError, ValueError):
+			return {}
+
+	def _save_categories(self):
+		temp_path = f"{self.categories_path}.tmp"
+		with open(temp_path, "w") as categories_file:
+			json.dump(self.categories, categories_file)
+		os.replace(temp_path, self.categories_path)
+		self._categories_dirty = False
+
+	def _recover(self, first_id):
+		"""Reopen the newest segment, dropping anything a crash left half-written."""
+		index_path, log_path = self._path(first_id, "idx"), self._path(first_id, "log")
+		count = os.path.getsize(index_path) // INDEX_RECORD.size
+		log_end = 0
+		with open(index_path, "r+b") as index_file:
+			index_file.truncate(count * INDEX_RECORD.size)
+			if count:
+				index_file.seek((count - 1) * INDEX_RECORD.size)
+				log_id, timestamp, offset, length, _, _ = INDEX_RECORD.unpack(index_file.read(INDEX_RECORD.size))
+				self.next_id = log_id + 1
+				self._last_timestamp = timestamp
+				log_end = offset + length
+			else:
+				self.next_id = first_id
+		if os.path.exists(log_path):
+			with open(log_path, "r+b") as log_file:
+				log_file.truncate(log_end)
+		self._open_segment(first_id)
+		if count:
+			# Age-based rotation counts from the segment's first entry, not from this restart
+			with open(index_path, "rb") as index_file:
+				self._segment_started = INDEX_RECORD.unpack(index_file.read(INDEX_RECORD.size))[1]
+
+	def _open_segment(self, first_id):
+		if self._log_file is not None:
+			self._log_file.close()
+			self._index_file.close()
+		self._log_file = open(self._path(first_id, "log"), "ab")
+		self._index_file = open(self._path(first_id, "idx"), "ab")
+		self._segment_id = first_id
+		self._segment_started = time.time()
+		self._segment_size = self._log_file.tell()
+		if first_id not in self.segments:
+			self.segments.append(first_id)
+
+	def start(self):
+		self._thread = threading.Thread(target=self._run, name="log-archive", daemon=True)
+		self._thread.start()
+
+	def close(self):
+		self._stopped.set()
+		self._wake.set()
+		if self._thread is not None:
+			self._thread.join()
+		self.flush()
+		if self._log_file is not None:
+			self._log_file.close()
+			self._index_file.close()
+
+	def append(self, entry):
+		"""Assign the next archive id to `entry` and queue it for the next flush."""
+		with self._lock:
+			log_id = self.next_id
+			self.next_id += 1
+			self._pending.append((log_id, entry))
+			if len(self._pending) >= self.batch_size:
+				self._wake.set()
+		return log_id
+
+	def _run(self):
+		while not self._stopped.is_set():
+			self._wake.wait(self.flush_seconds)
+			self._wake.clear()
+			self.flush()
+
+	def flush(self):
+		with self._lock:
+			batch, self._pending = self._pending, []
+		if not batch:
+			return
+		with self._write_lock:
+			log_chunks, index_chunks = [], []
+			for log_id, entry in batch:
+				if self._log_file is None or self._needs_rotation():
+					self._write(log_chunks, index_chunks)
+					log_chunks, index_chunks = [], []
+					self._open_segment(log_id)
+				entry = dict(entry, id=log_id)
+				line = (json.dumps(entry) + "\n").encode("utf-8")
+				category = entry.get("category", "")
+				code = self.categories.get(category)
+				if code is None:
+					code = self.categories[category] = len(self.categories)
+					self._categories_dirty = True
+				# Keep index timestamps non-decreasing so queries can binary-search them
+				timestamp = self._last_timestamp = max(self._last_timestamp, entry_timestamp(entry))
+				severity = SEVERITY_CODES.get(entry.get("severity"), UNKNOWN_SEVERITY)
+				index_chunks.append(INDEX_RECORD.pack(log_id, timestamp, self._segment_size, len(line), code, severity))
+				log_chunks.append(line)
+				self._segment_size += len(line)
+			if self._categories_dirty:
+				self._save_categories()
+			self._write(log_chunks, index_chunks)
+			self.flushes += 1
+			self._enforce_retention()
+
+	def _needs_rotation(self):
+		return self._segment_size >= self.segment_bytes or time.time() - self._segment_started >= self.segment_seconds
+
+	def _write(self, log_chunks, index_chunks):
+		if not log_chunks:
+			return
+		started = time.perf_counter()
+		self._log_file.write(b"".join(log_chunks))
+		self._log_file.flush()
+		os.fsync(self._log_file.fileno())
+		self._index_file.write(b"".join(index_chunks))
+		self._index_file.flush()
+		os.fsync(self._index_file.fileno())
+		self.fsync_seconds += time.perf_counter() - started
+
+	def _enforce_retention(self):
+		sizes = {first_id: self._segment_bytes_on_disk(first_id) for first_id in self.segments}
+		total = sum(sizes.values())
+		while total > self.max_bytes and len(self.segments) > 1:
+			first_id = self.segments.pop(0)
+			total -= sizes[first_id]
+			for extension in ("log", "idx"):
+				try:
+					os.remove(self._path(first_id, extension))
+				except FileNotFoundError:
+					pass
+
+	def _segment_bytes_on_disk(self, first_id):
+		try:
+			return os.path.getsize(self._path(first_id, "log")) + os.path.getsize(self._path(first_id, "idx"))
+		except OSError:
+			return 0
+
+	def query(self, since=None, until=None, category=None, severity=None, after_id=None, limit=500):
+		"""Return archived entries (oldest first) matching every given filter.
+
+		`since`/`until` are epoch seconds, `after_id` resumes a previous query.
+		Entries still waiting for the next flush are not included.
+		"""
+		category_code = None
+		if category is not None:
+			category_code = self.categories.get(category)
+			if category_code is None:
+				return []
+		severity_code = SEVERITY_CODES.get(severity, UNKNOWN_SEVERITY) if severity is not None else None
+
+		segments = list(self.segments)
+		results = []
+		for position, first_id in enumerate(segments):
+			next_first_id = segments[position + 1] if position + 1 < len(segments) else None
+			if after_id is not None and next_first_id is not None and next_first_id <= after_id + 1:
+				continue
+			try:
+				results.extend(self._query_segment(first_id, since, until, category_code, severity_code, after_id, limit - len(results)))
+			except FileNotFoundError:
+				# Removed by retention while we were reading
+				continue
+			if len(results) >= limit:
+				break
+		return results
+
+	def _query_segment(self, first_id, since, until, category_code, severity_code, after_id, limit):
+		index_path, log_path = self._path(first_id, "idx"), self._path(first_id, "log")
+		count = os.path.getsize(index_path) // INDEX_RECORD.size
+		if count == 0 or limit <= 0:
+			return []
+		# Open the index first: every record it holds already has its line in the log
+		with open(index_path, "rb") as index_file, open(log_path, "rb") as log_file:
+			with mmap.mmap(index_file.fileno(), count * INDEX_RECORD.size, access=mmap.ACCESS_READ) as index:
+				first_timestamp = INDEX_RECORD.unpack_from(index, 0)[1]
+				last_timestamp = INDEX_RECORD.unpack_from(index, (count - 1) * INDEX_RECORD.size)[1]
+				if (until is not None and first_timestamp > until) or (since is not None and last_timestamp < since):
+					return []
+
+				start = 0
+				if since is not None:
+					low, high = 0, count
+					while low < high:
+						middle = (low + high) // 2
+						if INDEX_RECORD.unpack_from(index, middle * INDEX_RECORD.size)[1] < since:
+							low = middle + 1
+						else:
+							high = middle
+					start = low
+				if after_id is not None:
+					# Ids within a segment are consecutive
+					start = max(start, after_id + 1 - first_id)
+
+				matches = []
+				log = None
+				try:
+					for position in range(start, count):
+						log_id, timestamp, offset, length, code, severity = INDEX_RECORD.unpack_from(index, position * INDEX_RECORD.size)
+						if until is not None and timestamp > until:
+							break
+						if category_code is not None and code != category_code:
+							continue
+						if severity_code is not None and severity != severity_code:
+							continue
+						if log is None:
+							log = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+						matches.append(json.loads(log[offset:offset + length]))
+						if len(matches) >= limit:
+							break
+				finally:
+					if log is not None:
+						log.close()
+				return matches
+
+	def stats(self):
+		with self._lock:
+			pending = len(self._pending)
+		return {
+			"segments": len(self.segments),
+			"bytes": sum(self._segment_bytes_on_disk(first_id) for first_id in list(self.segments)),
+			"next_id": self.next_id,
+			"pending": pending,
+			"flushes": self.flushes,
+			"fsync_seconds": round(self.fsync_seconds, 3),
+		}
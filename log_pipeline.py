@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Queue-based logging pipeline shared by the bot and the web server.
+
+log_message and every standard logger (including discord.py's) only create a
+LogRecord and put it on a bounded queue. A QueueListener thread formats the
+record and passes it to the sinks: the console and the in-memory log ring
+and stream. Records are filtered before they are queued, so nothing slow
+happens on the event loop:
+
+- levels: a minimum level per category, from config "log-levels". The
+  longest dotted-prefix match wins, and "default" covers everything else.
+- sampling: "log-sample-per-second" caps chatty categories, such as
+  discord.py's gateway and voice heartbeats, to N records per second.
+  Warnings and errors are never sampled.
+
+A full queue drops the record rather than block the caller. Dropped and
+sampled records are counted per category.
+"""
+import collections
+import datetime
+import logging
+import logging.handlers
+import queue
+import threading
+
+DEFAULT_QUEUE_SIZE = 10000
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+LEVELS = {
+	"debug": logging.DEBUG,
+	"info": logging.INFO,
+	"warning": logging.WARNING,
+	"error": logging.ERROR,
+	"critical": logging.CRITICAL,
+}
+
+
+def record_category(record):
+	return getattr(record, "category", record.name)
+
+
+class CategoryLevels:
+	"""Minimum level per dotted category, resolved once per category and cached."""
+
+	def __init__(self, levels=None, default=logging.DEBUG):
+		levels = dict(levels or {})
+		self.default = LEVELS.get(str(levels.pop("default", "")).lower(), default)
+		self.levels = {category: LEVELS[str(level).lower()] for category, level in levels.items()}
+		self._cache = {}
+
+	def level_for(self, category):
+		level = self._cache.get(category)
+		if level is None:
+			level = self.default
+			parts = category.split(".")
+			for end in range(len(parts), 0, -1):
+				prefix = ".".join(parts[:end])
+				if prefix in self.levels:
+					level = self.levels[prefix]
+					break
+			self._cache[category] = level
+		return level
+
+
+class RateSampler:
+	"""Lets at most N records per second through for each configured category."""
+
+	def __init__(self, per_second=None):
+		self.per_second = dict(per_second or {})
+		self._windows = {}
+		self._limits = {}
+
+	def limit_for(self, category):
+		if category not in self._limits:
+			limit = None
+			parts = category.split(".")
+			for end in range(len(parts), 0, -1):
+				prefix = ".".join(parts[:end])
+				if prefix in self.per_second:
+					limit = self.per_second[prefix]
+					break
+			self._limits[category] = limit
+		return self._limits[category]
+
+	def allow(self, category, now):
+		limit = self.limit_for(category)
+		if limit is None:
+			return True
+		second = int(now)
+		window_second, count = self._windows.get(category, (second, 0))
+		if window_second != second:
+			window_second, count = second, 0
+		self._windows[category] = (window_second, count + 1)
+		return count < limit
+
+
+class PipelineHandler(logging.handlers.QueueHandler):
+	def __init__(self, log_queue, pipeline):
+		super().__init__(log_queue)
+		self.pipeline = pipeline
+
+	def prepare(self, record):
+		# Formatting happens on the listener thread; the record is queued as-is
+		return record
+
+	def enqueue(self, record):
+		try:
+			self.queue.put_nowait(record)
+			self.pipeline.count("queued", record)
+		except queue.Full:
+			self.pipeline.count("dropped", record)
+
+
+class LogRingSink(logging.Handler):
+	"""Turns records into log entries for the ring buffer and the SSE stream."""
+
+	def __init__(self, ring, stream=None, accept=None):
+		super().__init__()
+		self.ring = ring
+		self.stream = stream
+		self.accept = accept
+
+	def emit(self, record):
+		if self.accept is not None and not self.accept(record):
+			return
+		log_entry = {
+			"id": None,
+			"timestamp": datetime.datetime.fromtimestamp(record.created).isoformat(),
+			"severity": record.levelname.lower(),
+			"category": record_category(record),
+			"message": self.format(record),
+		}
+		# The ring buffer fills in the id and overwrites the oldest entry once it is full
+		self.ring.append(log_entry)
+		if self.stream is not None:
+			self.stream.publish(log_entry)
+
+
+class LogPipeline:
+	def __init__(self, sinks, levels=None, sample_per_second=None, queue_size=DEFAULT_QUEUE_SIZE, default_level=logging.DEBUG):
+		self.levels = CategoryLevels(levels, default=default_level)
+		self.sampler = RateSampler(sample_per_second)
+		self.queue = queue.Queue(maxsize=queue_size)
+		self.handler = PipelineHandler(self.queue, self)
+		self.handler.addFilter(self.filter)
+		self.listener = logging.handlers.QueueListener(self.queue, *sinks, respect_handler_level=True)
+		self.counters = {"queued": collections.Counter(), "dropped": collections.Counter(), "sampled": collections.Counter()}
+		self._lock = threading.Lock()
+		self.running = False
+
+	def is_enabled(self, category, level):
+		"""Cheap pre-check so callers can skip building a record at all."""
+		return level >= self.levels.level_for(category)
+
+	def filter(self, record):
+		category = record_category(record)
+		if record.levelno < self.levels.level_for(category):
+			return False
+		if record.levelno < logging.WARNING:
+			with self._lock:
+				allowed = self.sampler.allow(category, record.created)
+			if not allowed:
+				self.count("sampled", record)
+				return False
+		return True
+
+	def count(self, counter, record):
+		with self._lock:
+			self.counters[counter][record_category(record)] += 1
+
+	def attach(self, logger=None):
+		logger = logger or logging.getLogger()
+		logger.addHandler(self.handler)
+		logger.setLevel(logging.DEBUG)
+
+	def start(self):
+		self.listener.start()
+		self.running = True
+
+	def stop(self):
+		"""Flush everything still queued and stop the listener thread; safe to call twice."""
+		if self.running:
+			self.running = False
+			self.listener.stop()
+
+	def stats(self):
+		with self._lock:
+			return {
+				"queue_depth": self.queue.qsize(),
+				"queue_size": self.queue.maxsize,
+				**{name: sum(counter.values()) for name, counter in self.counters.items()},
+				"dropped_by_category": dict(self.counters["dropped"]),
+				"sampled_by_category": dict(self.counters["sampled"]),
+			}
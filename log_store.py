@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Fixed-capacity ring buffer for log entries, keyed by their monotonically increasing id.
+
+Because ids are assigned sequentially, the slot of an entry is simply
+`id % capacity`, so "everything after id X" is an offset into the buffer rather
+than a scan. Per-category and per-severity deques of ids act as secondary
+indexes; they are trimmed from the left as the ring overwrites old entries, so
+a filtered query only touches the entries it returns.
+"""
+import collections
+import threading
+
+DEFAULT_CAPACITY = 10000
+
+
+class LogRing:
+	def __init__(self, capacity=DEFAULT_CAPACITY):
+		if capacity <= 0:
+			raise ValueError("capacity must be positive")
+		self.capacity = capacity
+		self._slots = [None] * capacity
+		self._next_id = 0
+		self._by_category = {}
+		self._by_severity = {}
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return min(self._next_id, self.capacity)
+
+	@property
+	def oldest_id(self):
+		return max(0, self._next_id - self.capacity)
+
+	@property
+	def last_id(self):
+		return self._next_id - 1
+
+	def append(self, entry):
+		"""Assign the next id to `entry`, store it and return the id."""
+		with self._lock:
+			log_id = self._next_id
+			entry["id"] = log_id
+			slot = log_id % self.capacity
+			evicted = self._slots[slot]
+			if evicted is not None:
+				self._unindex(self._by_category, evicted["category"])
+				self._unindex(self._by_severity, evicted["severity"])
+			self._slots[slot] = entry
+			self._by_category.setdefault(entry["category"], collections.deque()).append(log_id)
+			self._by_severity.setdefault(entry["severity"], collections.deque()).append(log_id)
+			self._next_id = log_id + 1
+			return log_id
+
+	def get(self, log_id):
+		with self._lock:
+			if self.oldest_id <= log_id < self._next_id:
+				return self._slots[log_id % self.capacity]
+			return None
+
+	def since(self, last_id=None, category=None, severity=None, limit=None):
+		"""Return entries with an id greater than `last_id`, oldest first, optionally filtered."""
+		with self._lock:
+			start = self.oldest_id if last_id is None else max(last_id + 1, self.oldest_id)
+			if category is None and severity is None:
+				ids = range(start, self._next_id)
+				if limit is not None:
+					ids = ids[:limit]
+				return [self._slots[i % self.capacity] for i in ids]
+
+			# Walk the smaller index backwards until we pass `start`, so cost tracks the result size
+			if category is not None and severity is not None:
+				index = min(self._by_category.get(category, ()), self._by_severity.get(severity, ()), key=len)
+			elif category is not None:
+				index = self._by_category.get(category, ())
+			else:
+				index = self._by_severity.get(severity, ())
+
+			matches = []
+			for log_id in reversed(index):
+				if log_id < start:
+					break
+				entry = self._slots[log_id % self.capacity]
+				if category is not None and entry["category"] != category:
+					continue
+				if severity is not None and entry["severity"] != severity:
+					continue
+				matches.append(entry)
+			matches.reverse()
+			if limit is not None:
+				matches = matches[:limit]
+			return matches
+
+	def categories(self):
+		with self._lock:
+			return sorted(self._by_category)
+
+	@staticmethod
+	def _unindex(index, key):
+		ids = index[key]
+		ids.popleft()
+		if not ids:
+			del index[key]
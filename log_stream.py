@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Push-based fan-out of log entries to Server-Sent Events subscribers.
+
+log_message publishes every entry here. Each entry is serialized to an SSE
+frame once, then handed to every subscriber's bounded queue. A slow client
+never blocks the publisher: when its queue is full the oldest frames are
+dropped and the client is told how many it missed on its next read.
+
+Other named events (such as "sounds" when the clip catalog changes) share the
+same connection via publish_event; they carry no log id and are never
+filtered out by the resume position.
+"""
+import asyncio
+import collections
+import json
+
+DEFAULT_QUEUE_SIZE = 1000
+
+
+def format_event(data, event=None, event_id=None):
+	"""Build a single SSE frame."""
+	lines = []
+	if event_id is not None:
+		lines.append(f"id: {event_id}")
+	if event is not None:
+		lines.append(f"event: {event}")
+	lines.append(f"data: {json.dumps(data)}")
+	return "\n".join(lines) + "\n\n"
+
+
+def format_log_entry(entry):
+	return format_event(entry, event="log", event_id=entry["id"])
+
+
+class LogSubscriber:
+	"""Bounded queue of pre-serialized frames for one streaming client."""
+
+	def __init__(self, maxsize):
+		self.maxsize = maxsize
+		self.frames = collections.deque()
+		self.dropped = 0
+		self.last_id = -1
+		self._ready = asyncio.Event()
+
+	def push(self, log_id, frame):
+		"""Queue a frame, returning True if the oldest queued frame had to be dropped."""
+		dropped = len(self.frames) >= self.maxsize
+		if dropped:
+			self.frames.popleft()
+			self.dropped += 1
+		self.frames.append((log_id, frame))
+		self._ready.set()
+		return dropped
+
+	async def drain(self, timeout=None):
+		"""Wait for frames and return (frames, dropped_count); returns ([], 0) on timeout."""
+		if not self.frames:
+			try:
+				await asyncio.wait_for(self._ready.wait(), timeout)
+			except asyncio.TimeoutError:
+				return [], 0
+		self._ready.clear()
+		# Skip anything already sent as part of the resume backlog
+		frames = [frame for log_id, frame in self.frames if log_id is None or log_id > self.last_id]
+		log_ids = [log_id for log_id, frame in self.frames if log_id is not None]
+		if log_ids:
+			self.last_id = max(self.last_id, log_ids[-1])
+		self.frames.clear()
+		dropped, self.dropped = self.dropped, 0
+		return frames, dropped
+
+
+class LogStream:
+	def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
+		self.queue_size = queue_size
+		self.subscribers = set()
+		self.loop = None
+		self.published = 0
+		self.dropped = 0
+
+	def subscribe(self):
+		self.loop = asyncio.get_running_loop()
+		subscriber = LogSubscriber(self.queue_size)
+		self.subscribers.add(subscriber)
+		return subscriber
+
+	def unsubscribe(self, subscriber):
+		self.subscribers.discard(subscriber)
+
+	def publish(self, entry):
+		"""Fan an entry out to every subscriber; safe to call from any thread."""
+		self._publish(entry["id"], lambda: format_log_entry(entry))
+
+	def publish_event(self, event, data):
+		"""Fan a named, non-log event out to every subscriber."""
+		self._publish(None, lambda: format_event(data, event=event))
+
+	def _publish(self, log_id, build_frame):
+		if not self.subscribers or self.loop is None:
+			return
+		try:
+			running = asyncio.get_running_loop()
+		except RuntimeError:
+			running = None
+		if running is self.loop:
+			self._dispatch(log_id, build_frame)
+		elif not self.loop.is_closed():
+			# discord.py logs from its voice and gateway threads too
+			self.loop.call_soon_threadsafe(self._dispatch, log_id, build_frame)
+
+	def _dispatch(self, log_id, build_frame):
+		self.published += 1
+		frame = build_frame()
+		for subscriber in list(self.subscribers):
+			if subscriber.push(log_id, frame):
+				self.dropped += 1
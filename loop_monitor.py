@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Event-loop lag monitor for the loop shared by the bot and the web server.
+
+Discord heartbeats, button clicks, web requests and scheduled starts all run
+on one asyncio loop, so anything that blocks it delays all of them. This
+module measures two things:
+
+- lag: a sampler task sleeps for `interval` and records how late it woke up.
+  The most recent `window` samples give the p50/p95/p99/max scheduling delay.
+- slow callbacks, only when enabled: the loop runs in asyncio's debug mode
+  with slow_callback_duration set to `slow_callback_ms`. asyncio then logs
+  every slower callback, and the monitor captures those warnings. Each one
+  is attributed to its coroutine or function and to the source line where
+  the task stopped (its next await, or its end), with counts and times kept
+  per location. Debug mode adds work to every callback, so it is meant for
+  tracking down a problem, not for running all the time.
+
+Blocking work runs on a bounded thread pool that start() sets as the loop's
+default executor, so every run_in_executor(None, ...) shares the same limit.
+A BlockingExecutor counts what it was given, so the snapshot can show how
+much work is waiting without reading the pool's private attributes.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import os
+import re
+import threading
+import time
+
+from latency import percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_SECONDS = 0.05
+DEFAULT_WINDOW = 1200  # one minute of samples at the default interval
+DEFAULT_SLOW_CALLBACK_MS = 20
+RECENT_SLOW_CALLBACKS = 50
+# What asyncio's debug mode logs for a slow callback, with the handle's repr and the seconds it took
+SLOW_CALLBACK_MESSAGE = "Executing %s took %.3f seconds"
+# "<Task pending name='x' coro=<play_sound() running at discord_bot.py:512> ...>" or "<Handle on_tick() at x.py:40 ...>"
+HANDLE_PATTERN = re.compile(r"(?:coro=<|<(?:Timer)?Handle )(?P<name>[^\s(]+)\(\)(?: running| done, defined)? at (?P<path>.+?):(?P<line>\d+)")
+
+
+def describe_callback(handle_repr):
+	"""Name the code a handle ran, from asyncio's repr of it, as "name (file:line)"."""
+	match = HANDLE_PATTERN.search(handle_repr)
+	if match is None:
+		return handle_repr
+	return f"{match['name']} ({os.path.basename(match['path'])}:{match['line']})"
+
+
+class SlowCallbackHandler(logging.Handler):
+	"""Passes asyncio's slow callback warnings to one monitor."""
+
+	def __init__(self, monitor):
+		super().__init__(logging.WARNING)
+		self.monitor = monitor
+
+	def emit(self, record):
+		if record.msg == SLOW_CALLBACK_MESSAGE and isinstance(record.args, tuple) and len(record.args) == 2:
+			self.monitor._record_slow(describe_callback(str(record.args[0])), record.args[1])
+
+
+class BlockingExecutor(concurrent.futures.ThreadPoolExecutor):
+	"""A thread pool that counts the work submitted to it and the work finished."""
+
+	def __init__(self, max_workers, **kwargs):
+		super().__init__(max_workers=max_workers, **kwargs)
+		self.workers = max_workers
+		self.submitted = 0
+		self.completed = 0
+		self._counts_lock = threading.Lock()
+
+	def submit(self, fn, /, *args, **kwargs):
+		future = super().submit(fn, *args, **kwargs)
+		with self._counts_lock:
+			self.submitted += 1
+		future.add_done_callback(self._done)
+		return future
+
+	def _done(self, future):
+		with self._counts_lock:
+			self.completed += 1
+
+	def stats(self):
+		with self._counts_lock:
+			submitted, completed = self.submitted, self.completed
+		# Running and queued together; the split between them is the pool's own business
+		return {"workers": self.workers, "submitted": submitted, "completed": completed, "pending": submitted - completed}
+
+
+class LoopMonitor:
+	def __init__(self, interval=DEFAULT_INTERVAL_SECONDS, window=DEFAULT_WINDOW, slow_callback_ms=DEFAULT_SLOW_CALLBACK_MS, slow_callbacks=False):
+		self.interval = interval
+		self.slow_callback_seconds = slow_callback_ms / 1000
+		self.track_slow_callbacks = slow_callbacks
+		self.samples = collections.deque(maxlen=window)
+		self.max_lag = 0.0
+		self.slow_callbacks = collections.Counter()
+		self.slow_seconds = collections.Counter()
+		self.slowest = {}
+		self.recent_slow = collections.deque(maxlen=RECENT_SLOW_CALLBACKS)
+		self.executor = None
+		self.task = None
+		self._loop = None
+		self._handler = None
+		self._previous_debug = None
+
+	def start(self, loop, executor=None):
+		"""Begin sampling `loop`, and capturing its slow callbacks if enabled; `executor` becomes its default executor."""
+		if executor is not None:
+			loop.set_default_executor(executor)
+			self.executor = executor
+		if self.track_slow_callbacks and self._handler is None:
+			self._loop = loop
+			self._previous_debug = (loop.get_debug(), loop.slow_callback_duration)
+			loop.set_debug(True)
+			loop.slow_callback_duration = self.slow_callback_seconds
+			self._handler = SlowCallbackHandler(self)
+			logging.getLogger("asyncio").addHandler(self._handler)
+		if self.task is None:
+			self.task = loop.create_task(self._sample(), name="loop-monitor")
+
+	def stop(self):
+		if self.task is not None:
+			self.task.cancel()
+			self.task = None
+		if self._handler is not None:
+			logging.getLogger("asyncio").removeHandler(self._handler)
+			self._handler = None
+			debug, self._loop.slow_callback_duration = self._previous_debug
+			self._loop.set_debug(debug)
+			self._loop = None
+
+	def _record_slow(self, key, elapsed):
+		first = key not in self.slow_callbacks
+		self.slow_callbacks[key] += 1
+		self.slow_seconds[key] += elapsed
+		self.slowest[key] = max(self.slowest.get(key, 0.0), elapsed)
+		self.recent_slow.append({"time": time.time(), "callback": key, "ms": round(elapsed * 1000, 3)})
+		if first:
+			logger.warning(f"Slow event loop callback: {key} blocked the loop for {elapsed * 1000:.1f}ms")
+
+	async def _sample(self):
+		clock = time.perf_counter
+		while True:
+			expected = clock() + self.interval
+			await asyncio.sleep(self.interval)
+			lag = max(0.0, clock() - expected)
+			self.samples.append(lag)
+			if lag > self.max_lag:
+				self.max_lag = lag
+
+	def lag_percentiles(self):
+		if not self.samples:
+			return {}
+		# The same nearest-rank percentiles as /api/latency
+		ordered = sorted(self.samples)
+		return {"samples": len(ordered), **{f"p{pct}_ms": round(percentile(ordered, pct) * 1000, 3) for pct in (50, 95, 99)}, "max_ms": round(ordered[-1] * 1000, 3)}
+
+	def snapshot(self, top=10):
+		return {
+			"interval_ms": round(self.interval * 1000, 3),
+			"lag": self.lag_percentiles(),
+			"max_lag_ms": round(self.max_lag * 1000, 3),
+			"slow_callbacks_tracked": self.track_slow_callbacks,
+			"slow_callback_ms": round(self.slow_callback_seconds * 1000, 3),
+			"slow_callbacks": [
+				{
+					"callback": key,
+					"count": count,
+					"total_ms": round(self.slow_seconds[key] * 1000, 3),
+					"max_ms": round(self.slowest[key] * 1000, 3),
+				}
+				for key, count in sorted(self.slow_callbacks.items(), key=lambda item: self.slow_seconds[item[0]], reverse=True)[:top]
+			],
+			"recent_slow_callbacks": list(self.recent_slow),
+			"executor": self.executor.stats() if isinstance(self.executor, BlockingExecutor) else None,
+		}
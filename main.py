@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
+import argparse
 import asyncio
-import importlib
+import hashlib
+import importlib.util
+import json
 import sys
 import shutil
 import platform
 import os
 import subprocess
+import time
 
 REQUIREMENTS_FILE = "requirements.txt"
+# Seconds to wait before restarting a shard worker process that exited
+WORKER_RESTART_SECONDS = 5
 SYSTEM_DEPENDENCIES = ["ffmpeg"]  # Add more if needed
+# A passed module check is remembered here until requirements.txt or the interpreter changes
+MODULE_CHECK_CACHE = "tmp-data/module-check.json"
 
 # Detect if the system supports emojis
 SUPPORTS_EMOJIS = sys.stdout.encoding.lower().startswith("utf")
@@ -46,18 +54,59 @@ def get_required_modules():
 
 
 
-def check_python_modules():
-	"""Check if required Python modules are installed BEFORE importing anything."""
+def module_check_key():
+	"""Hash of everything a passed module check depends on: requirements.txt and the interpreter."""
+	digest = hashlib.sha256()
+	with open(REQUIREMENTS_FILE, "rb") as f:
+		digest.update(f.read())
+	digest.update(f"{sys.executable}\n{sys.version}".encode("utf-8"))
+	return digest.hexdigest()
+
+def cached_module_check(key):
+	"""True if the last passed check had the same key and its modules are still where they were."""
+	try:
+		with open(MODULE_CHECK_CACHE, "r") as f:
+			cached = json.load(f)
+	except (OSError, ValueError):
+		return False
+	if cached.get("key") != key:
+		return False
+	return all(os.path.exists(origin) for origin in cached.get("origins", []))
+
+def save_module_check(key, origins):
+	os.makedirs(os.path.dirname(MODULE_CHECK_CACHE), exist_ok=True)
+	with open(MODULE_CHECK_CACHE, "w") as f:
+		json.dump({"key": key, "origins": origins}, f)
+
+def check_python_modules(force=False):
+	"""Check if required Python modules are installed BEFORE importing anything.
+
+	Modules are located with find_spec rather than imported, and a passed
+	check is cached until requirements.txt or the interpreter changes.
+	"""
+	key = None
+	if os.path.exists(REQUIREMENTS_FILE):
+		key = module_check_key()
+		if not force and cached_module_check(key):
+			print_safe("✅ Required Python modules were already checked.")
+			return
+
 	print_safe("\n🔍 Checking required Python modules...\n")
 
 	required_modules = get_required_modules()
 	missing_modules = []
+	origins = []
 
 	for module in required_modules:
 		try:
-			importlib.import_module(module)
+			spec = importlib.util.find_spec(module)
+		except (ImportError, ValueError):
+			spec = None
+		if spec is not None:
 			print_safe(f"✅ {module} is installed.")
-		except ImportError:
+			if spec.origin and os.path.isabs(spec.origin):
+				origins.append(spec.origin)
+		else:
 			print_safe(f"❌ {module} is **MISSING**.")
 			missing_modules.append(module)
 
@@ -71,6 +120,11 @@ def check_python_modules():
 		print_safe("   pip3 install -r requirements.txt\n")
 		sys.exit(1)
 
+	try:
+		save_module_check(key, origins)
+	except OSError:
+		pass
+
 
 def check_system_dependencies():
 	"""Check if required system dependencies (like ffmpeg) are installed."""
@@ -106,19 +160,103 @@ def check_system_dependencies():
 		sys.exit(1)
 
 
-async def main():
+def print_import_profile():
+	"""Import the bot and web server in a fresh interpreter with -X importtime and summarize by package."""
+	result = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", "import discord_bot, web_server"],
+		capture_output=True, text=True,
+	)
+	per_package = {}
+	for line in result.stderr.splitlines():
+		if not line.startswith("import time:") or "|" not in line:
+			continue
+		fields = [field.strip() for field in line[len("import time:"):].split("|")]
+		try:
+			self_us = int(fields[0])
+		except ValueError:
+			continue
+		package = fields[2].strip().split(".")[0]
+		per_package[package] = per_package.get(package, 0) + self_us
+
+	total_us = sum(per_package.values())
+	print_safe(f"\n⏱️ Import time for discord_bot + web_server: {total_us / 1000:.1f} ms")
+	for package, self_us in sorted(per_package.items(), key=lambda item: item[1], reverse=True)[:20]:
+		print_safe(f"   {package:<24} {self_us / 1000:8.1f} ms  {100 * self_us / total_us:5.1f}%")
+	if result.returncode != 0:
+		print_safe(f"\n⚠️ Importing failed:\n{result.stderr.splitlines()[-1] if result.stderr else ''}")
+
+def profile_startup(args):
+	"""Time each startup phase without connecting to Discord, then show where import time goes."""
+	phases = []
+	started = time.perf_counter()
+
+	def phase(name, fn):
+		phase_started = time.perf_counter()
+		fn()
+		phases.append((name, time.perf_counter() - phase_started))
+
+	if not args.bypass_module_check:
+		phase("module check (cached)", check_python_modules)
+		phase("module check (uncached)", lambda: check_python_modules(force=True))
+		phase("system dependencies", check_system_dependencies)
+	from app_config import load_config
+	phase("config", load_config)
+	phase("import discord_bot", lambda: __import__("discord_bot"))
+	phase("import web_server", lambda: __import__("web_server"))
+
+	print_safe("\n⏱️ Startup phases:")
+	for name, seconds in phases:
+		print_safe(f"   {name:<24} {seconds * 1000:8.1f} ms")
+	print_safe(f"   {'total':<24} {(time.perf_counter() - started) * 1000:8.1f} ms")
+	print_import_profile()
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Run the wos countdown Discord bot and its web interface.")
+	parser.add_argument("--bypass-module-check", action="store_true", help="Skip the Python module and system dependency checks")
+	parser.add_argument("--recheck-modules", action="store_true", help="Ignore the cached module check and check again")
+	parser.add_argument("--profile-startup", action="store_true", help="Print a startup and import-time breakdown, then exit")
+	parser.add_argument("--shard-worker", type=int, help=argparse.SUPPRESS)  # set by the first process for the workers it starts
+	return parser.parse_args()
+
+async def supervise_shard_worker(worker):
+	"""Run shard worker `worker` as a child process, and start it again whenever it exits."""
+	command = [sys.executable, os.path.abspath(__file__), "--shard-worker", str(worker), "--bypass-module-check"]
+	while True:
+		process = await asyncio.create_subprocess_exec(*command, env={**os.environ, "SHARD_WORKER": str(worker)})
+		try:
+			returncode = await process.wait()
+		except asyncio.CancelledError:
+			if process.returncode is None:
+				process.terminate()
+			raise
+		print_safe(f"⚠️ Shard worker {worker} exited with code {returncode}, restarting in {WORKER_RESTART_SECONDS}s")
+		await asyncio.sleep(WORKER_RESTART_SECONDS)
+
+async def main(args):
 	# Run checks before importing other modules
-	check_python_modules()
-	check_system_dependencies()
+	if not args.bypass_module_check:
+		check_python_modules(force=args.recheck_modules)
+		check_system_dependencies()
+
+	# discord_bot reads the worker index when it is imported
+	if args.shard_worker is not None:
+		os.environ["SHARD_WORKER"] = str(args.shard_worker)
 
 	# Now we safely import everything
-	from discord_bot import main_bot
-	from web_server import main_web
+	from discord_bot import main_bot, shard_worker, shard_processes
+	from web_server import main_web, main_control
+
+	# Sharded, every worker answers control plane requests before it connects
+	await main_control()
+	if shard_worker != 0:
+		await main_bot()
+		return
 
-	# Start bot and web server
+	# Start bot and web server, and the other shard workers if there are any
 	await asyncio.gather(
 		main_bot(),
-		main_web()
+		main_web(),
+		*(supervise_shard_worker(worker) for worker in range(1, shard_processes))
 	)
 
 if __name__ == "__main__":
@@ -126,4 +264,8 @@ if __name__ == "__main__":
 	if os.name == "nt":
 		sys.stdout.reconfigure(encoding="utf-8")
 
-	asyncio.run(main())
+	args = parse_args()
+	if args.profile_startup:
+		profile_startup(args)
+	else:
+		asyncio.run(main(args))
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Reading and writing Ogg/Opus files (RFC 7845) without decoding the audio.
+
+Discord voice carries 48 kHz Opus packets of 20 ms each. An .opus file
+holding exactly such packets can be demuxed in-process: Ogg pages are
+parsed, segments are reassembled into packets by their lacing values, and
+the OpusHead/OpusTags headers are skipped. The packets then go to the
+voice client unchanged, without ffmpeg or the Opus encoder.
+
+Files with packets of any other duration, or with more than one stream,
+cannot be passed through. read_frames raises ValueError for these, and
+the caller falls back to transcoding.
+
+	head, frames = read_frames("sound-clips/countdown-en-30-0.opus")
+	write_ogg_opus("out.opus", frames, channels=2)
+
+Page CRCs are written, but not checked on read. These files are local and
+made by this project, and a damaged packet only costs a glitch in one frame.
+"""
+import os
+import random
+import struct
+
+CAPTURE_PATTERN = b"OggS"
+PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+OPUS_HEAD = struct.Struct("<8sBBHIhB")
+OPUS_SAMPLE_RATE = 48000
+FRAME_SAMPLES = 960  # 20 ms at 48 kHz
+DEFAULT_PRE_SKIP = 312  # libopus encoder lookahead at 48 kHz
+MAX_PAGE_SEGMENTS = 255
+PACKETS_PER_PAGE = 50  # one second of 20 ms packets
+VENDOR = b"wos-countdown-voice"
+
+HEADER_CONTINUED = 0x01
+HEADER_FIRST_PAGE = 0x02
+HEADER_LAST_PAGE = 0x04
+
+# Frame length in 48 kHz samples for each TOC configuration (RFC 6716, section 3.1):
+# SILK 10/20/40/60 ms, hybrid 10/20 ms, then CELT 2.5/5/10/20 ms
+CONFIG_FRAME_SAMPLES = [480, 960, 1920, 2880] * 3 + [480, 960] * 2 + [120, 240, 480, 960] * 4
+
+
+def _crc_table():
+	table = []
+	for byte in range(256):
+		crc = byte << 24
+		for _ in range(8):
+			crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+		table.append(crc & 0xFFFFFFFF)
+	return table
+
+
+CRC_TABLE = _crc_table()
+
+
+def page_crc(data):
+	"""The Ogg page checksum: CRC-32 with polynomial 0x04C11DB7, unreflected, initial value 0."""
+	crc = 0
+	for byte in data:
+		crc = ((crc << 8) & 0xFFFFFFFF) ^ CRC_TABLE[(crc >> 24) ^ byte]
+	return crc
+
+
+def packet_samples(packet):
+	"""Duration of an Opus packet in 48 kHz samples, from its TOC byte."""
+	if not packet:
+		raise ValueError("Empty Opus packet")
+	toc = packet[0]
+	frame_samples = CONFIG_FRAME_SAMPLES[toc >> 3]
+	code = toc & 0x03
+	if code == 0:
+		return frame_samples
+	if code in (1, 2):
+		return 2 * frame_samples
+	if len(packet) < 2:
+		raise ValueError("Truncated Opus packet")
+	return (packet[1] & 0x3F) * frame_samples
+
+
+def iter_pages(data):
+	"""Yield (header_type, granule_position, serial, segment lengths, body offset) for every page."""
+	offset = 0
+	while offset < len(data):
+		if data[offset:offset + 4] != CAPTURE_PATTERN:
+			raise ValueError(f"No Ogg page at byte {offset}")
+		if offset + PAGE_HEADER.size > len(data):
+			raise ValueError("Truncated Ogg page header")
+		_, version, header_type, granule, serial, _, _, segment_count = PAGE_HEADER.unpack_from(data, offset)
+		if version != 0:
+			raise ValueError(f"Unsupported Ogg version {version}")
+		table_start = offset + PAGE_HEADER.size
+		lacing = data[table_start:table_start + segment_count]
+		body = table_start + segment_count
+		if len(lacing) < segment_count or body + sum(lacing) > len(data):
+			raise ValueError("Truncated Ogg page")
+		yield header_type, granule, serial, lacing, body
+		offset = body + sum(lacing)
+
+
+def iter_packets(data):
+	"""Yield every packet of the single logical stream in `data`, reassembled across pages."""
+	stream = None
+	pending = []
+	for header_type, _, serial, lacing, offset in iter_pages(data):
+		if stream is None:
+			stream = serial
+		elif serial != stream:
+			raise ValueError("Multiplexed Ogg streams are not supported")
+		if not header_type & HEADER_CONTINUED and pending:
+			raise ValueError("Ogg packet ends without its continuation page")
+		for length in lacing:
+			pending.append(data[offset:offset + length])
+			offset += length
+			# A lacing value below 255 ends the packet; 255 means it continues
+			if length < 255:
+				yield b"".join(pending)
+				pending = []
+
+
+def parse_opus_head(packet):
+	if len(packet) < OPUS_HEAD.size or not packet.startswith(b"OpusHead"):
+		raise ValueError("Not an Ogg/Opus stream (no OpusHead)")
+	_, version, channels, pre_skip, input_rate, gain, mapping = OPUS_HEAD.unpack_from(packet)
+	if version >> 4:
+		raise ValueError(f"Unsupported OpusHead version {version}")
+	return {"channels": channels, "pre_skip": pre_skip, "input_rate": input_rate, "gain": gain, "mapping": mapping}
+
+
+def read_frames(path):
+	"""Demux the .opus file at `path` into (head, packets), requiring 20 ms packets of one stream.
+
+	Raises ValueError if the file is not Ogg/Opus or its packets cannot be sent to Discord unchanged.
+	"""
+	with open(path, "rb") as opus_file:
+		data = opus_file.read()
+	packets = iter_packets(data)
+	head = parse_opus_head(next(packets, b""))
+	if head["mapping"] != 0 or head["channels"] not in (1, 2):
+		raise ValueError(f"{head['channels']} channels with mapping family {head['mapping']} cannot be passed through")
+	tags = next(packets, b"")
+	if not tags.startswith(b"OpusTags"):
+		raise ValueError("Missing OpusTags header")
+	frames = []
+	for packet in packets:
+		samples = packet_samples(packet)
+		if samples != FRAME_SAMPLES:
+			raise ValueError(f"Packet {len(frames)} is {samples / 48:g} ms, not 20 ms")
+		frames.append(packet)
+	return head, frames
+
+
+def duration(path):
+	"""Playable duration in seconds, from the granule position of the last page; None if unknown."""
+	size = os.path.getsize(path)
+	with open(path, "rb") as opus_file:
+		first = opus_file.read(4096)
+		opus_file.seek(max(0, size - 65536))
+		tail = opus_file.read()
+	# The OpusHead is the only packet of the first page, and short enough for a single segment
+	_, _, _, lacing, offset = next(iter_pages(first))
+	head = parse_opus_head(first[offset:offset + lacing[0]] if lacing else b"")
+	last = tail.rfind(CAPTURE_PATTERN)
+	if last < 0 or last + PAGE_HEADER.size > len(tail):
+		return None
+	granule = PAGE_HEADER.unpack_from(tail, last)[3]
+	if granule < 0:
+		return None
+	return max(0, granule - head["pre_skip"]) / OPUS_SAMPLE_RATE
+
+
+def _page(header_type, granule, serial, sequence, packets):
+	lacing = bytearray()
+	for packet in packets:
+		lacing += b"\xff" * (len(packet) // 255) + bytes([len(packet) % 255])
+	if len(lacing) > MAX_PAGE_SEGMENTS:
+		raise ValueError("Too many segments for one Ogg page")
+	header = PAGE_HEADER.pack(CAPTURE_PATTERN, 0, header_type, granule, serial, sequence, 0, len(lacing))
+	page = bytearray(header + lacing + b"".join(packets))
+	struct.pack_into("<I", page, 22, page_crc(page))
+	return bytes(page)
+
+
+def write_ogg_opus(path, frames, channels=2, pre_skip=DEFAULT_PRE_SKIP, input_rate=OPUS_SAMPLE_RATE):
+	"""Write 20 ms Opus packets to `path` as an Ogg/Opus file, one second of packets per page."""
+	serial = random.getrandbits(32)
+	head = OPUS_HEAD.pack(b"OpusHead", 1, channels, pre_skip, input_rate, 0, 0)
+	tags = b"OpusTags" + struct.pack("<I", len(VENDOR)) + VENDOR + struct.pack("<I", 0)
+	pages = [_page(HEADER_FIRST_PAGE, 0, serial, 0, [head]), _page(0, 0, serial, 1, [tags])]
+
+	granule = pre_skip
+	page_packets = []
+	page_segments = 0
+	for frame in frames:
+		segments = len(frame) // 255 + 1
+		if page_packets and (len(page_packets) >= PACKETS_PER_PAGE or page_segments + segments > MAX_PAGE_SEGMENTS):
+			pages.append(_page(0, granule, serial, len(pages), page_packets))
+			page_packets, page_segments = [], 0
+		page_packets.append(frame)
+		page_segments += segments
+		granule += packet_samples(frame)
+	pages.append(_page(HEADER_LAST_PAGE, granule, serial, len(pages), page_packets))
+
+	# Write next to the target and rename, so the catalog never sees a half-written file
+	temporary = f"{path}.partial"
+	with open(temporary, "wb") as opus_file:
+		for page in pages:
+			opus_file.write(page)
+	os.replace(temporary, path)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Per-guild index of the role ids allowed to control the bot.
+
+Config names roles by name. This index resolves those names to role ids once
+per guild, and the bot's role events keep it current. A permission check then
+compares those ids with the roles the member has on the interaction itself,
+which Discord sends with every interaction. So nothing is rebuilt or logged
+while a click is being handled, and no member data is kept that could go stale.
+
+Rules, most specific first:
+
+	"sound-permissions": {"refill-in": ["Admin"]}         # any guild, one sound
+	"guild-permissions": {
+		"1234": {
+			"roles": ["countdown-controller"],            # replaces the global roles in this guild
+			"sounds": {"countdown-en-90-0": ["Admin"]}    # one sound in this guild
+		}
+	}
+	"roles-allowed-to-control-bot": ["countdown-controller", "Admin"]
+
+An empty role list means everyone is allowed.
+"""
+import threading
+
+ANYONE = None
+
+
+class GuildRoles:
+	"""Resolved role ids for one guild: a default set plus per-sound overrides."""
+
+	__slots__ = ("default", "sounds")
+
+	def __init__(self, default, sounds):
+		self.default = default
+		self.sounds = sounds
+
+	def allowed_for(self, sound=None):
+		if sound is not None and sound in self.sounds:
+			return self.sounds[sound]
+		return self.default
+
+
+class RoleIndex:
+	def __init__(self, allowed_roles=(), guild_rules=None, sound_rules=None):
+		self.allowed_roles = list(allowed_roles)
+		self.guild_rules = {int(guild_id): rules for guild_id, rules in (guild_rules or {}).items()}
+		self.sound_rules = dict(sound_rules or {})
+		self._guilds = {}
+		self._lock = threading.Lock()
+		self.checks = 0
+		self.denied = 0
+		self.rebuilds = 0
+
+	@staticmethod
+	def _resolve(guild, names):
+		if not names:
+			return ANYONE
+		names = set(names)
+		return frozenset(role.id for role in guild.roles if role.name in names)
+
+	def rebuild_guild(self, guild):
+		"""Resolve every configured role name for `guild`; call when its roles change."""
+		rules = self.guild_rules.get(guild.id, {})
+		default = self._resolve(guild, rules.get("roles", self.allowed_roles))
+		sound_names = {**self.sound_rules, **rules.get("sounds", {})}
+		sounds = {sound: self._resolve(guild, names) for sound, names in sound_names.items()}
+		entry = GuildRoles(default, sounds)
+		with self._lock:
+			self._guilds[guild.id] = entry
+			self.rebuilds += 1
+		return entry
+
+	def remove_guild(self, guild_id):
+		with self._lock:
+			self._guilds.pop(guild_id, None)
+
+	def check(self, member, sound=None):
+		"""True if `member` may control the bot (and play `sound`, when given)."""
+		self.checks += 1
+		guild = getattr(member, "guild", None)
+		if guild is None:
+			# Not a guild member (e.g. a DM), so only an unrestricted default lets them through
+			if not self.allowed_roles:
+				return True
+			self.denied += 1
+			return False
+
+		entry = self._guilds.get(guild.id) or self.rebuild_guild(guild)
+		allowed = entry.allowed_for(sound)
+		if allowed is ANYONE or any(role.id in allowed for role in member.roles):
+			return True
+		self.denied += 1
+		return False
+
+	def stats(self):
+		with self._lock:
+			return {
+				"guilds": len(self._guilds),
+				"checks": self.checks,
+				"denied": self.denied,
+				"rebuilds": self.rebuilds,
+			}
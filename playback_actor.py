@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""One playback actor per guild: a command queue in front of each voice client.
+
+Button clicks, slash commands and web requests for the same guild used to
+run concurrently. Each one built its source, then stopped and restarted the
+voice client on its own. A burst of clicks restarted playback once per
+click, and a cold clip that finished loading late could replace a newer
+click's sound. Now every play and stop for a guild is a command on that
+guild's actor. A single task runs the commands in order, so building a
+source, stopping the old one and starting the new one never interleave
+with another command for the same guild.
+
+Bursts are coalesced within `window` seconds of the last play that started:
+
+- last-writer-wins (default): the first play after a quiet period starts at
+  once. Plays that arrive within the window replace each other, and only
+  the newest starts when the window ends. A newer play also supersedes one
+  whose source is still being built.
+- reject-while-playing: a play is rejected while the guild is playing, or
+  while it has a play queued or being built.
+
+A stop is never delayed, and it drops every play still waiting. Plays
+submitted as immediate, such as broadcasts and the arming of scheduled
+starts, skip the window, because they have to start with other guilds. They
+still queue behind the command the actor is running, and the policy still
+applies to them. Each command resolves to (status, result), where status is
+"played", "stopped", "coalesced" or "rejected". Errors from building the
+source, such as an unknown sound, are raised to whoever submitted the play.
+
+	status, seconds = await actors.play(guild.id, "rally-30", prepare, trace)
+	status, _ = await actors.play(guild.id, "broadcast", prepare, immediate=True)
+	status, was_playing = await actors.stop(guild.id)
+"""
+import asyncio
+import collections
+import time
+
+LAST_WRITER_WINS = "last-writer-wins"
+REJECT_WHILE_PLAYING = "reject-while-playing"
+POLICIES = (LAST_WRITER_WINS, REJECT_WHILE_PLAYING)
+DEFAULT_WINDOW_MS = 300
+COUNTERS = ("submitted", "played", "stopped", "coalesced", "rejected", "failed", "interrupted")
+
+
+class PlaybackCommand:
+	def __init__(self, kind, description, prepare=None, trace=None, immediate=False):
+		self.kind = kind  # "play" or "stop"
+		self.description = description
+		self.prepare = prepare  # plays: async () -> (source, result)
+		self.trace = trace
+		self.immediate = immediate  # plays: start without waiting out the coalescing window
+		self.future = asyncio.get_running_loop().create_future()
+		self.submitted = time.monotonic()
+		self.superseded = False
+
+
+class PlaybackActor:
+	def __init__(self, guild_id, voice_client_for, window=DEFAULT_WINDOW_MS / 1000, policy=LAST_WRITER_WINS):
+		self.guild_id = guild_id
+		self.voice_client_for = voice_client_for
+		self.window = window
+		self.policy = policy
+		self.queue = collections.deque()
+		self.current = None
+		self.task = None
+		self.last_play = float("-inf")
+		# Wakes a run loop that is waiting out the window, so an immediate play behind it starts now
+		self.wakeup = asyncio.Event()
+		self.counters = collections.Counter()
+		self.dequeued = 0
+		self.wait_seconds = 0.0
+		self.max_wait_seconds = 0.0
+
+	def is_busy(self):
+		if self.current is not None or any(command.kind == "play" for command in self.queue):
+			return True
+		voice_client = self.voice_client_for(self.guild_id)
+		return voice_client is not None and voice_client.is_playing()
+
+	def submit(self, command):
+		"""Queue `command` and return the future it resolves."""
+		self.counters["submitted"] += 1
+		if command.kind == "play" and self.policy == REJECT_WHILE_PLAYING and self.is_busy():
+			self._finish(command, "rejected")
+			return command.future
+		if command.kind == "stop" or self.policy == LAST_WRITER_WINS:
+			self._supersede_plays()
+		self.queue.append(command)
+		self.wakeup.set()
+		if self.task is None or self.task.done():
+			self.task = asyncio.get_running_loop().create_task(self._run(), name=f"playback-{self.guild_id}")
+		return command.future
+
+	def _supersede_plays(self):
+		for command in [command for command in self.queue if command.kind == "play"]:
+			self.queue.remove(command)
+			self._finish(command, "coalesced")
+		# A play whose source is still being built is dropped once it is ready
+		if self.current is not None and self.current.kind == "play":
+			self.current.superseded = True
+
+	def _finish(self, command, status, result=None):
+		self.counters[status] += 1
+		if not command.future.done():
+			command.future.set_result((status, result))
+
+	async def _run(self):
+		while self.queue:
+			command = self.queue[0]
+			if command.kind == "play" and not command.immediate:
+				delay = self.last_play + self.window - time.monotonic()
+				if delay > 0:
+					# Commands that arrive meanwhile may replace this one, so look again after the wait
+					self.wakeup.clear()
+					try:
+						await asyncio.wait_for(self.wakeup.wait(), delay)
+					except asyncio.TimeoutError:
+						pass
+					continue
+			self.queue.popleft()
+			waited = time.monotonic() - command.submitted
+			self.dequeued += 1
+			self.wait_seconds += waited
+			self.max_wait_seconds = max(self.max_wait_seconds, waited)
+			self.current = command
+			try:
+				if command.kind == "play":
+					await self._play(command)
+				else:
+					self._stop(command)
+			except Exception as e:
+				self.counters["failed"] += 1
+				if not command.future.done():
+					command.future.set_exception(e)
+			finally:
+				self.current = None
+
+	async def _play(self, command):
+		trace = command.trace
+		if trace is not None:
+			trace.mark("dequeued")
+		source, result = await command.prepare()
+		if trace is not None:
+			trace.mark("source_built")
+		if command.superseded:
+			source.cleanup()
+			self._finish(command, "coalesced")
+			return
+
+		voice_client = self.voice_client_for(self.guild_id)
+		if voice_client is None:
+			raise ValueError("Bot is not connected to a voice channel.")
+		if voice_client.is_playing():
+			voice_client.stop()
+			self.counters["interrupted"] += 1
+		if trace is not None:
+			trace.mark("stop_previous")
+		voice_client.play(trace.wrap(source) if trace is not None else source)
+		self.last_play = time.monotonic()
+		self._finish(command, "played", result)
+
+	def _stop(self, command):
+		voice_client = self.voice_client_for(self.guild_id)
+		was_playing = voice_client is not None and voice_client.is_playing()
+		if was_playing:
+			voice_client.stop()
+		# A stop ends the burst, so the next play starts right away
+		self.last_play = float("-inf")
+		self._finish(command, "stopped", was_playing)
+
+	@property
+	def stops(self):
+		"""How many stops this guild has run; a scheduled start armed later checks it did not change."""
+		return self.counters["stopped"]
+
+	def stats(self):
+		return {
+			"queue_depth": len(self.queue) + (1 if self.current is not None else 0),
+			**{name: self.counters[name] for name in COUNTERS},
+			# Time from submission until the actor started the command
+			"wait_ms_mean": round(self.wait_seconds / self.dequeued * 1000, 3) if self.dequeued else None,
+			"wait_ms_max": round(self.max_wait_seconds * 1000, 3),
+		}
+
+
+class PlaybackActors:
+	"""The actors of every guild, created on first use, with one policy and window for all."""
+
+	def __init__(self, voice_client_for, window=DEFAULT_WINDOW_MS / 1000, policy=LAST_WRITER_WINS):
+		if policy not in POLICIES:
+			raise ValueError(f"Unknown playback policy '{policy}', expected one of {', '.join(POLICIES)}")
+		self.voice_client_for = voice_client_for
+		self.window = window
+		self.policy = policy
+		self.actors = {}
+
+	def actor(self, guild_id):
+		actor = self.actors.get(guild_id)
+		if actor is None:
+			actor = self.actors[guild_id] = PlaybackActor(guild_id, self.voice_client_for, self.window, self.policy)
+		return actor
+
+	async def play(self, guild_id, description, prepare, trace=None, immediate=False):
+		"""Play the source `prepare()` builds in `guild_id`; returns (status, result)."""
+		return await self.actor(guild_id).submit(PlaybackCommand("play", description, prepare, trace, immediate))
+
+	async def stop(self, guild_id):
+		"""Stop whatever `guild_id` plays and drop its waiting plays; returns ("stopped", was_playing)."""
+		return await self.actor(guild_id).submit(PlaybackCommand("stop", "stop"))
+
+	def remove(self, guild_id):
+		"""Forget a guild; its waiting plays resolve as coalesced and its task ends on its own."""
+		actor = self.actors.pop(guild_id, None)
+		if actor is not None:
+			actor._supersede_plays()
+
+	def stats(self):
+		guilds = {str(guild_id): actor.stats() for guild_id, actor in self.actors.items()}
+		return {
+			"policy": self.policy,
+			"window_ms": round(self.window * 1000, 3),
+			**{name: sum(stats[name] for stats in guilds.values()) for name in ("queue_depth",) + COUNTERS},
+			"guilds": guilds,
+		}
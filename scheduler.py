@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""Wall-clock scheduled, synchronized clip starts across many guilds.
+
+A schedule is armed shortly before its start time: every target guild starts
+playing a GatedSource that sends Opus silence while it waits, so the audio
+player threads and the voice sockets are already running. Each gate releases
+on the shared monotonic clock (time.perf_counter, the same clock the audio
+player paces itself with).
+
+Arming goes through the guild's playback actor as an immediate play, so it is
+ordered with the guild's other plays and stops. A stop or a later play in the
+guild, before the release, cancels the schedule there; so does a stop between
+scheduling and arming.
+
+Two timings are reported per guild, both relative to the release instant:
+
+- release_ms: when the gate let the first real frame through. The gate sleeps
+  to the release itself, so this only shows a player thread that ran late.
+- skew_ms: when the voice client handed that frame to its UDP socket, which
+  also counts everything between the read and the send. The spread of these
+  across guilds is the start alignment this process achieved. The network
+  path to Discord comes after it and is not measured.
+"""
+import asyncio
+import collections
+import itertools
+import logging
+import time
+
+import discord
+from discord.opus import OPUS_SILENCE
+
+from clip_cache import OpusFrameSource
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARM_SECONDS = 2.0
+# Finished, failed and cancelled schedules are kept this long, and at most this many, for the API
+DEFAULT_RETENTION_SECONDS = 3600
+DEFAULT_MAX_FINISHED = 100
+FINISHED = ("started", "cancelled", "failed")
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+
+class GatedSource(discord.AudioSource):
+	"""Sends silence until `release_at` (perf_counter seconds), then plays the wrapped source."""
+
+	def __init__(self, source, release_at):
+		self.source = source
+		self.release_at = release_at
+		self.started_at = None
+		self.sent_at = None
+		self._unwatch = None
+
+	def read(self):
+		if self.started_at is None:
+			remaining = self.release_at - time.perf_counter()
+			if remaining > FRAME_SECONDS:
+				return OPUS_SILENCE
+			# Within one frame of the release: sleep to the exact instant so the
+			# first real packet is not quantized to this player's 20 ms grid
+			if remaining > 0:
+				time.sleep(remaining)
+			self.started_at = time.perf_counter()
+		return self.source.read()
+
+	def is_opus(self):
+		return True
+
+	def watch_sends(self, voice_client):
+		"""Timestamp the first real frame when `voice_client` sends it; call before play().
+
+		The audio player looks up send_audio_packet once when it starts, so the
+		wrapper stays in place for this playback and is removed on cleanup.
+		"""
+		send = getattr(voice_client, "send_audio_packet", None)
+		if send is None:
+			return
+
+		def send_audio_packet(data, *args, **kwargs):
+			send(data, *args, **kwargs)
+			if self.sent_at is None and self.started_at is not None:
+				self.sent_at = time.perf_counter()
+
+		voice_client.send_audio_packet = send_audio_packet
+		self._unwatch = lambda: vars(voice_client).pop("send_audio_packet", None)
+
+	def cleanup(self):
+		if self._unwatch is not None:
+			self._unwatch()
+			self._unwatch = None
+		self.source.cleanup()
+
+	@property
+	def release_ms(self):
+		if self.started_at is None:
+			return None
+		return (self.started_at - self.release_at) * 1000
+
+	@property
+	def skew_ms(self):
+		if self.sent_at is None:
+			return None
+		return (self.sent_at - self.release_at) * 1000
+
+
+class ScheduledStart:
+	def __init__(self, schedule_id, sound, guild_ids, start_at, stops):
+		self.id = schedule_id
+		self.sound = sound
+		self.guild_ids = list(guild_ids)
+		# Each guild's actor stop count when scheduled; a stop since then cancels the guild
+		self.stops = stops
+		self.start_at = start_at
+		# Converted once so every gate shares exactly the same release instant
+		self.release_at = time.perf_counter() + (start_at - time.time())
+		self.status = "pending"
+		self.gates = {}
+		self.errors = {}
+		self.task = None
+		self.finished_at = None
+
+	def to_dict(self):
+		skews = {str(guild_id): gate.skew_ms for guild_id, gate in self.gates.items()}
+		measured = [skew for skew in skews.values() if skew is not None]
+		return {
+			"id": self.id,
+			"sound": self.sound,
+			"start_at": self.start_at,
+			"status": self.status,
+			"guilds": [str(guild_id) for guild_id in self.guild_ids],
+			"release_ms": {str(guild_id): gate.release_ms for guild_id, gate in self.gates.items()},
+			"skew_ms": skews,
+			"spread_ms": max(measured) - min(measured) if measured else None,
+			"errors": {str(guild_id): error for guild_id, error in self.errors.items()},
+		}
+
+
+class StartScheduler:
+	"""Creates, arms and tracks ScheduledStart objects, playing them through `playback_actors`."""
+
+	def __init__(self, clip_cache, playback_actors, arm_seconds=DEFAULT_ARM_SECONDS, retention_seconds=DEFAULT_RETENTION_SECONDS, max_finished=DEFAULT_MAX_FINISHED):
+		self.clip_cache = clip_cache
+		self.playback_actors = playback_actors
+		self.arm_seconds = arm_seconds
+		self.retention_seconds = retention_seconds
+		self.max_finished = max_finished
+		self.schedules = collections.OrderedDict()
+		self._ids = itertools.count(1)
+
+	def _finish(self, scheduled, status):
+		scheduled.status = status
+		scheduled.finished_at = time.monotonic()
+		self._prune()
+
+	def _prune(self):
+		"""Forget finished schedules older than the retention period, and the oldest beyond max_finished."""
+		now = time.monotonic()
+		finished = [scheduled for scheduled in self.schedules.values() if scheduled.finished_at is not None]
+		expired = [scheduled for scheduled in finished if now - scheduled.finished_at > self.retention_seconds]
+		excess = finished[:max(0, len(finished) - self.max_finished)]
+		for scheduled in expired + excess:
+			self.schedules.pop(scheduled.id, None)
+
+	async def schedule(self, sound, guild_ids, start_at):
+		"""Schedule `sound` in every guild of `guild_ids` to start at the unix timestamp `start_at`."""
+		if start_at - time.time() < FRAME_SECONDS:
+			raise ValueError("start time must be in the future")
+		# Make sure the clip is encoded before arming so arming itself is instant
+		await self.clip_cache.get(sound)
+
+		stops = {guild_id: self.playback_actors.actor(guild_id).stops for guild_id in guild_ids}
+		scheduled = ScheduledStart(next(self._ids), sound, guild_ids, start_at, stops)
+		self.schedules[scheduled.id] = scheduled
+		scheduled.task = asyncio.create_task(self._run(scheduled))
+		return scheduled
+
+	async def cancel(self, schedule_id):
+		scheduled = self.schedules.get(schedule_id)
+		if scheduled is None or scheduled.status in FINISHED:
+			return False
+		scheduled.task.cancel()
+		self._finish(scheduled, "cancelled")
+		# Stop the gates still sending silence; a guild already playing something else is left alone
+		for guild_id, gate in scheduled.gates.items():
+			voice_client = self.playback_actors.voice_client_for(guild_id)
+			if gate.started_at is None and voice_client is not None and voice_client.source is gate:
+				await self.playback_actors.stop(guild_id)
+		return True
+
+	async def _arm(self, scheduled, guild_id, clip):
+		"""Play a gate for `scheduled` in `guild_id` through its actor; returns None or why it was not armed."""
+		if self.playback_actors.actor(guild_id).stops != scheduled.stops[guild_id]:
+			return "Stopped before the start"
+
+		async def prepare():
+			gate = GatedSource(OpusFrameSource(clip.frames, clip.start_frame), scheduled.release_at)
+			voice_client = self.playback_actors.voice_client_for(guild_id)
+			if voice_client is not None:
+				gate.watch_sends(voice_client)
+			return gate, gate
+
+		try:
+			status, gate = await self.playback_actors.play(guild_id, f"schedule {scheduled.id} ({scheduled.sound})", prepare, immediate=True)
+		except Exception as e:
+			return str(e)
+		if status != "played":
+			return f"Not armed: {status}"
+		scheduled.gates[guild_id] = gate
+		return None
+
+	async def _run(self, scheduled):
+		arm_in = scheduled.release_at - self.arm_seconds - time.perf_counter()
+		if arm_in > 0:
+			await asyncio.sleep(arm_in)
+
+		try:
+			# The clip may have been removed, or fail to load, since it was scheduled
+			clip = await self.clip_cache.get(scheduled.sound)
+		except Exception as e:
+			for guild_id in scheduled.guild_ids:
+				scheduled.errors[guild_id] = f"Failed to load {scheduled.sound}: {e}"
+			logger.error(f"Failed to load {scheduled.sound} for schedule {scheduled.id}: {e}")
+			self._finish(scheduled, "failed")
+			return
+		errors = await asyncio.gather(*(self._arm(scheduled, guild_id, clip) for guild_id in scheduled.guild_ids))
+		for guild_id, error in zip(scheduled.guild_ids, errors):
+			if error is not None:
+				scheduled.errors[guild_id] = error
+				logger.error(f"Failed to arm schedule {scheduled.id} in guild {guild_id}: {error}")
+		if not scheduled.gates:
+			self._finish(scheduled, "failed")
+			return
+		scheduled.status = "armed"
+
+		# Wait past the release plus a couple of frames, then report the skew
+		await asyncio.sleep(max(0, scheduled.release_at - time.perf_counter()) + 3 * FRAME_SECONDS)
+		# A stop or another play in the guild before the release ended its gate early
+		for guild_id, gate in list(scheduled.gates.items()):
+			if gate.started_at is None:
+				del scheduled.gates[guild_id]
+				scheduled.errors[guild_id] = "Stopped before the start"
+		self._finish(scheduled, "started" if scheduled.gates else "cancelled")
+		report = ", ".join(f"{guild_id}: {gate.skew_ms:.2f}ms" for guild_id, gate in scheduled.gates.items() if gate.skew_ms is not None)
+		logger.info(f"Schedule {scheduled.id} ({scheduled.sound}) started, skew per guild: {report}")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Gapless playlists: an ordered list of clips and silences played as one source.
+
+A sequence such as `refill-in`, half a second of silence, then
+`countdown-en-30-0` is resolved to the cached Opus frames of each clip.
+Silences become runs of Opus silence frames. Everything is handed to a
+single FrameSequenceSource, so one item follows the next on the very next
+20 ms frame, with no stop() and no new source in between. Silences are
+exact to one frame.
+
+Items are sound names or silences. In text (the slash command and
+configured sequences) a silence is a duration such as "500ms" or "1.5s".
+In JSON it can also be {"silence": 1.5}, and a sound can be
+{"sound": "refill-in"}:
+
+	"sequences": {"rally-30": ["refill-in", "500ms", "countdown-en-30-0"]}
+"""
+import asyncio
+import re
+
+from discord.opus import OPUS_SILENCE
+
+from clip_cache import FRAME_LENGTH_MS, FrameSequenceSource
+
+MAX_ITEMS = 50
+MAX_SILENCE_SECONDS = 60
+SILENCE_PATTERN = re.compile(r"^(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>ms|s)$")
+
+
+def silence_frames(seconds):
+	if not 0 <= seconds <= MAX_SILENCE_SECONDS:
+		raise ValueError(f"Silences must be between 0 and {MAX_SILENCE_SECONDS} seconds, not {seconds}.")
+	return round(seconds * 1000 / FRAME_LENGTH_MS)
+
+
+def parse_item(item):
+	"""Turn one item into ("sound", name) or ("silence", frames)."""
+	if isinstance(item, dict):
+		if "silence" in item:
+			try:
+				return ("silence", silence_frames(float(item["silence"])))
+			except (TypeError, ValueError) as e:
+				raise ValueError(f"Invalid silence {item['silence']!r}: {str(e)}")
+		if "sound" in item:
+			return ("sound", str(item["sound"]))
+		raise ValueError(f"Sequence items need a 'sound' or a 'silence': {item!r}")
+	if not isinstance(item, str):
+		raise ValueError(f"Invalid sequence item {item!r}")
+	item = item.strip()
+	match = SILENCE_PATTERN.match(item)
+	if match:
+		value = float(match["value"])
+		return ("silence", silence_frames(value / 1000 if match["unit"] == "ms" else value))
+	return ("sound", item)
+
+
+def parse_sequence(items):
+	"""Parse a list of items, or a comma-separated string of them."""
+	if isinstance(items, str):
+		items = [item for item in items.split(",") if item.strip()]
+	if not isinstance(items, list) or not items:
+		raise ValueError("A sequence needs at least one item.")
+	if len(items) > MAX_ITEMS:
+		raise ValueError(f"A sequence can have at most {MAX_ITEMS} items.")
+	return [parse_item(item) for item in items]
+
+
+def sequence_sounds(parsed):
+	return [value for kind, value in parsed if kind == "sound"]
+
+
+def describe(parsed):
+	return ", ".join(value if kind == "sound" else f"{value * FRAME_LENGTH_MS}ms" for kind, value in parsed)
+
+
+class Sequencer:
+	def __init__(self, clip_cache, catalog, sequences=None):
+		self.clip_cache = clip_cache
+		self.catalog = catalog
+		# Configured sequences are parsed once; their sounds are checked when played, as files come and go
+		self.sequences = {name: parse_sequence(items) for name, items in (sequences or {}).items()}
+		self.played = 0
+
+	def resolve(self, items=None, name=None):
+		"""Parse `items`, or look up the configured sequence `name`, and check every sound exists."""
+		if name is not None:
+			if name not in self.sequences:
+				raise ValueError(f"Sequence '{name}' not found.")
+			parsed = self.sequences[name]
+		else:
+			parsed = parse_sequence(items)
+		missing = [sound for sound in sequence_sounds(parsed) if sound not in self.catalog]
+		if missing:
+			raise ValueError(f"Sound(s) not found: {', '.join(missing)}")
+		if not sequence_sounds(parsed):
+			raise ValueError("A sequence needs at least one sound.")
+		return parsed
+
+	async def build(self, parsed):
+		"""Return (source, seconds) playing every item of `parsed` back to back."""
+		sounds = list(dict.fromkeys(sequence_sounds(parsed)))
+		# Cold clips load concurrently; warm ones come straight from the cache
+		clips = dict(zip(sounds, await asyncio.gather(*(self.clip_cache.get(sound) for sound in sounds))))
+		parts = []
+		for kind, value in parsed:
+			if kind == "sound":
+				# Each clip starts at its first onset, so silences between items are exactly what was asked for
+				parts.append(clips[value].frames[clips[value].start_frame:])
+			elif value:
+				parts.append((OPUS_SILENCE,) * value)
+		self.played += 1
+		frames = sum(len(part) for part in parts)
+		return FrameSequenceSource(parts), frames * FRAME_LENGTH_MS / 1000
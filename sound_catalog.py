@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Catalog of the clips in sound-clips/, built once and refreshed incrementally.
+
+The catalog replaces per-request os.listdir/os.path.isfile calls. Each clip's
+size, mtime, sha256, duration and numeric sort key are computed once, when
+the clip is first seen or changes on disk. watch() polls file mtimes off the
+event loop and notifies registered listeners with what was added, removed or
+changed, so Discord control views and the web UI can pick up new clips
+without a restart.
+
+A clip can exist as .opus, .mp3 or both. The Ogg/Opus file is preferred:
+its packets are played without transcoding (see ogg_opus.py).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import struct
+
+import ogg_opus
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_SECONDS = 5.0
+CLIP_EXTENSIONS = (".opus", ".mp3")  # most preferred first
+
+# MPEG audio layer III tables, indexed by [version][index]
+MP3_BITRATES = {
+	1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+	2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+
+def extract_number(filename):
+	"""Extract numerical values from a filename for proper sorting."""
+	match = re.search(r'\d+', filename)
+	return int(match.group()) if match else float('inf')
+
+
+def clip_path(directory, name):
+	"""Path of the preferred file for clip `name`: the .opus if there is one, else the .mp3."""
+	for extension in CLIP_EXTENSIONS[:-1]:
+		path = os.path.join(directory, f"{name}{extension}")
+		if os.path.isfile(path):
+			return path
+	return os.path.join(directory, f"{name}{CLIP_EXTENSIONS[-1]}")
+
+
+def clip_duration(path):
+	if path.endswith(".opus"):
+		return ogg_opus.duration(path)
+	return mp3_duration(path)
+
+
+def mp3_duration(path):
+	"""Duration in seconds from the MP3 headers (Xing/Info frame count, or CBR bitrate), or None."""
+	with open(path, "rb") as mp3_file:
+		data = mp3_file.read(64 * 1024)
+	file_size = os.path.getsize(path)
+
+	offset = 0
+	if data[:3] == b"ID3" and len(data) >= 10:
+		size = data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9]
+		offset = 10 + size
+		if offset + 4 > len(data):
+			with open(path, "rb") as mp3_file:
+				mp3_file.seek(offset)
+				data = mp3_file.read(64 * 1024)
+			file_size -= offset
+			offset = 0
+
+	while offset + 4 <= len(data):
+		if data[offset] == 0xFF and data[offset + 1] & 0xE0 == 0xE0:
+			header = struct.unpack(">I", data[offset:offset + 4])[0]
+			version_bits = (header >> 19) & 3
+			layer_bits = (header >> 17) & 3
+			bitrate_index = (header >> 12) & 15
+			rate_index = (header >> 10) & 3
+			if version_bits != 1 and layer_bits == 1 and 0 < bitrate_index < 15 and rate_index < 3:
+				break
+		offset += 1
+	else:
+		return None
+
+	version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+	sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+	bitrate = MP3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+	samples_per_frame = 1152 if version == 1 else 576
+	mono = (header >> 6) & 3 == 3
+	side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+
+	xing = offset + 4 + side_info
+	if data[xing:xing + 4] in (b"Xing", b"Info") and len(data) >= xing + 12:
+		flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+		if flags & 1:
+			frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+			return frames * samples_per_frame / sample_rate
+	return (file_size - offset) * 8 / bitrate
+
+
+def file_digest(path):
+	digest = hashlib.sha256()
+	with open(path, "rb") as sound_file:
+		for chunk in iter(lambda: sound_file.read(1 << 16), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+class SoundInfo:
+	def __init__(self, name, path, size, mtime):
+		self.name = name
+		self.path = path
+		self.size = size
+		self.mtime = mtime
+		self.sha256 = file_digest(path)
+		self.sort_key = extract_number(name)
+		self.format = os.path.splitext(path)[1][1:]
+		try:
+			self.duration = clip_duration(path)
+		except (OSError, ValueError, StopIteration, struct.error):
+			self.duration = None
+
+	def to_dict(self):
+		return {
+			"name": self.name,
+			"size": self.size,
+			"duration": round(self.duration, 3) if self.duration is not None else None,
+			"sha256": self.sha256,
+			"format": self.format,
+		}
+
+
+class SoundCatalog:
+	def __init__(self, directory="sound-clips", extensions=CLIP_EXTENSIONS):
+		self.directory = directory
+		self.extensions = extensions
+		self.sounds = {}
+		self.listeners = []
+		self._names = []
+
+	def __contains__(self, name):
+		return name in self.sounds
+
+	def __len__(self):
+		return len(self.sounds)
+
+	def get(self, name):
+		return self.sounds.get(name)
+
+	def names(self):
+		"""Sound names in numeric order, precomputed on every change."""
+		return list(self._names)
+
+	def sort_key(self, name):
+		info = self.sounds.get(name)
+		return info.sort_key if info is not None else extract_number(name)
+
+	def add_listener(self, callback):
+		"""Register `async callback(added, removed, changed)`, called after each change."""
+		self.listeners.append(callback)
+
+	def scan(self):
+		"""Blocking: diff the directory against the catalog and apply the changes.
+
+		Returns (added, removed, changed) lists of names. Unchanged files are only stat()ed.
+		"""
+		seen = {}
+		with os.scandir(self.directory) as entries:
+			for entry in entries:
+				stem, extension = os.path.splitext(entry.name)
+				if extension not in self.extensions or not entry.is_file():
+					continue
+				# With both an .opus and an .mp3, the earlier extension in the list wins
+				if stem in seen and self.extensions.index(os.path.splitext(seen[stem][0])[1]) < self.extensions.index(extension):
+					continue
+				stat = entry.stat()
+				seen[stem] = (entry.path, stat.st_size, stat.st_mtime_ns)
+
+		added, removed, changed = [], [], []
+		for name, (path, size, mtime) in seen.items():
+			info = self.sounds.get(name)
+			if info is None:
+				added.append(name)
+			elif (info.path, info.size, info.mtime) != (path, size, mtime):
+				changed.append(name)
+			else:
+				continue
+			try:
+				self.sounds[name] = SoundInfo(name, path, size, mtime)
+			except OSError as e:
+				# Most likely still being copied in; it will be picked up on the next scan
+				logger.warning(f"Could not read sound {name}: {e}")
+				self.sounds.pop(name, None)
+				(added if info is None else changed).remove(name)
+		for name in list(self.sounds):
+			if name not in seen:
+				del self.sounds[name]
+				removed.append(name)
+
+		if added or removed or changed:
+			self._names = sorted(self.sounds, key=lambda name: (self.sounds[name].sort_key, name))
+		return added, removed, changed
+
+	async def refresh(self):
+		"""Rescan off the event loop and notify listeners if anything changed."""
+		loop = asyncio.get_running_loop()
+		added, removed, changed = await loop.run_in_executor(None, self.scan)
+		if added or removed or changed:
+			logger.info(f"Sound catalog changed: added {added}, removed {removed}, changed {changed}")
+			for callback in self.listeners:
+				try:
+					await callback(added, removed, changed)
+				except Exception as e:
+					logger.error(f"Sound catalog listener failed: {e}")
+		return added, removed, changed
+
+	async def watch(self, interval=DEFAULT_POLL_SECONDS):
+		while True:
+			await asyncio.sleep(interval)
+			try:
+				await self.refresh()
+			except OSError as e:
+				logger.error(f"Failed to rescan {self.directory}: {e}")
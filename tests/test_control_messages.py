@@ -0,0 +1,87 @@
+import asyncio
+import json
+import types
+
+from discord.components import _component_factory
+
+from control_messages import ControlMessageStore, ControlReconciler, is_control_message
+
+BOT = object()
+
+
+def buttons(*custom_ids):
+	"""Components as discord.py parses them from a message payload."""
+	return [_component_factory({"type": 1, "components": [{"type": 2, "style": 1, "custom_id": custom_id, "label": custom_id} for custom_id in custom_ids]})]
+
+
+def message(message_id, author=BOT, components=()):
+	return types.SimpleNamespace(id=message_id, author=author, components=list(components))
+
+
+class Channel:
+	"""Newest message first, like channel.history(); records edits and sends."""
+
+	def __init__(self, history):
+		self.id = 42
+		self.history_messages = history
+		self.edited = []
+		self.sent = []
+
+	async def history(self, limit):
+		for item in self.history_messages[:limit]:
+			yield item
+
+	def get_partial_message(self, message_id):
+		async def edit(**kwargs):
+			self.edited.append(message_id)
+		return types.SimpleNamespace(id=message_id, edit=edit)
+
+	async def send(self, content, view):
+		self.sent.append(content)
+		return types.SimpleNamespace(id=1000 + len(self.sent))
+
+
+def test_control_messages_are_recognized_by_their_buttons():
+	assert is_control_message(message(1, components=buttons("join_button", "leave_button", "stop_button", "sound_refill-in")))
+	assert not is_control_message(message(1, components=buttons("poll_yes", "poll_no")))
+	assert not is_control_message(message(1))
+
+
+def reconcile(tmp_path, history):
+	store = ControlMessageStore(str(tmp_path / "control-messages.json"))
+	reconciler = ControlReconciler(store, requests_per_second=1000)
+	channel = Channel(history)
+	report = asyncio.run(reconciler.reconcile([channel], ["a", "b"], lambda chunk: None, author=BOT))
+	return channel, report, store
+
+
+def test_first_run_adopts_the_newest_control_message(tmp_path):
+	history = [
+		message(3, author=object(), components=buttons("join_button")),
+		message(2, components=buttons("poll_yes")),
+		message(1, components=buttons("join_button", "sound_a")),
+	]
+	channel, report, store = reconcile(tmp_path, history)
+	assert channel.edited == [1]
+	assert (report["edited"], report["sent"]) == (1, 0)
+	# Saved on the executor, with the adopted message and its new hash
+	saved = json.loads((tmp_path / "control-messages.json").read_text())
+	assert [record["id"] for record in saved["42"]] == [1]
+	assert saved["42"][0]["hash"] is not None
+
+
+def test_other_bot_messages_are_never_adopted(tmp_path):
+	history = [message(2, components=buttons("poll_yes")), message(1)]
+	channel, report, _ = reconcile(tmp_path, history)
+	assert channel.edited == []
+	assert (report["edited"], report["sent"]) == (0, 1)
+
+
+def test_a_later_save_is_not_overwritten_by_an_earlier_one(tmp_path):
+	store = ControlMessageStore(str(tmp_path / "control-messages.json"))
+	store.set(1, [{"id": 10, "hash": "old"}])
+	earlier = store._snapshot()
+	store.set(1, [{"id": 10, "hash": "new"}])
+	store.save()
+	store._write(*earlier)
+	assert ControlMessageStore(store.path).get(1) == [{"id": 10, "hash": "new"}]
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+import control_plane
+from control_plane import ShardRouter
+
+
+def test_guilds_follow_their_shard_round_robin():
+	router = ShardRouter(1, shard_count=4, processes=2)
+	assert router.shard_ids == [1, 3]
+	# Discord puts a guild on shard (guild_id >> 22) % shard_count
+	assert [router.owner((shard << 22) + 7) for shard in range(6)] == [0, 1, 0, 1, 0, 1]
+	assert router.is_local(3 << 22)
+	assert not router.is_local(2 << 22)
+	shards = [control_plane.worker_shards(worker, 8, 3) for worker in range(3)]
+	assert sorted(sum(shards, [])) == list(range(8))
+
+
+def test_worker_address():
+	assert control_plane.worker_address("unix:tmp-data/control-{worker}.sock", 2) == ("unix", "tmp-data/control-2.sock")
+	assert control_plane.worker_address("unix:tmp-data/control", 2) == ("unix", "tmp-data/control-2")
+	assert control_plane.worker_address("tcp:127.0.0.1:6100", 3) == ("tcp", "127.0.0.1", 6103)
+	assert control_plane.worker_address("tcp::6100", 0) == ("tcp", "127.0.0.1", 6100)
+	with pytest.raises(ValueError, match="Invalid control plane address"):
+		control_plane.worker_address("http://localhost:6100", 0)
+
+
+@pytest.mark.parametrize("worker, shard_count, processes, message", [
+	(2, 4, 2, "out of range"),
+	(-1, 4, 2, "out of range"),
+	(0, 1, 2, "cannot be split"),
+])
+def test_router_rejects_impossible_layouts(worker, shard_count, processes, message):
+	with pytest.raises(ValueError, match=message):
+		ShardRouter(worker, shard_count, processes)
+
+
+def run_workers(tmp_path, test, processes=2, timeout=1.0, listening=None):
+	"""Run `test(routers)` with a router per worker, each serving the handlers below unless left out of `listening`."""
+	async def echo(args):
+		return {"args": args}
+
+	async def fail(args):
+		raise LookupError("Guild not found")
+
+	async def slow(args):
+		await asyncio.sleep(args)
+		return args
+
+	async def main():
+		address = f"unix:{tmp_path}/control-{{worker}}.sock"
+		handlers = {"echo": echo, "fail": fail, "slow": slow}
+		routers = [ShardRouter(worker, 4, processes, address, handlers, timeout) for worker in range(processes)]
+		try:
+			for router in routers:
+				if listening is None or router.worker in listening:
+					await router.serve()
+			await test(routers)
+		finally:
+			for router in routers:
+				router.close()
+	asyncio.run(main())
+
+
+def test_routed_and_local_calls(tmp_path):
+	async def test(routers):
+		assert await routers[0].call(1, "echo", [1, "a"]) == {"args": [1, "a"]}
+		assert await routers[0].call(0, "echo", None) == {"args": None}
+		stats = routers[0].stats()
+		assert stats["calls"] == {"1": 1, "0": 1}
+		# The local call ran the handler directly rather than through the server
+		assert stats["served"] == {}
+		assert routers[1].stats()["served"] == {"echo": 1}
+	run_workers(tmp_path, test)
+
+
+def test_remote_errors_come_back_as_runtime_errors(tmp_path):
+	async def test(routers):
+		with pytest.raises(RuntimeError, match="Guild not found"):
+			await routers[0].call(1, "fail")
+		with pytest.raises(RuntimeError, match="Unknown control plane operation 'reboot'"):
+			await routers[0].call(1, "reboot")
+		assert routers[1].stats()["serve_errors"] == {"fail": 1, "reboot": 1}
+		# The worker answered, so these are not counted as failures to reach it
+		assert routers[0].stats()["failures"] == {}
+		assert await routers[0].call(1, "echo", 1) == {"args": 1}
+	run_workers(tmp_path, test)
+
+
+def test_local_errors_are_raised_as_they_are(tmp_path):
+	async def test(routers):
+		with pytest.raises(LookupError):
+			await routers[0].call(0, "fail")
+	run_workers(tmp_path, test)
+
+
+def test_worker_that_is_not_listening(tmp_path):
+	async def test(routers):
+		with pytest.raises(OSError):
+			await routers[0].call(1, "echo")
+		assert routers[0].stats()["failures"] == {"1": 1}
+	run_workers(tmp_path, test, listening={0})
+
+
+def test_timeout_counts_as_a_failure_and_the_connection_stays_usable(tmp_path):
+	async def test(routers):
+		with pytest.raises(asyncio.TimeoutError):
+			await routers[0].call(1, "slow", 0.5)
+		assert routers[0].stats()["failures"] == {"1": 1}
+		assert await routers[0].call(1, "slow", 0) == 0
+	run_workers(tmp_path, test, timeout=0.1)
+
+
+def test_concurrent_calls_are_answered_in_completion_order(tmp_path):
+	async def test(routers):
+		finished = []
+
+		async def call(delay):
+			finished.append(await routers[0].call(1, "slow", delay))
+
+		await asyncio.gather(call(0.1), call(0))
+		assert finished == [0, 0.1]
+	run_workers(tmp_path, test)
+
+
+def test_gather_returns_each_workers_result_or_exception(tmp_path):
+	async def test(routers):
+		results = await routers[0].gather("echo", "x")
+		assert [worker for worker, _ in results] == [0, 1, 2]
+		assert results[0][1] == results[1][1] == {"args": "x"}
+		assert isinstance(results[2][1], OSError)
+	run_workers(tmp_path, test, processes=3, listening={0, 1})
@@ -0,0 +1,155 @@
+import datetime
+import json
+import os
+
+import pytest
+
+from log_archive import LogArchive, INDEX_RECORD, SEVERITY_CODES, segment_name
+
+START = datetime.datetime(2026, 1, 1, 18, 0, 0)
+
+
+def entry(n, category="play_sound", severity="info"):
+	return {"timestamp": (START + datetime.timedelta(seconds=n)).isoformat(), "message": f"entry {n}", "category": category, "severity": severity}
+
+
+def archive_with(directory, count, **options):
+	archive = LogArchive(str(directory), **options)
+	for n in range(count):
+		archive.append(entry(n, "voice_pool" if n % 3 == 0 else "play_sound", "warning" if n % 4 == 0 else "info"))
+	archive.flush()
+	return archive
+
+
+def messages(entries):
+	return [entry["message"] for entry in entries]
+
+
+def test_entries_survive_a_reopen(tmp_path):
+	archive_with(tmp_path, 5).close()
+	archive = LogArchive(str(tmp_path))
+	assert archive.next_id == 5
+	assert archive.append(entry(5)) == 5
+	archive.flush()
+	entries = archive.query()
+	assert [entry["id"] for entry in entries] == [0, 1, 2, 3, 4, 5]
+	assert messages(entries)[-1] == "entry 5"
+	archive.close()
+
+
+def test_index_records_point_at_their_lines(tmp_path):
+	archive = archive_with(tmp_path, 3)
+	archive.close()
+	name = segment_name(0)
+	with open(tmp_path / f"{name}.idx", "rb") as index_file:
+		index = index_file.read()
+	log = (tmp_path / f"{name}.log").read_bytes()
+	assert len(index) == 3 * INDEX_RECORD.size
+	categories = json.loads((tmp_path / "categories.json").read_text())
+	for position in range(3):
+		log_id, timestamp, offset, length, category, severity = INDEX_RECORD.unpack_from(index, position * INDEX_RECORD.size)
+		line = json.loads(log[offset:offset + length])
+		assert log_id == line["id"] == position
+		assert timestamp == datetime.datetime.fromisoformat(line["timestamp"]).timestamp()
+		assert category == categories[line["category"]]
+		assert severity == SEVERITY_CODES[line["severity"]]
+
+
+def test_a_crash_mid_write_loses_only_the_unfinished_entry(tmp_path):
+	archive_with(tmp_path, 4).close()
+	name = segment_name(0)
+	# Half a line and half an index record, as a crash during the next flush would leave them
+	with open(tmp_path / f"{name}.log", "ab") as log_file:
+		log_file.write(b'{"id": 4, "mess')
+	with open(tmp_path / f"{name}.idx", "ab") as index_file:
+		index_file.write(b"\x04\x00\x00")
+
+	archive = LogArchive(str(tmp_path))
+	assert archive.next_id == 4
+	assert os.path.getsize(tmp_path / f"{name}.idx") == 4 * INDEX_RECORD.size
+	archive.append(entry(4))
+	archive.flush()
+	assert messages(archive.query()) == ["entry 0", "entry 1", "entry 2", "entry 3", "entry 4"]
+	archive.close()
+
+
+def test_a_line_without_its_index_record_is_dropped(tmp_path):
+	archive_with(tmp_path, 2).close()
+	name = segment_name(0)
+	# The log is written before the index, so a crash between them leaves a whole line with no record
+	with open(tmp_path / f"{name}.log", "ab") as log_file:
+		log_file.write(json.dumps(dict(entry(2), id=2)).encode() + b"\n")
+
+	archive = LogArchive(str(tmp_path))
+	assert archive.next_id == 2
+	archive.append(entry(9))
+	archive.flush()
+	assert messages(archive.query()) == ["entry 0", "entry 1", "entry 9"]
+	archive.close()
+
+
+def test_segments_rotate_and_queries_span_them(tmp_path):
+	archive = archive_with(tmp_path, 20, segment_bytes=500)
+	assert len(archive.segments) > 2
+	assert archive.segments[0] == 0
+	assert [entry["id"] for entry in archive.query()] == list(range(20))
+	archive.close()
+	# Reopening continues in the newest segment
+	archive = LogArchive(str(tmp_path), segment_bytes=500)
+	assert archive.next_id == 20
+	archive.close()
+
+
+def test_after_id_pages_through_every_segment(tmp_path):
+	archive = archive_with(tmp_path, 23, segment_bytes=500)
+	pages, after_id = [], None
+	while True:
+		page = archive.query(after_id=after_id, limit=5)
+		pages.append([entry["id"] for entry in page])
+		# Like /api/logs/history: a full page means there may be more
+		if len(page) < 5:
+			break
+		after_id = page[-1]["id"]
+	assert pages == [list(range(n, min(n + 5, 23))) for n in range(0, 25, 5)]
+	archive.close()
+
+
+def test_filters(tmp_path):
+	archive = archive_with(tmp_path, 12, segment_bytes=500)
+	assert [entry["id"] for entry in archive.query(category="voice_pool")] == [0, 3, 6, 9]
+	assert [entry["id"] for entry in archive.query(severity="warning")] == [0, 4, 8]
+	assert [entry["id"] for entry in archive.query(category="play_sound", severity="warning")] == [4, 8]
+	since = (START + datetime.timedelta(seconds=5)).timestamp()
+	until = (START + datetime.timedelta(seconds=7)).timestamp()
+	assert [entry["id"] for entry in archive.query(since=since, until=until)] == [5, 6, 7]
+	assert archive.query(category="unknown") == []
+	archive.close()
+
+
+def test_unflushed_entries_are_not_returned(tmp_path):
+	archive = LogArchive(str(tmp_path))
+	archive.append(entry(0))
+	assert archive.query() == []
+	assert archive.stats()["pending"] == 1
+	archive.flush()
+	assert len(archive.query()) == 1
+	archive.close()
+
+
+def test_retention_deletes_the_oldest_segments(tmp_path):
+	archive = archive_with(tmp_path, 40, segment_bytes=500, max_bytes=1500)
+	assert archive.segments[0] > 0
+	assert not (tmp_path / f"{segment_name(0)}.log").exists()
+	ids = [entry["id"] for entry in archive.query()]
+	assert ids == list(range(archive.segments[0], 40))
+	archive.close()
+
+
+@pytest.mark.parametrize("count", [0, 1])
+def test_empty_and_single_entry_archives(tmp_path, count):
+	archive = archive_with(tmp_path, count)
+	assert len(archive.query()) == count
+	archive.close()
+	reopened = LogArchive(str(tmp_path))
+	assert reopened.next_id == count
+	reopened.close()
@@ -0,0 +1,74 @@
+import pytest
+
+from log_store import LogRing
+
+
+def entry(n, category="play_sound", severity="info"):
+	return {"message": f"entry {n}", "category": category, "severity": severity}
+
+
+def messages(entries):
+	return [entry["message"] for entry in entries]
+
+
+def test_ids_are_assigned_in_order():
+	ring = LogRing(4)
+	assert [ring.append(entry(n)) for n in range(3)] == [0, 1, 2]
+	assert ring.last_id == 2
+	assert ring.oldest_id == 0
+	assert len(ring) == 3
+	assert ring.get(1)["message"] == "entry 1"
+
+
+def test_wrapping_overwrites_the_oldest_entries():
+	ring = LogRing(4)
+	for n in range(10):
+		ring.append(entry(n))
+	assert len(ring) == 4
+	assert (ring.oldest_id, ring.last_id) == (6, 9)
+	assert messages(ring.since()) == ["entry 6", "entry 7", "entry 8", "entry 9"]
+	assert ring.get(5) is None
+	assert ring.get(10) is None
+	assert ring.get(6)["id"] == 6
+
+
+def test_since_returns_entries_after_an_id():
+	ring = LogRing(4)
+	for n in range(10):
+		ring.append(entry(n))
+	assert messages(ring.since(7)) == ["entry 8", "entry 9"]
+	assert ring.since(9) == []
+	# An id the ring has already overwritten resumes from the oldest entry still held
+	assert messages(ring.since(2)) == ["entry 6", "entry 7", "entry 8", "entry 9"]
+	assert messages(ring.since(-1, limit=2)) == ["entry 6", "entry 7"]
+
+
+def test_since_filters_by_category_and_severity():
+	ring = LogRing(6)
+	ring.append(entry(0, "play_sound", "info"))
+	ring.append(entry(1, "voice_pool", "warning"))
+	ring.append(entry(2, "play_sound", "error"))
+	ring.append(entry(3, "voice_pool", "info"))
+	ring.append(entry(4, "play_sound", "info"))
+	assert messages(ring.since(category="play_sound")) == ["entry 0", "entry 2", "entry 4"]
+	assert messages(ring.since(severity="info")) == ["entry 0", "entry 3", "entry 4"]
+	assert messages(ring.since(category="play_sound", severity="info")) == ["entry 0", "entry 4"]
+	assert messages(ring.since(0, category="play_sound", limit=1)) == ["entry 2"]
+	assert ring.since(category="unknown") == []
+
+
+def test_indexes_follow_the_wrap():
+	ring = LogRing(3)
+	ring.append(entry(0, "startup"))
+	for n in range(1, 5):
+		ring.append(entry(n, "play_sound", "error" if n % 2 else "info"))
+	# The only startup entry has been overwritten, so its category is gone
+	assert ring.categories() == ["play_sound"]
+	assert messages(ring.since(category="startup")) == []
+	assert messages(ring.since(severity="error")) == ["entry 3"]
+	assert messages(ring.since(severity="info")) == ["entry 2", "entry 4"]
+
+
+def test_capacity_must_be_positive():
+	with pytest.raises(ValueError):
+		LogRing(0)
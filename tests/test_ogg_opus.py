@@ -0,0 +1,121 @@
+import struct
+
+import pytest
+
+import ogg_opus
+from ogg_opus import CAPTURE_PATTERN, HEADER_CONTINUED, PAGE_HEADER, FRAME_SAMPLES
+
+# TOC bytes of single-frame CELT fullband packets (RFC 6716, section 3.1)
+TOC_20_MS = 31 << 3
+TOC_10_MS = 30 << 3
+
+
+def packet(length, toc=TOC_20_MS):
+	"""A `length` byte Opus packet; the bytes after the TOC are a counter so misplaced segments show."""
+	return bytes([toc]) + bytes(n % 251 for n in range(length - 1))
+
+
+def raw_page(header_type, sequence, lacing, body, serial=1):
+	header = PAGE_HEADER.pack(CAPTURE_PATTERN, 0, header_type, 0, serial, sequence, 0, len(lacing))
+	return header + bytes(lacing) + body
+
+
+@pytest.mark.parametrize("length", [1, 254, 255, 256, 509, 510, 511, 1275])
+def test_round_trip_at_lacing_boundaries(tmp_path, length):
+	path = tmp_path / "clip.opus"
+	frames = [packet(length), packet(100), packet(length)]
+	ogg_opus.write_ogg_opus(str(path), frames, channels=1, pre_skip=312)
+	head, read = ogg_opus.read_frames(str(path))
+	assert read == frames
+	assert head["channels"] == 1
+	assert head["pre_skip"] == 312
+
+
+def test_lacing_values_of_multiple_of_255_end_with_zero():
+	# A 510 byte packet is two full segments and an empty one that ends it
+	page = ogg_opus._page(0, 0, 1, 0, [packet(510)])
+	_, _, _, lacing, _ = next(ogg_opus.iter_pages(page))
+	assert list(lacing) == [255, 255, 0]
+
+
+def test_pages_split_before_the_segment_table_overflows(tmp_path):
+	path = tmp_path / "clip.opus"
+	# Six segments each, so a page fills its segment table after 42 packets, before the 50 packet limit
+	frames = [packet(1300) for _ in range(120)]
+	ogg_opus.write_ogg_opus(str(path), frames)
+	data = path.read_bytes()
+	pages = list(ogg_opus.iter_pages(data))
+	assert [len(lacing) for _, _, _, lacing, _ in pages[2:]] == [252, 252, 216]
+	assert ogg_opus.read_frames(str(path))[1] == frames
+	# The last page's granule position counts every sample after the pre-skip
+	assert pages[-1][1] == ogg_opus.DEFAULT_PRE_SKIP + len(frames) * FRAME_SAMPLES
+	assert ogg_opus.duration(str(path)) == pytest.approx(len(frames) * 0.02)
+
+
+def test_packet_continued_on_the_next_page():
+	first = packet(300)
+	data = raw_page(0, 0, [255], first[:255]) + raw_page(HEADER_CONTINUED, 1, [45, 3], first[255:] + packet(3))
+	assert list(ogg_opus.iter_packets(data)) == [first, packet(3)]
+
+
+def test_packet_missing_its_continuation_page():
+	data = raw_page(0, 0, [255], packet(255)) + raw_page(0, 1, [3], packet(3))
+	with pytest.raises(ValueError, match="continuation"):
+		list(ogg_opus.iter_packets(data))
+
+
+def test_multiplexed_streams_are_rejected():
+	data = raw_page(0, 0, [3], packet(3), serial=1) + raw_page(0, 1, [3], packet(3), serial=2)
+	with pytest.raises(ValueError, match="Multiplexed"):
+		list(ogg_opus.iter_packets(data))
+
+
+def test_truncated_page_is_rejected():
+	data = raw_page(0, 0, [200], packet(200))
+	with pytest.raises(ValueError, match="Truncated"):
+		list(ogg_opus.iter_pages(data[:-1]))
+
+
+def test_page_crc_is_written():
+	page = bytearray(ogg_opus._page(0, 0, 1, 0, [packet(10)]))
+	crc = struct.unpack_from("<I", page, 22)[0]
+	struct.pack_into("<I", page, 22, 0)
+	assert crc == ogg_opus.page_crc(bytes(page)) != 0
+
+
+@pytest.mark.parametrize("toc, samples", [
+	(TOC_20_MS, 960),
+	(TOC_10_MS, 480),
+	(TOC_20_MS | 1, 1920),  # two frames of equal size
+	(TOC_20_MS | 2, 1920),  # two frames of different sizes
+])
+def test_packet_samples(toc, samples):
+	assert ogg_opus.packet_samples(bytes([toc, 0])) == samples
+
+
+def test_packet_samples_reads_the_frame_count_of_code_3_packets():
+	assert ogg_opus.packet_samples(bytes([TOC_10_MS | 3, 4])) == 4 * 480
+	with pytest.raises(ValueError):
+		ogg_opus.packet_samples(bytes([TOC_10_MS | 3]))
+
+
+@pytest.mark.parametrize("toc", [TOC_10_MS, TOC_20_MS | 1])
+def test_packets_other_than_20_ms_are_rejected(tmp_path, toc):
+	path = tmp_path / "clip.opus"
+	ogg_opus.write_ogg_opus(str(path), [packet(50), packet(50, toc), packet(50)])
+	with pytest.raises(ValueError, match="Packet 1 is .* ms, not 20 ms"):
+		ogg_opus.read_frames(str(path))
+
+
+def test_multichannel_mapping_is_rejected(tmp_path):
+	path = tmp_path / "clip.opus"
+	ogg_opus.write_ogg_opus(str(path), [packet(50)], channels=6)
+	with pytest.raises(ValueError, match="cannot be passed through"):
+		ogg_opus.read_frames(str(path))
+
+
+def test_not_an_opus_stream(tmp_path):
+	path = tmp_path / "clip.opus"
+	path.write_bytes(raw_page(0, 0, [8], b"OggVorbi"))
+	with pytest.raises(ValueError, match="OpusHead"):
+		ogg_opus.read_frames(str(path))
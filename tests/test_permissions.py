@@ -0,0 +1,84 @@
+import types
+
+from permissions import RoleIndex
+
+GUILD_ID = 1234
+
+
+def role(role_id, name):
+	return types.SimpleNamespace(id=role_id, name=name)
+
+
+ADMIN, CONTROLLER, MEMBER = role(1, "Admin"), role(2, "countdown-controller"), role(3, "member")
+GUILD = types.SimpleNamespace(id=GUILD_ID, roles=[ADMIN, CONTROLLER, MEMBER])
+OTHER_GUILD = types.SimpleNamespace(id=99, roles=[role(11, "Admin"), role(12, "countdown-controller"), role(13, "member")])
+
+
+def member(guild, *names):
+	return types.SimpleNamespace(guild=guild, roles=[role for role in guild.roles if role.name in names])
+
+
+def test_global_roles():
+	index = RoleIndex(["countdown-controller", "Admin"])
+	assert index.check(member(GUILD, "Admin"))
+	assert index.check(member(GUILD, "member", "countdown-controller"))
+	assert not index.check(member(GUILD, "member"))
+	assert not index.check(member(GUILD))
+	assert index.stats()["denied"] == 2
+
+
+def test_empty_role_list_allows_everyone():
+	index = RoleIndex([])
+	assert index.check(member(GUILD))
+	# Also outside a guild
+	assert index.check(types.SimpleNamespace(roles=[]))
+
+
+def test_outside_a_guild_only_an_unrestricted_default_allows():
+	assert not RoleIndex(["Admin"]).check(types.SimpleNamespace(roles=[]))
+
+
+def test_sound_override_applies_in_every_guild():
+	index = RoleIndex(["countdown-controller"], sound_rules={"refill-in": ["Admin"]})
+	controller = member(GUILD, "countdown-controller")
+	assert index.check(controller, "countdown-en-30-0")
+	assert not index.check(controller, "refill-in")
+	assert index.check(member(GUILD, "Admin"), "refill-in")
+	assert index.check(member(OTHER_GUILD, "Admin"), "refill-in")
+	# Checking control in general, without a sound, uses the default roles
+	assert not index.check(member(GUILD, "Admin"))
+
+
+def test_guild_rules_replace_the_global_roles_in_that_guild():
+	index = RoleIndex(["countdown-controller"], guild_rules={str(GUILD_ID): {"roles": ["member"]}})
+	assert index.check(member(GUILD, "member"))
+	assert not index.check(member(GUILD, "countdown-controller"))
+	assert index.check(member(OTHER_GUILD, "countdown-controller"))
+	assert not index.check(member(OTHER_GUILD, "member"))
+
+
+def test_guild_sound_rules_win_over_global_sound_rules():
+	index = RoleIndex(
+		["countdown-controller"],
+		guild_rules={str(GUILD_ID): {"sounds": {"refill-in": ["member"], "countdown-en-90-0": []}}},
+		sound_rules={"refill-in": ["Admin"]},
+	)
+	assert index.check(member(GUILD, "member"), "refill-in")
+	assert not index.check(member(GUILD, "Admin"), "refill-in")
+	assert index.check(member(OTHER_GUILD, "Admin"), "refill-in")
+	# An empty list for one sound lets everyone play it, even with a restricted default
+	assert index.check(member(GUILD), "countdown-en-90-0")
+	assert not index.check(member(GUILD), "countdown-en-30-0")
+
+
+def test_role_changes_take_effect_after_a_rebuild():
+	guild = types.SimpleNamespace(id=7, roles=[role(1, "member")])
+	index = RoleIndex(["Admin"])
+	assert not index.check(member(guild, "member"))
+	guild.roles.append(role(2, "Admin"))
+	index.rebuild_guild(guild)
+	assert index.check(member(guild, "Admin"))
+	# A renamed role stops matching once its guild is rebuilt
+	guild.roles[1] = role(2, "Former admin")
+	index.rebuild_guild(guild)
+	assert not index.check(types.SimpleNamespace(guild=guild, roles=[guild.roles[1]]))
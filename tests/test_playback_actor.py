@@ -0,0 +1,188 @@
+import asyncio
+import time
+
+import pytest
+
+from playback_actor import PlaybackActors, LAST_WRITER_WINS, REJECT_WHILE_PLAYING
+
+WINDOW = 0.05
+
+
+class Source:
+	def __init__(self, name):
+		self.name = name
+		self.cleaned_up = False
+
+	def cleanup(self):
+		self.cleaned_up = True
+
+
+class VoiceClient:
+	"""Records what the actor played and stopped; a source plays until stopped."""
+
+	def __init__(self):
+		self.source = None
+		self.events = []
+
+	def is_playing(self):
+		return self.source is not None
+
+	def play(self, source):
+		self.source = source
+		self.events.append(("play", source.name))
+
+	def stop(self):
+		self.events.append(("stop", self.source.name))
+		self.source = None
+
+
+def prepared(name, ready=None):
+	async def prepare():
+		if ready is not None:
+			await ready.wait()
+		return Source(name), name
+	return prepare
+
+
+def run(test, policy=LAST_WRITER_WINS):
+	"""Run `test(actors, voice_client)` with every guild sharing one connected voice client."""
+	async def main():
+		voice_client = VoiceClient()
+		actors = PlaybackActors(lambda guild_id: voice_client, window=WINDOW, policy=policy)
+		await test(actors, voice_client)
+	asyncio.run(main())
+
+
+def test_burst_plays_the_first_at_once_and_only_the_newest_after_the_window():
+	async def test(actors, voice_client):
+		first = await actors.play(1, "a", prepared("a"))
+		started = time.monotonic()
+		results = await asyncio.gather(*(actors.play(1, name, prepared(name)) for name in "bcd"))
+		assert first == ("played", "a")
+		assert results == [("coalesced", None), ("coalesced", None), ("played", "d")]
+		assert time.monotonic() - started >= WINDOW * 0.9
+		assert voice_client.events == [("play", "a"), ("stop", "a"), ("play", "d")]
+		stats = actors.stats()
+		assert (stats["played"], stats["coalesced"], stats["interrupted"]) == (2, 2, 1)
+	run(test)
+
+
+def test_newer_play_supersedes_one_still_being_built():
+	async def test(actors, voice_client):
+		ready = asyncio.Event()
+		cold = Source("cold")
+
+		async def prepare_cold():
+			await ready.wait()
+			return cold, "cold"
+
+		slow = asyncio.ensure_future(actors.play(1, "cold", prepare_cold))
+		await asyncio.sleep(0)
+		fast = asyncio.ensure_future(actors.play(1, "warm", prepared("warm")))
+		await asyncio.sleep(0)
+		ready.set()
+		assert await slow == ("coalesced", None)
+		assert await fast == ("played", "warm")
+		# The superseded source was never played, and it was released
+		assert voice_client.events == [("play", "warm")]
+		assert cold.cleaned_up
+	run(test)
+
+
+def test_stop_drops_waiting_plays_and_ends_the_window():
+	async def test(actors, voice_client):
+		await actors.play(1, "a", prepared("a"))
+		waiting = asyncio.ensure_future(actors.play(1, "b", prepared("b")))
+		await asyncio.sleep(0)
+		assert await actors.stop(1) == ("stopped", True)
+		assert await waiting == ("coalesced", None)
+		assert actors.actor(1).stops == 1
+		# The stop ended the burst, so this play does not wait for the window
+		started = time.monotonic()
+		assert await actors.play(1, "c", prepared("c")) == ("played", "c")
+		assert time.monotonic() - started < WINDOW / 2
+		assert voice_client.events == [("play", "a"), ("stop", "a"), ("play", "c")]
+	run(test)
+
+
+def test_stop_after_a_play_being_built_wins():
+	async def test(actors, voice_client):
+		ready = asyncio.Event()
+		play = asyncio.ensure_future(actors.play(1, "cold", prepared("cold", ready)))
+		await asyncio.sleep(0)
+		stop = asyncio.ensure_future(actors.stop(1))
+		await asyncio.sleep(0)
+		ready.set()
+		assert await play == ("coalesced", None)
+		assert await stop == ("stopped", False)
+		assert voice_client.events == []
+	run(test)
+
+
+def test_reject_while_playing_lets_only_stops_through():
+	async def test(actors, voice_client):
+		assert await actors.play(1, "a", prepared("a")) == ("played", "a")
+		assert await actors.play(1, "b", prepared("b")) == ("rejected", None)
+		assert await actors.play(1, "c", prepared("c"), immediate=True) == ("rejected", None)
+		assert await actors.stop(1) == ("stopped", True)
+		assert await actors.play(1, "d", prepared("d")) == ("played", "d")
+		assert actors.stats()["rejected"] == 2
+	run(test, REJECT_WHILE_PLAYING)
+
+
+def test_immediate_play_skips_the_window():
+	async def test(actors, voice_client):
+		await actors.play(1, "a", prepared("a"))
+		started = time.monotonic()
+		assert await actors.play(1, "broadcast", prepared("broadcast"), immediate=True) == ("played", "broadcast")
+		assert time.monotonic() - started < WINDOW / 2
+	run(test)
+
+
+def test_immediate_play_replaces_a_play_waiting_out_the_window():
+	async def test(actors, voice_client):
+		await actors.play(1, "a", prepared("a"))
+		waiting = asyncio.ensure_future(actors.play(1, "b", prepared("b")))
+		await asyncio.sleep(WINDOW / 5)
+		started = time.monotonic()
+		assert await actors.play(1, "broadcast", prepared("broadcast"), immediate=True) == ("played", "broadcast")
+		assert time.monotonic() - started < WINDOW / 2
+		assert await waiting == ("coalesced", None)
+	run(test)
+
+
+def test_guilds_do_not_wait_for_each_other():
+	async def test(actors, voice_client):
+		ready = asyncio.Event()
+		blocked = asyncio.ensure_future(actors.play(1, "cold", prepared("cold", ready)))
+		await asyncio.sleep(0)
+		assert await actors.play(2, "warm", prepared("warm")) == ("played", "warm")
+		assert not blocked.done()
+		ready.set()
+		assert await blocked == ("played", "cold")
+	run(test)
+
+
+def test_errors_reach_the_caller_and_the_actor_keeps_running():
+	async def test(actors, voice_client):
+		async def missing():
+			raise ValueError("Sound 'nope' not found.")
+		with pytest.raises(ValueError, match="not found"):
+			await actors.play(1, "nope", missing)
+		assert await actors.play(1, "a", prepared("a")) == ("played", "a")
+		assert actors.stats()["failed"] == 1
+	run(test)
+
+
+def test_play_without_a_voice_client_fails():
+	async def main():
+		actors = PlaybackActors(lambda guild_id: None, window=WINDOW)
+		with pytest.raises(ValueError, match="not connected"):
+			await actors.play(1, "a", prepared("a"))
+		assert await actors.stop(1) == ("stopped", False)
+	asyncio.run(main())
+
+
+def test_unknown_policy():
+	with pytest.raises(ValueError, match="Unknown playback policy"):
+		PlaybackActors(lambda guild_id: None, policy="first-writer-wins")
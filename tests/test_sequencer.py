@@ -0,0 +1,99 @@
+import asyncio
+import types
+
+import pytest
+from discord.opus import OPUS_SILENCE
+
+from sequencer import Sequencer, parse_item, parse_sequence, describe, MAX_ITEMS
+
+
+@pytest.mark.parametrize("item, frames", [
+	("500ms", 25),
+	("1.5s", 75),
+	("0s", 0),
+	(" 20 ms ", 1),
+	("60s", 3000),
+	({"silence": 1.5}, 75),
+	({"silence": "0.25"}, 12),
+])
+def test_silences_are_parsed_to_frames(item, frames):
+	assert parse_item(item) == ("silence", frames)
+
+
+@pytest.mark.parametrize("item", ["61s", "60001ms", {"silence": 61}, {"silence": -1}, {"silence": "soon"}])
+def test_silences_over_a_minute_or_invalid_are_rejected(item):
+	with pytest.raises(ValueError):
+		parse_item(item)
+
+
+@pytest.mark.parametrize("item, sound", [
+	("refill-in", "refill-in"),
+	(" countdown-en-30-0 ", "countdown-en-30-0"),
+	({"sound": "refill-in"}, "refill-in"),
+	# Not a silence: no unit
+	("500", "500"),
+])
+def test_sounds(item, sound):
+	assert parse_item(item) == ("sound", sound)
+
+
+@pytest.mark.parametrize("item", [{"volume": 3}, 5, None])
+def test_invalid_items(item):
+	with pytest.raises(ValueError):
+		parse_item(item)
+
+
+def test_comma_separated_text():
+	parsed = parse_sequence("refill-in, 500ms,, countdown-en-30-0")
+	assert parsed == [("sound", "refill-in"), ("silence", 25), ("sound", "countdown-en-30-0")]
+	assert describe(parsed) == "refill-in, 500ms, countdown-en-30-0"
+
+
+@pytest.mark.parametrize("items", ["", " , ", [], {"sound": "x"}, ["x"] * (MAX_ITEMS + 1)])
+def test_empty_or_too_long_sequences(items):
+	with pytest.raises(ValueError):
+		parse_sequence(items)
+
+
+class ClipCache:
+	"""Serves {sound: (frames, start_frame)} and records which sounds were loaded."""
+
+	def __init__(self, clips):
+		self.clips = clips
+		self.loads = []
+
+	async def get(self, sound):
+		self.loads.append(sound)
+		frames, start = self.clips[sound]
+		return types.SimpleNamespace(frames=frames, start_frame=start)
+
+
+def sequencer(sequences=None):
+	clips = {"a": ((b"a0", b"a1", b"a2"), 1), "b": ((b"b0",), 0)}
+	return Sequencer(ClipCache(clips), set(clips), sequences)
+
+
+def test_resolve_rejects_unknown_clips_and_sequences():
+	with pytest.raises(ValueError, match="Sound\\(s\\) not found: nope"):
+		sequencer().resolve("a, 500ms, nope")
+	with pytest.raises(ValueError, match="Sequence 'rally' not found"):
+		sequencer().resolve(name="rally")
+	with pytest.raises(ValueError, match="at least one sound"):
+		sequencer().resolve("1s, 500ms")
+	# Configured sequences are checked when played, as clips come and go
+	with pytest.raises(ValueError, match="not found: gone"):
+		sequencer({"rally": ["a", "gone"]}).resolve(name="rally")
+
+
+def test_build_plays_every_item_back_to_back():
+	sequence = sequencer({"rally": ["a", "40ms", "b", "a"]})
+	parsed = sequence.resolve(name="rally")
+	source, seconds = asyncio.run(sequence.build(parsed))
+	frames = []
+	while (frame := source.read()):
+		frames.append(frame)
+	# Each clip starts at its start frame; the silence is exactly two frames
+	assert frames == [b"a1", b"a2", OPUS_SILENCE, OPUS_SILENCE, b"b0", b"a1", b"a2"]
+	assert seconds == pytest.approx(7 * 0.02)
+	# A clip used twice is loaded once
+	assert sorted(sequence.clip_cache.loads) == ["a", "b"]
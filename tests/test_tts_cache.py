@@ -0,0 +1,110 @@
+import time
+
+from tts_cache import TTSCache, cache_key, synthesis_fields, adjusted_fields
+
+
+class Backend:
+	def __init__(self, name="gtts", version="2.3.1"):
+		self.name = name
+		self._version = version
+
+	def version(self):
+		return self._version
+
+
+def writer(content, calls):
+	def create(path):
+		calls.append(path)
+		with open(path, "wb") as output:
+			output.write(content)
+	return create
+
+
+def test_keys_depend_on_content_fields_only():
+	fields = synthesis_fields(Backend(), "en", "5")
+	assert cache_key(fields) == cache_key(dict(reversed(list(fields.items()))))
+	assert cache_key(fields) == cache_key(synthesis_fields(Backend(), "en", "5"))
+	others = [
+		synthesis_fields(Backend(), "de", "5"),
+		synthesis_fields(Backend(), "en", "6"),
+		synthesis_fields(Backend(version="2.4.0"), "en", "5"),
+		synthesis_fields(Backend(name="piper"), "en", "5"),
+	]
+	assert len({cache_key(fields)} | {cache_key(other) for other in others}) == 5
+
+
+def test_adjusted_keys_follow_their_source_and_placement():
+	source = synthesis_fields(Backend(), "en", "5")
+	key = cache_key(adjusted_fields(source, 200, 100))
+	assert key == cache_key(adjusted_fields(synthesis_fields(Backend(), "en", "5"), 200, 100))
+	assert key != cache_key(adjusted_fields(source, 250, 100))
+	assert key != cache_key(adjusted_fields(synthesis_fields(Backend(), "en", "6"), 200, 100))
+
+
+def test_miss_creates_once_then_hits(tmp_path):
+	cache = TTSCache(str(tmp_path))
+	fields = synthesis_fields(Backend(), "en", "5")
+	calls = []
+	assert cache.get(fields) is None
+	path = cache.get_or_create(fields, "mp3", writer(b"five", calls))
+	assert cache.get_or_create(fields, "mp3", writer(b"other", calls)) == path
+	assert len(calls) == 1
+	with open(path, "rb") as cached:
+		assert cached.read() == b"five"
+	# The file is named after its key, so the same content is found again in the next run
+	assert path.endswith(f"{cache_key(fields)}.mp3")
+	assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 2)
+
+
+def test_reuse_false_always_creates(tmp_path):
+	cache = TTSCache(str(tmp_path))
+	fields = synthesis_fields(Backend(), "en", "5")
+	calls = []
+	cache.get_or_create(fields, "mp3", writer(b"five", calls))
+	path = cache.get_or_create(fields, "mp3", writer(b"FIVE", calls), reuse=False)
+	assert len(calls) == 2
+	with open(path, "rb") as cached:
+		assert cached.read() == b"FIVE"
+
+
+def test_changed_file_is_a_miss(tmp_path):
+	cache = TTSCache(str(tmp_path))
+	fields = synthesis_fields(Backend(), "en", "5")
+	path = cache.get_or_create(fields, "mp3", writer(b"five", []))
+	with open(path, "wb") as cached:
+		cached.write(b"damaged")
+	assert cache.get(fields) is None
+	assert cache.stats()["corrupt"] == 1
+	assert cache.stats()["entries"] == 0
+
+
+def test_index_and_metadata_survive_a_restart(tmp_path):
+	cache = TTSCache(str(tmp_path))
+	fields = synthesis_fields(Backend(), "en", "5")
+	path = cache.get_or_create(fields, "mp3", writer(b"five", []))
+	cache.set_meta(fields, onset_ms=120)
+	cache.save()
+	reopened = TTSCache(str(tmp_path))
+	assert reopened.get(fields) == path
+	assert reopened.meta(fields) == {"onset_ms": 120}
+
+
+def test_eviction_spares_entries_used_in_this_run(tmp_path):
+	cache = TTSCache(str(tmp_path), max_bytes=10)
+	old = synthesis_fields(Backend(), "en", "old")
+	cache.get_or_create(old, "mp3", writer(b"x" * 8, []))
+	# Last used an hour before the next run starts
+	cache.entries[cache_key(old)]["last_used"] = time.time() - 3600
+	cache.save()
+
+	cache = TTSCache(str(tmp_path), max_bytes=10)
+	first = synthesis_fields(Backend(), "en", "1")
+	second = synthesis_fields(Backend(), "en", "2")
+	cache.get_or_create(first, "mp3", writer(b"y" * 8, []))
+	assert cache.get(old) is None
+	assert cache.stats()["evictions"] == 1
+	# Over the limit again, but the only other entry is from this run, so nothing goes
+	cache.get_or_create(second, "mp3", writer(b"z" * 8, []))
+	assert cache.get(first) is not None
+	assert cache.get(second) is not None
+	assert cache.stats()["evictions"] == 1
@@ -0,0 +1,52 @@
+import asyncio
+
+from voice_pool import VoiceChannelStore, VoicePool
+
+
+class VoiceClient:
+	"""Reports the bot's voice state without a channel while disconnecting, as discord.py does; or never."""
+
+	def __init__(self, pool, guild_id, sends_event=True):
+		self.pool = pool
+		self.guild_id = guild_id
+		self.sends_event = sends_event
+		self.outcomes = []
+
+	async def disconnect(self, force=False):
+		if self.sends_event:
+			self.outcomes.append(self.pool.disconnected(self.guild_id))
+
+
+def make_pool(tmp_path):
+	store = VoiceChannelStore(path=str(tmp_path / "voice-channels.json"))
+	store.channels[1] = 10
+	return VoicePool(lambda guild_id: None, lambda guild_id: None, store=store)
+
+
+def test_own_disconnect_is_expected(tmp_path):
+	pool = make_pool(tmp_path)
+	voice_client = VoiceClient(pool, 1)
+	asyncio.run(pool.disconnect(1, voice_client))
+	assert voice_client.outcomes == ["expected"]
+	assert pool.wanted == {1: 10}
+
+
+def test_missed_event_does_not_swallow_a_later_kick(tmp_path):
+	pool = make_pool(tmp_path)
+	asyncio.run(pool.disconnect(1, VoiceClient(pool, 1, sends_event=False)))
+	assert pool.disconnected(1) == "left"
+	assert pool.wanted == {}
+
+
+def test_failed_disconnect_is_not_left_expected(tmp_path):
+	pool = make_pool(tmp_path)
+
+	class Failing:
+		async def disconnect(self, force=False):
+			raise RuntimeError("gateway closed")
+
+	try:
+		asyncio.run(pool.disconnect(1, Failing()))
+	except RuntimeError:
+		pass
+	assert pool.disconnected(1) == "left"
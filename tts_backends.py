@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Pluggable text-to-speech backends for generate-countdown.py.
+
+gtts is the real backend. tone is an offline stand-in that writes a short WAV
+whose length and pitch depend on the text, so catalog builds can be exercised
+without network access.
+"""
+import math
+import struct
+import wave
+
+
+class TTSBackend:
+	name = None
+	extension = "mp3"
+
+	def synthesize(self, text, language, path):
+		"""Write speech for `text` in `language` to `path`."""
+		raise NotImplementedError
+
+	def version(self):
+		return ""
+
+
+class GTTSBackend(TTSBackend):
+	name = "gtts"
+	extension = "mp3"
+
+	def synthesize(self, text, language, path):
+		from gtts import gTTS
+		gTTS(text=text, lang=language).save(path)
+
+	def version(self):
+		import gtts
+		return gtts.__version__
+
+
+class ToneBackend(TTSBackend):
+	name = "tone"
+	extension = "wav"
+	sample_rate = 24000
+
+	def synthesize(self, text, language, path):
+		# Like gTTS output: a varying lead-in of silence, then speech that grows with the text
+		# and is sometimes longer than its slot, so trimming and speed adjustment both have work to do
+		frequency = 300 + sum(map(ord, language + text)) % 500
+		silence_ms = 40 + sum(map(ord, text)) % 160
+		duration_ms = 500 + 150 * len(text)
+		silence = self.sample_rate * silence_ms // 1000
+		samples = self.sample_rate * duration_ms // 1000
+		frames = b"\x00\x00" * silence + b"".join(
+			struct.pack("<h", int(12000 * math.sin(2 * math.pi * frequency * n / self.sample_rate)))
+			for n in range(samples)
+		)
+		with wave.open(path, "wb") as output:
+			output.setnchannels(1)
+			output.setsampwidth(2)
+			output.setframerate(self.sample_rate)
+			output.writeframes(frames)
+
+	def version(self):
+		return "2"
+
+
+BACKENDS = {backend.name: backend for backend in (GTTSBackend, ToneBackend)}
+
+
+def get_backend(name):
+	try:
+		return BACKENDS[name]()
+	except KeyError:
+		raise ValueError(f"Unknown TTS backend '{name}', expected one of: {', '.join(BACKENDS)}")
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Content-addressed cache for synthesized and processed countdown segments.
+
+Entries are keyed by a hash of everything that affects their content: the TTS
+backend and its version, the language, the text and any processing
+parameters (such as where the onset is placed). Every range and every language
+shares one cache, so "5" is synthesized once no matter how many countdowns
+contain it, and changing the language, the gTTS version or the placement
+can never return a stale file.
+
+The index is a JSON manifest next to the files. Each file's sha256 is
+checked on read, and the least recently used entries are evicted once the
+cache grows past its size limit. Entries used by the current run are never
+evicted, so a build can temporarily exceed the limit rather than lose files
+it still needs.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_CACHE_DIR = "tmp-data/tts-cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+INDEX_FILE = "index.json"
+
+
+def cache_key(fields):
+	"""Hash a dict of key fields into a stable hex key."""
+	return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def synthesis_fields(backend, language, text):
+	return {
+		"stage": "synthesize",
+		"backend": backend.name,
+		"backend_version": backend.version(),
+		"language": language,
+		"text": text,
+	}
+
+
+def adjusted_fields(source_fields, onset_ms, tail_ms, length_ms=1000):
+	# The speed factor follows from the speech itself, so the placement parameters are all that vary
+	return {
+		"stage": "adjust",
+		"source": cache_key(source_fields),
+		"placement": "onset",
+		"onset_ms": onset_ms,
+		"tail_ms": tail_ms,
+		"length_ms": length_ms,
+	}
+
+
+def file_digest(path):
+	digest = hashlib.sha256()
+	with open(path, "rb") as cached_file:
+		for chunk in iter(lambda: cached_file.read(1 << 16), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+class TTSCache:
+	def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+		self.directory = directory
+		self.max_bytes = max_bytes
+		self.index_path = os.path.join(directory, INDEX_FILE)
+		self._lock = threading.RLock()
+		self.hits = 0
+		self.misses = 0
+		self.corrupt = 0
+		self.evictions = 0
+		self.session_started = time.time()
+		os.makedirs(directory, exist_ok=True)
+		self.entries = self._load_index()
+
+	def _load_index(self):
+		if not os.path.exists(self.index_path):
+			return {}
+		try:
+			with open(self.index_path, "r") as index_file:
+				return json.load(index_file)
+		except (OSError, ValueError):
+			# A broken index only costs a rebuild; the files are re-verified on the way back in
+			return {}
+
+	def save(self):
+		with self._lock:
+			temp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+			with open(temp_path, "w") as index_file:
+				json.dump(self.entries, index_file)
+			os.replace(temp_path, self.index_path)
+
+	@property
+	def total_bytes(self):
+		with self._lock:
+			return sum(entry["size"] for entry in self.entries.values())
+
+	def new_path(self, extension):
+		"""A fresh path inside the cache directory for a producer to write to before add()."""
+		return os.path.join(self.directory, f"incoming-{uuid.uuid4().hex}.{extension}")
+
+	def get(self, fields):
+		"""Return the path of a verified cached file for `fields`, or None."""
+		key = cache_key(fields)
+		with self._lock:
+			entry = self.entries.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+			path = os.path.join(self.directory, entry["file"])
+			if not os.path.exists(path) or file_digest(path) != entry["sha256"]:
+				self.corrupt += 1
+				self.misses += 1
+				self._remove(key)
+				return None
+			entry["last_used"] = time.time()
+			self.hits += 1
+			return path
+
+	def meta(self, fields):
+		"""Return the metadata stored with an entry (e.g. its duration), or an empty dict."""
+		with self._lock:
+			entry = self.entries.get(cache_key(fields))
+			return dict(entry.get("meta", {})) if entry else {}
+
+	def set_meta(self, fields, **meta):
+		with self._lock:
+			entry = self.entries.get(cache_key(fields))
+			if entry is not None:
+				entry.setdefault("meta", {}).update(meta)
+
+	def add(self, fields, path, **meta):
+		"""Move the file at `path` into the cache under `fields` and return its cached path."""
+		key = cache_key(fields)
+		extension = os.path.splitext(path)[1]
+		filename = f"{key}{extension}"
+		cached_path = os.path.join(self.directory, filename)
+		digest = file_digest(path)
+		os.replace(path, cached_path)
+		with self._lock:
+			self.entries[key] = {
+				"file": filename,
+				"size": os.path.getsize(cached_path),
+				"sha256": digest,
+				"fields": fields,
+				"meta": meta,
+				"created": time.time(),
+				"last_used": time.time(),
+			}
+			self._evict(keep=key)
+		return cached_path
+
+	def get_or_create(self, fields, extension, create, reuse=True):
+		"""Return a cached path for `fields`, calling `create(path)` to produce the file on a miss."""
+		if reuse:
+			path = self.get(fields)
+			if path is not None:
+				return path
+		path = self.new_path(extension)
+		create(path)
+		return self.add(fields, path)
+
+	def stats(self):
+		with self._lock:
+			return {
+				"entries": len(self.entries),
+				"bytes": self.total_bytes,
+				"max_bytes": self.max_bytes,
+				"hits": self.hits,
+				"misses": self.misses,
+				"corrupt": self.corrupt,
+				"evictions": self.evictions,
+			}
+
+	def _evict(self, keep=None):
+		total = self.total_bytes
+		for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+			if total <= self.max_bytes:
+				break
+			if key == keep or self.entries[key]["last_used"] >= self.session_started:
+				continue
+			total -= self.entries[key]["size"]
+			self._remove(key)
+			self.evictions += 1
+
+	def _remove(self, key):
+		entry = self.entries.pop(key, None)
+		if entry is None:
+			return
+		path = os.path.join(self.directory, entry["file"])
+		if os.path.exists(path):
+			os.remove(path)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""Voice connections kept open ahead of playback, restored at startup and after drops.
+
+Joining a voice channel takes a gateway round trip plus the voice websocket
+and UDP handshake. That is close to a second, or more when Discord is
+slow. When the join happened on demand, the first countdown after a
+restart or a dropped connection paid for all of it. The pool instead
+remembers which channel each guild wants the bot in, persisted in
+tmp-data/voice-channels.json. Sharded workers share that file, and each one
+only loads and rewrites the guilds its shards own, so a guild follows its
+shard when shard-count or shard-processes change. It joins those channels when the bot starts,
+and when a connection drops it reconnects with exponential backoff. Plays
+then find an open connection. Our sources are already Opus frames, so no
+encoder has to be created before the first play either.
+
+A guild stays wanted until the bot is told to leave, until its channel is
+deleted, or until someone disconnects the bot from the channel. Discord
+reports that as a voice state without a channel. The bot's own disconnects
+report the same thing, so they go through disconnect(), which expects
+that event only while the call lasts. With rejoin_after_kick, the bot reconnects after a kick as it does
+after a drop. A periodic check notices connections that died without any
+event, and reconnects them.
+
+	voice_client = await pool.join(channel)   # join or move, and keep it that way
+	await pool.leave(guild_id)
+	pool.restore()                            # on_ready: (re)join every wanted channel
+	await pool.disconnect(guild_id, voice_client)   # the bot disconnects a voice client itself
+	pool.disconnected(guild_id)               # the bot's voice state went to no channel
+"""
+import asyncio
+import contextlib
+import json
+import os
+import random
+import time
+import uuid
+
+try:
+	import fcntl
+except ImportError:
+	# Windows runs a single worker, so there is no other writer to lock out
+	fcntl = None
+
+STORE_PATH = "tmp-data/voice-channels.json"
+DEFAULT_BACKOFF_MIN_SECONDS = 1.0
+DEFAULT_BACKOFF_MAX_SECONDS = 60.0
+DEFAULT_CHECK_SECONDS = 30.0
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 30.0
+DEFAULT_CONCURRENCY = 4
+
+
+class VoiceChannelStore:
+	"""{guild_id: channel_id} the bot should be connected to, persisted as JSON.
+
+	`owns(guild_id)` tells whether this worker's shards own a guild. Only owned
+	guilds are loaded, and saving keeps every other guild's entry in the file.
+	"""
+
+	def __init__(self, path=STORE_PATH, owns=None):
+		self.path = path
+		self.owns = owns or (lambda guild_id: True)
+		self.channels = {guild_id: channel_id for guild_id, channel_id in self._load().items() if self.owns(guild_id)}
+
+	def _load(self):
+		try:
+			with open(self.path, "r") as store_file:
+				return {int(guild_id): int(channel_id) for guild_id, channel_id in json.load(store_file).items()}
+		except FileNotFoundError:
+			return {}
+		except (OSError, ValueError):
+			# A broken store only means channels have to be joined again by hand
+			return {}
+
+	@contextlib.contextmanager
+	def _locked(self):
+		"""Hold the store's lock file, so workers saving at once do not drop each other's guilds."""
+		if fcntl is None:
+			yield
+			return
+		with open(f"{self.path}.lock", "w") as lock_file:
+			fcntl.flock(lock_file, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+	def save(self):
+		os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+		with self._locked():
+			channels = {guild_id: channel_id for guild_id, channel_id in self._load().items() if not self.owns(guild_id)}
+			channels.update(self.channels)
+			temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+			with open(temp_path, "w") as store_file:
+				json.dump({str(guild_id): channel_id for guild_id, channel_id in channels.items()}, store_file)
+			os.replace(temp_path, self.path)
+
+
+class GuildConnection:
+	"""Connection history of one guild, for uptime and reconnect metrics."""
+
+	def __init__(self):
+		self.lock = asyncio.Lock()
+		self.task = None
+		self.connected_at = None
+		self.dropped_at = None
+		self.connected_seconds = 0.0
+		self.connects = 0
+		self.reconnects = 0
+		self.drops = 0
+		self.failures = 0
+		self.last_error = None
+		self.connect_seconds = []  # how long each handshake took
+		self.reconnect_seconds = []  # from a drop until connected again
+
+	def mark_connected(self, now, handshake_seconds=None):
+		if handshake_seconds is not None:
+			self.connects += 1
+			self.connect_seconds = self.connect_seconds[-99:] + [handshake_seconds]
+		if self.dropped_at is not None:
+			self.reconnects += 1
+			self.reconnect_seconds = self.reconnect_seconds[-99:] + [now - self.dropped_at]
+			self.dropped_at = None
+		if self.connected_at is None:
+			self.connected_at = now
+		self.last_error = None
+
+	def mark_left(self, now):
+		if self.connected_at is not None:
+			self.connected_seconds += now - self.connected_at
+			self.connected_at = None
+
+	def mark_dropped(self, now):
+		if self.connected_at is not None:
+			self.mark_left(now)
+			self.drops += 1
+			self.dropped_at = now
+
+	def stats(self, now):
+		uptime = now - self.connected_at if self.connected_at is not None else 0.0
+		return {
+			"connected": self.connected_at is not None,
+			"uptime_seconds": round(uptime, 3),
+			"connected_seconds_total": round(self.connected_seconds + uptime, 3),
+			"connects": self.connects,
+			"reconnects": self.reconnects,
+			"drops": self.drops,
+			"failures": self.failures,
+			"reconnecting": self.task is not None and not self.task.done(),
+			"last_error": self.last_error,
+			"connect_ms_last": round(self.connect_seconds[-1] * 1000, 3) if self.connect_seconds else None,
+			"reconnect_ms_mean": round(sum(self.reconnect_seconds) / len(self.reconnect_seconds) * 1000, 3) if self.reconnect_seconds else None,
+			"reconnect_ms_max": round(max(self.reconnect_seconds) * 1000, 3) if self.reconnect_seconds else None,
+		}
+
+
+class VoicePool:
+	"""Keeps the bot connected to each guild's wanted voice channel.
+
+	`channel_for(guild_id, channel_id)` returns the channel, None while its
+	guild is unavailable, or raises LookupError if the channel is gone for
+	good. `voice_client_for(guild_id)` returns the guild's voice client or None.
+	"""
+
+	def __init__(self, channel_for, voice_client_for, store=None, backoff_min=DEFAULT_BACKOFF_MIN_SECONDS, backoff_max=DEFAULT_BACKOFF_MAX_SECONDS,
+			connect_timeout=DEFAULT_CONNECT_TIMEOUT_SECONDS, concurrency=DEFAULT_CONCURRENCY, on_event=None, rejoin_after_kick=False):
+		self.channel_for = channel_for
+		self.voice_client_for = voice_client_for
+		self.store = store if store is not None else VoiceChannelStore()
+		self.backoff_min = backoff_min
+		self.backoff_max = backoff_max
+		self.connect_timeout = connect_timeout
+		self.on_event = on_event or (lambda message, severity="info": None)
+		self.rejoin_after_kick = rejoin_after_kick
+		self.guilds = {}
+		# Guilds whose next voice state without a channel comes from a disconnect the bot made itself
+		self._expected = set()
+		# Voice handshakes at once, so a restart with many wanted channels does not burst the gateway
+		self._handshakes = asyncio.Semaphore(concurrency)
+
+	@property
+	def wanted(self):
+		return self.store.channels
+
+	def _guild(self, guild_id):
+		connection = self.guilds.get(guild_id)
+		if connection is None:
+			connection = self.guilds[guild_id] = GuildConnection()
+		return connection
+
+	def is_connected(self, guild_id):
+		voice_client = self.voice_client_for(guild_id)
+		return voice_client is not None and voice_client.is_connected()
+
+	async def join(self, channel):
+		"""Connect to `channel`, or move there, and keep the guild connected to it from now on."""
+		guild_id = channel.guild.id
+		if self.wanted.get(guild_id) != channel.id:
+			self.wanted[guild_id] = channel.id
+			self.store.save()
+		return await self._connect(guild_id, channel)
+
+	async def leave(self, guild_id):
+		"""Stop keeping the guild connected and disconnect; returns False if it was not connected."""
+		if self.wanted.pop(guild_id, None) is not None:
+			self.store.save()
+		connection = self._guild(guild_id)
+		if connection.task is not None:
+			connection.task.cancel()
+		voice_client = self.voice_client_for(guild_id)
+		if voice_client is None:
+			return False
+		# Before disconnecting, so the voice state event it causes is not taken for a kick
+		connection.mark_left(time.monotonic())
+		await self.disconnect(guild_id, voice_client)
+		return True
+
+	def forget(self, guild_id):
+		"""The bot left the guild: nothing to reconnect to."""
+		if self.wanted.pop(guild_id, None) is not None:
+			self.store.save()
+		connection = self.guilds.pop(guild_id, None)
+		if connection is not None and connection.task is not None:
+			connection.task.cancel()
+
+	def moved(self, guild_id, channel_id):
+		"""The bot's voice state shows it in `channel_id`; someone may have dragged it there, so follow."""
+		if guild_id in self.wanted and self.wanted[guild_id] != channel_id:
+			self.wanted[guild_id] = channel_id
+			self.store.save()
+
+	async def disconnect(self, guild_id, voice_client, force=False):
+		"""Disconnect the guild's voice client on the bot's own behalf; its voice state event is not a kick.
+
+		discord.py's disconnect() waits for that event before returning, so the
+		guild is only expected while the call lasts. An event that never comes
+		leaves nothing behind to swallow a later kick.
+		"""
+		self._expected.add(guild_id)
+		try:
+			await voice_client.disconnect(force=force)
+		finally:
+			self._expected.discard(guild_id)
+
+	def disconnected(self, guild_id):
+		"""The bot's voice state shows no channel; returns "expected", "left" or "dropped".
+
+		"expected" is a disconnect the bot made itself, which changes nothing.
+		Anything else means someone disconnected the bot: the guild stops being
+		wanted ("left"), or with rejoin_after_kick it reconnects ("dropped").
+		"""
+		connection = self._guild(guild_id)
+		now = time.monotonic()
+		if guild_id in self._expected:
+			self._expected.discard(guild_id)
+			connection.mark_left(now)
+			return "expected"
+		if not self.rejoin_after_kick:
+			connection.mark_left(now)
+			if self.wanted.pop(guild_id, None) is not None:
+				self.store.save()
+			if connection.task is not None:
+				connection.task.cancel()
+			return "left"
+		connection.mark_dropped(now)
+		if guild_id in self.wanted:
+			self._ensure(guild_id, self.backoff_min)
+		return "dropped"
+
+	def restore(self):
+		"""Start connecting every wanted channel that is not connected; returns how many were started."""
+		now = time.monotonic()
+		started = 0
+		for guild_id in list(self.wanted):
+			if self.is_connected(guild_id):
+				# Already connected, e.g. after a gateway resume; make sure it is counted as up
+				connection = self._guild(guild_id)
+				if connection.connected_at is None:
+					connection.connected_at = now
+				continue
+			self._ensure(guild_id, 0)
+			started += 1
+		return started
+
+	async def watch(self, interval=DEFAULT_CHECK_SECONDS):
+		"""Every `interval` seconds, reconnect wanted guilds whose connection is gone without an event saying so."""
+		while True:
+			await asyncio.sleep(interval)
+			for guild_id in list(self.wanted):
+				if not self.is_connected(guild_id):
+					connection = self._guild(guild_id)
+					if connection.task is None or connection.task.done():
+						connection.mark_dropped(time.monotonic())
+						self.on_event(f"Voice connection in guild {guild_id} is gone, reconnecting", "warning")
+						self._ensure(guild_id, 0)
+
+	def _ensure(self, guild_id, first_delay):
+		connection = self._guild(guild_id)
+		if connection.task is None or connection.task.done():
+			connection.task = asyncio.create_task(self._reconnect(guild_id, first_delay), name=f"voice-reconnect-{guild_id}")
+		return connection.task
+
+	async def _reconnect(self, guild_id, delay):
+		connection = self._guild(guild_id)
+		attempt = 0
+		while guild_id in self.wanted:
+			if delay:
+				# Full jitter, so guilds that dropped together do not retry together
+				await asyncio.sleep(random.uniform(delay / 2, delay))
+			if self.is_connected(guild_id):
+				# discord.py reconnected it on its own
+				connection.mark_connected(time.monotonic())
+				return
+			attempt += 1
+			try:
+				channel = self.channel_for(guild_id, self.wanted[guild_id])
+			except LookupError as e:
+				self.on_event(f"Not rejoining voice in guild {guild_id}: {str(e)}", "warning")
+				self.forget(guild_id)
+				return
+			if channel is not None:
+				try:
+					await self._connect(guild_id, channel)
+					self.on_event(f"Voice connected in guild {guild_id} after {attempt} attempt(s)")
+					return
+				except Exception as e:
+					connection.failures += 1
+					connection.last_error = str(e) or type(e).__name__
+					self.on_event(f"Voice connect attempt {attempt} in guild {guild_id} failed: {connection.last_error}", "warning")
+			delay = min(max(delay * 2, self.backoff_min), self.backoff_max)
+
+	async def _connect(self, guild_id, channel):
+		connection = self._guild(guild_id)
+		async with connection.lock:
+			voice_client = self.voice_client_for(guild_id)
+			if voice_client is not None and voice_client.is_connected():
+				if voice_client.channel is None or voice_client.channel.id != channel.id:
+					await voice_client.move_to(channel)
+				return voice_client
+			async with self._handshakes:
+				started = time.monotonic()
+				if voice_client is not None:
+					# A client that lost its connection would make connect() fail with "already connected"
+					await self.disconnect(guild_id, voice_client, force=True)
+				voice_client = await channel.connect(timeout=self.connect_timeout)
+				now = time.monotonic()
+			connection.mark_connected(now, now - started)
+			return voice_client
+
+	def stats(self):
+		now = time.monotonic()
+		guilds = {str(guild_id): {"channel_id": str(self.wanted[guild_id]) if guild_id in self.wanted else None, **self._guild(guild_id).stats(now)}
+			for guild_id in sorted(set(self.wanted) | set(self.guilds))}
+		reconnect_seconds = [seconds for connection in self.guilds.values() for seconds in connection.reconnect_seconds]
+		return {
+			"wanted": len(self.wanted),
+			"connected": sum(1 for guild_id in self.wanted if self.is_connected(guild_id)),
+			"reconnects": sum(connection.reconnects for connection in self.guilds.values()),
+			"failures": sum(connection.failures for connection in self.guilds.values()),
+			"reconnect_ms_mean": round(sum(reconnect_seconds) / len(reconnect_seconds) * 1000, 3) if reconnect_seconds else None,
+			"reconnect_ms_max": round(max(reconnect_seconds) * 1000, 3) if reconnect_seconds else None,
+			"guilds": guilds,
+		}
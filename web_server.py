@@ -1,21 +1,31 @@
-from quart import Quart, jsonify, request, render_template
+from quart import Quart, Response, jsonify, request, render_template, make_response
 import os
 import logging
 import asyncio
-from discord_bot import bot, play_sound, global_logs, log_message
+import concurrent.futures
+import datetime
+from discord_bot import bot, play_sound, broadcast_sound, schedule_sound, start_scheduler, global_logs, log_message, clip_cache, latency_tracker, log_stream, segment_table, countdown_language, sound_catalog, control_reconciler, log_pipeline, log_archive, loop_monitor, guild_snapshot, sequencer, play_sequence, playback_actors, voice_pool, playback_status_message, shard_count, shard_processes, shard_worker
 import discord
 import json
+from log_stream import format_event, format_log_entry
+from app_config import load_config
+from sequencer import describe as describe_sequence
+from guild_snapshot import encode as encode_snapshot
+from countdown_composer import MAX_COUNTDOWN, check_language
+from control_plane import ShardRouter, DEFAULT_ADDRESS, DEFAULT_TIMEOUT_SECONDS
 
 logger = logging.getLogger(__name__)
 
-# Load configuration from config.json
-with open("config.json", "r") as config_file:
-    config = json.load(config_file)
+# Load configuration from config.json (parsed once per process)
+config = load_config()
 
 RUNNING_IN_DOCKER = os.getenv("RUNNING_IN_DOCKER", "false").lower() == "true"
 
 DEFAULT_PORT = 5544 
 DEFAULT_HOST = "127.0.0.1" # when not using docker
+# Log responses with at least this many entries are encoded on json_encode_executor
+INLINE_JSON_ENTRIES = 200
+json_encode_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="json-encode")
 
 # Set webserver port:
 if RUNNING_IN_DOCKER:
@@ -34,26 +44,41 @@ app = Quart(__name__)
 app.config['DEBUG'] = True
 app.config["PROVIDE_AUTOMATIC_OPTIONS"] = True  # Add this line to prevent the KeyError
 
+# Helper to answer from a pre-serialized snapshot body, or with 304 when the client already has it
+def snapshot_response(body, etag):
+	if request.if_none_match.contains_raw(etag):
+		response = Response(status=304)
+	else:
+		response = Response(body, mimetype="application/json")
+	response.headers["ETag"] = etag
+	# Cached, but revalidated every time, so a change shows up on the next poll
+	response.headers["Cache-Control"] = "no-cache"
+	return response
+
 @app.route('/')
 async def index():
-	sounds = [f[:-4] for f in os.listdir('sound-clips') if f.endswith('.mp3')]
-	guilds = [
-		{"name": guild.name, "channels": [{"id": ch.id, "name": ch.name} for ch in guild.channels if isinstance(ch, discord.VoiceChannel)]}
-		for guild in bot.guilds
-	]
-	return await render_template('index.html', sounds=sounds, guilds=guilds)
+	guilds = await all_guild_entries() if shard_router else guild_snapshot.entries()
+	return await render_template('index.html', sounds=guild_snapshot.sounds, guilds=guilds)
+
+# Guilds with their voice channels and the sound list in one round trip, for the web page
+@app.route('/api/bootstrap')
+async def get_bootstrap():
+	if shard_router:
+		return snapshot_response(*encode_snapshot({"guilds": await all_guild_entries(), "sounds": guild_snapshot.sounds}))
+	return snapshot_response(*guild_snapshot.bootstrap_json())
 
 @app.route('/api/sounds')
 async def get_sounds():
-	sound_files = [f[:-4] for f in os.listdir('sound-clips') if f.endswith('.mp3')]
-	return jsonify(sound_files)
+	# ?details=1 adds the size, duration and content hash recorded by the catalog
+	if request.args.get("details"):
+		return jsonify([sound_catalog.get(name).to_dict() for name in sound_catalog.names()])
+	return snapshot_response(*guild_snapshot.sounds_json())
 
 @app.route('/api/guilds')
 async def get_guilds():
-	guilds = [
-		{"id": str(guild.id), "name": guild.name} for guild in bot.guilds
-	]
-	return jsonify(guilds)
+	if shard_router:
+		return snapshot_response(*encode_snapshot([{"id": entry["id"], "name": entry["name"]} for entry in await all_guild_entries()]))
+	return snapshot_response(*guild_snapshot.guilds_json())
 
 @app.route('/api/channels/<guild_id>')
 async def get_channels(guild_id):
@@ -62,70 +87,412 @@ async def get_channels(guild_id):
 	except ValueError:
 		return jsonify({"error": "Invalid guild ID"}), 400
 
-	guild = discord.utils.get(bot.guilds, id=guild_id)
-	if guild:
-		channels = [{"id": str(ch.id), "name": ch.name} for ch in guild.channels if isinstance(ch, discord.VoiceChannel)]
-		return jsonify(channels)
+	if shard_router and not shard_router.is_local(guild_id):
+		worker = shard_router.owner(guild_id)
+		try:
+			channels = await shard_router.call(worker, "channels", guild_id)
+		except (OSError, asyncio.TimeoutError, RuntimeError) as e:
+			return jsonify({"error": worker_unavailable(worker, e)}), 502
+		channels = encode_snapshot(channels) if channels is not None else None
+	else:
+		channels = guild_snapshot.channels_json(guild_id)
+	if channels:
+		return snapshot_response(*channels)
 	else:
 		return jsonify({"error": "Guild not found"}), 404
 
 @app.route('/api/join', methods=['POST'])
 async def join_channel():
-	data = await request.get_json()
+	payload, status = await route_guild_request("join", await request.get_json())
+	return jsonify(payload), status
+
+@app.route('/api/play', methods=['POST'])
+async def play_sound_api():
+	payload, status = await route_guild_request("play", await request.get_json())
+	return jsonify(payload), status
+
+# Requests for one guild return (payload, status code) instead of a response, so that
+# they can run here or, sharded, in the worker process that owns the guild
+async def join_request(data):
 	guild_id = int(data.get("guildId"))
 	channel_id = int(data.get("channelId"))
 
-	guild = discord.utils.get(bot.guilds, id=guild_id)
+	guild = bot.get_guild(guild_id)
 	if not guild:
-		return jsonify({"error": "Guild not found"}), 404
+		return {"error": "Guild not found"}, 404
 
 	channel = discord.utils.get(guild.channels, id=channel_id)
 	if not channel or not isinstance(channel, discord.VoiceChannel):
-		return jsonify({"error": "Voice channel not found"}), 404
+		return {"error": "Voice channel not found"}, 404
 
-	await channel.connect()
-	return jsonify({"message": f"Joined channel {channel.name} in guild {guild.name}"}), 200
+	await voice_pool.join(channel)
+	return {"message": f"Joined channel {channel.name} in guild {guild.name}"}, 200
 
-@app.route('/api/play', methods=['POST'])
-async def play_sound_api():
-	data = await request.get_json()
+async def play_request(data):
 	guild_id = int(data.get("guildId"))
 	sound = data.get("sound")
+	trace = latency_tracker.start(guild_id, sound, "web")
 
-	guild = discord.utils.get(bot.guilds, id=guild_id)
+	guild = bot.get_guild(guild_id)
 	if not guild:
-		return jsonify({"error": "Guild not found"}), 404
+		return {"error": "Guild not found"}, 404
 
 	voice_client = guild.voice_client
 	if not voice_client:
+		return {"error": "Bot is not connected to a voice channel"}, 400
+
+	if data.get("countdownStart") is not None:
+		# Countdown of any length composed from cached segments, e.g. {"countdownStart": 37, "countdownEnd": 0}
+		try:
+			start = int(data.get("countdownStart"))
+			end = int(data.get("countdownEnd", 0))
+		except (TypeError, ValueError) as e:
+			return {"error": str(e)}, 400
+		if not (0 <= start <= MAX_COUNTDOWN and 0 <= end <= MAX_COUNTDOWN):
+			return {"error": f"countdownStart and countdownEnd must be between 0 and {MAX_COUNTDOWN}"}, 400
+		language = data.get("language") or countdown_language
+		try:
+			check_language(language)
+		except ValueError as e:
+			return {"error": str(e)}, 400
+		description = f"countdown {start}-{end}"
+		trace.sound = f"countdown-{start}-{end}"
+
+		async def prepare():
+			return await segment_table.compose(start, end, language), None
+	else:
+		if sound not in sound_catalog:
+			return {"error": "Sound file not found"}, 404
+		description = sound
+
+		async def prepare():
+			return await clip_cache.source(sound), None
+
+	# The guild's playback actor serializes this with the bot's own plays and coalesces bursts
+	try:
+		status, _ = await playback_actors.play(guild_id, description, prepare, trace)
+	except ValueError as e:
+		return {"error": str(e)}, 400
+	except Exception as e:
+		return {"error": f"Failed to load sound: {str(e)}"}, 500
+	return playback_result(status, f"Playing {description} in {voice_client.channel.name}")
+
+# Helper function to describe what the playback actor did with a play request, as (payload, status code)
+def playback_result(status, message, **fields):
+	if status == "rejected":
+		return {"error": playback_status_message(status), "status": status}, 409
+	if status == "coalesced":
+		message = playback_status_message(status)
+	return {"message": message, "status": status, **fields}, 200
+
+# What one worker reports about itself to /api/shards
+async def worker_status(args=None):
+	return {
+		"worker": shard_worker,
+		"shard_ids": shard_router.shard_ids if shard_router else None,
+		"guilds": len(guild_snapshot.guilds),
+		"voice_clients": len(bot.voice_clients),
+		"latency_ms": round(bot.latency * 1000, 3) if bot.latency == bot.latency else None,
+	}
+
+async def local_guilds(args=None):
+	return guild_snapshot.entries()
+
+async def local_channels(guild_id):
+	entry = guild_snapshot.guilds.get(int(guild_id))
+	return entry["channels"] if entry else None
+
+# Control plane operations; guild requests are routed by guild, the rest are collected from every worker
+GUILD_REQUESTS = {"join": join_request, "play": play_request}
+shard_router = None
+if shard_count:
+	shard_router = ShardRouter(
+		shard_worker, shard_count, shard_processes,
+		address=config.get("control-plane-address", DEFAULT_ADDRESS),
+		handlers={**GUILD_REQUESTS, "guilds": local_guilds, "channels": local_channels, "status": worker_status},
+		timeout=config.get("control-plane-timeout-seconds", DEFAULT_TIMEOUT_SECONDS),
+	)
+
+def worker_unavailable(worker, e):
+	log_message(f"Shard worker {worker} did not answer: {str(e) or type(e).__name__}", severity="warning", category="shard_router")
+	return f"Shard worker {worker} is unavailable"
+
+# Helper to run a guild request in the worker that owns the guild: here when unsharded or local, else over the control plane
+async def route_guild_request(op, data):
+	try:
+		guild_id = int(data.get("guildId"))
+	except (TypeError, ValueError):
+		return {"error": "Invalid guild ID"}, 400
+	if shard_router is None or shard_router.is_local(guild_id):
+		return await GUILD_REQUESTS[op](data)
+	worker = shard_router.owner(guild_id)
+	try:
+		payload, status = await shard_router.call(worker, op, data)
+	except (OSError, asyncio.TimeoutError, RuntimeError) as e:
+		return {"error": worker_unavailable(worker, e)}, 502
+	return payload, status
+
+# Helper merging every worker's guilds; a worker that does not answer is logged and left out
+async def all_guild_entries():
+	entries = []
+	for worker, result in await shard_router.gather("guilds"):
+		if isinstance(result, Exception):
+			worker_unavailable(worker, result)
+			continue
+		entries.extend(result)
+	return entries
+
+# API to play clips and silences back to back as one gapless source, either
+# {"guildId": ..., "items": ["refill-in", {"silence": 0.5}, "countdown-en-30-0"]} or {"guildId": ..., "name": "rally-30"}
+@app.route('/api/sequence', methods=['POST'])
+async def play_sequence_api():
+	data = await request.get_json()
+	try:
+		guild_id = int(data.get("guildId"))
+	except (TypeError, ValueError):
+		return jsonify({"error": "Invalid guild ID"}), 400
+	guild = bot.get_guild(guild_id)
+	if not guild:
+		return jsonify({"error": "Guild not found"}), 404
+	if not guild.voice_client:
 		return jsonify({"error": "Bot is not connected to a voice channel"}), 400
 
-	sound_path = f'sound-clips/{sound}.mp3'
-	if not os.path.isfile(sound_path):
-		return jsonify({"error": "Sound file not found"}), 404
+	name = data.get("name")
+	trace = latency_tracker.start(guild_id, f"sequence-{name}" if name else "sequence", "web")
+	try:
+		status, seconds = await play_sequence(data.get("items"), guild, name=name, trace=trace)
+	except ValueError as e:
+		return jsonify({"error": str(e)}), 400
+	except Exception as e:
+		return jsonify({"error": f"Failed to load sound: {str(e)}"}), 500
+	payload, status_code = playback_result(status, f"Playing sequence in {guild.voice_client.channel.name}", seconds=seconds)
+	return jsonify(payload), status_code
+
+# API to list the configured sequences
+@app.route('/api/sequence', methods=['GET'])
+async def list_sequences():
+	return jsonify({name: describe_sequence(parsed) for name, parsed in sequencer.sequences.items()})
+
+# API to play one sound in many guilds, sharing a single encoded copy of the clip.
+# guildIds is optional and defaults to every guild the bot is connected to voice in.
+@app.route('/api/broadcast', methods=['POST'])
+async def broadcast_sound_api():
+	data = await request.get_json()
+	sound = data.get("sound")
+	guild_ids = data.get("guildIds")
+	try:
+		if guild_ids is not None:
+			guild_ids = [int(guild_id) for guild_id in guild_ids]
+		results = await broadcast_sound(sound, guild_ids)
+	except ValueError as e:
+		return jsonify({"error": str(e)}), 400
+	except Exception as e:
+		return jsonify({"error": f"Failed to load sound: {str(e)}"}), 500
+
+	playing = sum(1 for result in results.values() if result == "playing")
+	return jsonify({
+		"message": f"Playing {sound} in {playing} of {len(results)} guild(s)",
+		"guilds": {str(guild_id): result for guild_id, result in results.items()},
+	}), 200
+
+# API to start a sound in several guilds at once. startAt is a unix timestamp in seconds.
+@app.route('/api/schedule', methods=['POST'])
+async def schedule_sound_api():
+	data = await request.get_json()
+	try:
+		guild_ids = [int(guild_id) for guild_id in data.get("guildIds", [])]
+		start_at = float(data.get("startAt"))
+	except (TypeError, ValueError):
+		return jsonify({"error": "guildIds must be a list of guild IDs and startAt a unix timestamp"}), 400
+	sound = data.get("sound")
+
+	try:
+		scheduled = await schedule_sound(sound, guild_ids, start_at)
+	except ValueError as e:
+		return jsonify({"error": str(e)}), 400
+	except Exception as e:
+		# The clip is loaded while scheduling, and can fail to decode
+		log_message(f"Failed to schedule {sound}: {str(e)}", severity="error", category="schedule_sound_api")
+		return jsonify({"error": f"Failed to load sound: {str(e)}"}), 500
+	return jsonify(scheduled.to_dict()), 200
+
+@app.route('/api/schedule', methods=['GET'])
+async def list_schedules():
+	return jsonify([scheduled.to_dict() for scheduled in start_scheduler.schedules.values()])
+
+# Returns the status of a schedule, including the measured start skew per guild
+@app.route('/api/schedule/<int:schedule_id>', methods=['GET'])
+async def get_schedule(schedule_id):
+	scheduled = start_scheduler.schedules.get(schedule_id)
+	if not scheduled:
+		return jsonify({"error": "Schedule not found"}), 404
+	return jsonify(scheduled.to_dict())
+
+@app.route('/api/schedule/<int:schedule_id>', methods=['DELETE'])
+async def cancel_schedule(schedule_id):
+	if not await start_scheduler.cancel(schedule_id):
+		return jsonify({"error": "Schedule not found or already started"}), 404
+	return jsonify({"message": f"Cancelled schedule {schedule_id}"}), 200
+
+# API to fetch click-to-first-packet latency percentiles per guild and per playback backend
+@app.route('/api/latency', methods=['GET'])
+async def get_latency():
+	return jsonify(latency_tracker.snapshot())
 
-	if voice_client.is_playing():
-		voice_client.stop()
+# API to see what the last control message reconciliation cost
+@app.route('/api/controls', methods=['GET'])
+async def get_controls():
+	return jsonify({
+		"last_reconcile": control_reconciler.last_report,
+		"channels": {str(channel_id): records for channel_id, records in control_reconciler.store.channels.items()},
+	})
 
-	audio_source = discord.FFmpegPCMAudio(sound_path)
-	voice_client.play(audio_source)
-	return jsonify({"message": f"Playing {sound}.mp3 in {voice_client.channel.name}"}), 200
+# API to see each guild's playback actor: queue depth, and how many requests were coalesced or rejected
+@app.route('/api/playback', methods=['GET'])
+async def get_playback_stats():
+	return jsonify(playback_actors.stats())
+
+# API to see the voice connections the bot keeps open: uptime, reconnects and how long reconnecting took
+@app.route('/api/voice', methods=['GET'])
+async def get_voice_stats():
+	return jsonify(voice_pool.stats())
+
+# API to see every shard worker: its shards, guilds and voice connections, and the control plane's call counts
+@app.route('/api/shards', methods=['GET'])
+async def get_shards():
+	if shard_router is None:
+		return jsonify({"sharded": False, "workers": [await worker_status()]})
+	workers = []
+	for worker, result in await shard_router.gather("status"):
+		workers.append(result if not isinstance(result, Exception) else {"worker": worker, "error": worker_unavailable(worker, result)})
+	return jsonify({"sharded": True, "router": shard_router.stats(), "workers": workers})
+
+# API to see the clip cache: hits, evictions, and how many clips were demuxed from .opus or transcoded
+@app.route('/api/cache', methods=['GET'])
+async def get_cache_stats():
+	return jsonify(clip_cache.stats())
+
+# API to see how late the event loop runs and which callbacks blocked it
+@app.route('/api/loop', methods=['GET'])
+async def get_loop_stats():
+	if loop_monitor is None:
+		return jsonify({"error": "The loop monitor is disabled"}), 404
+	return jsonify(loop_monitor.snapshot(top=request.args.get('top', type=int, default=10)))
+
+# API to see how many log records were queued, dropped or sampled away
+@app.route('/api/logs/stats', methods=['GET'])
+async def get_log_stats():
+	stats = log_pipeline.stats()
+	if log_archive is not None:
+		stats["archive"] = log_archive.stats()
+	return jsonify(stats)
+
+# Helper to encode a large JSON body off the event loop. The encoder holds the GIL, so the loop only gets it
+# back every switch interval; one encoding thread keeps that wait short where several would take turns.
+async def json_response(payload, inline_below=0, size=0):
+	if size < inline_below:
+		return jsonify(payload)
+	loop = asyncio.get_running_loop()
+	body = await loop.run_in_executor(json_encode_executor, app.json.dumps, payload)
+	return Response(body, mimetype="application/json")
+
+# Helper to read a time bound given either as epoch seconds or as an ISO 8601 timestamp
+def parse_time_arg(name):
+	value = request.args.get(name)
+	if value is None:
+		return None
+	try:
+		return float(value)
+	except ValueError:
+		return datetime.datetime.fromisoformat(value).timestamp()
+
+# API to query the on-disk log archive, e.g. /api/logs/history?since=2026-01-01T18:00&category=play_sound
+@app.route('/api/logs/history', methods=['GET'])
+async def get_log_history():
+	if log_archive is None:
+		return jsonify({"error": "The log archive is disabled"}), 404
+	try:
+		since = parse_time_arg('since')
+		until = parse_time_arg('until')
+	except ValueError as e:
+		return jsonify({"error": f"Invalid time: {str(e)}"}), 400
+	category = request.args.get('category', default=None)
+	severity = request.args.get('severity', default=None)
+	after_id = request.args.get('after_id', type=int, default=None)
+	limit = max(1, min(request.args.get('limit', type=int, default=500), 5000))
+
+	# Reads are memory-mapped file I/O, so keep them off the event loop
+	loop = asyncio.get_running_loop()
+	entries = await loop.run_in_executor(None, lambda: log_archive.query(since, until, category, severity, after_id, limit))
+	return await json_response({
+		"entries": entries,
+		"next_after_id": entries[-1]["id"] if len(entries) == limit else None,
+	})
 
 # API to fetch all log messages, optionally starting from a specified log ID
+# and filtered by category and/or severity on the server
 @app.route('/api/logs', methods=['GET'])
 async def get_all_logs():
-    # Get the last_log_id parameter from the query string
     last_log_id = request.args.get('last_log_id', type=int, default=None)
+    category = request.args.get('category', default=None)
+    severity = request.args.get('severity', default=None)
+    limit = request.args.get('limit', type=int, default=None)
+
+    entries = global_logs.since(last_log_id, category=category, severity=severity, limit=limit)
+    # Small polls are cheaper to encode inline than to hand to a thread
+    return await json_response({entry["id"]: entry for entry in entries}, inline_below=INLINE_JSON_ENTRIES, size=len(entries))
 
-    # Filter logs based on the last_log_id if provided
-    if last_log_id is not None:
-        filtered_logs = {log_id: log_entry for log_id, log_entry in global_logs.items() if log_id > last_log_id}
-    else:
-        filtered_logs = global_logs  # Return all logs if no last_log_id is specified
+# Server-Sent Events stream of new log entries. Resumes after the Last-Event-ID header
+# (sent automatically by EventSource on reconnect) or the last_log_id query parameter.
+@app.route('/api/logs/stream', methods=['GET'])
+async def stream_logs():
+    last_log_id = request.headers.get('Last-Event-ID', type=int, default=None)
+    if last_log_id is None:
+        last_log_id = request.args.get('last_log_id', type=int, default=None)
 
-    # Return the filtered logs
-    return jsonify(filtered_logs)
+    subscriber = log_stream.subscribe()
+
+    async def send_events():
+        try:
+            backlog = global_logs.since(last_log_id)
+            if last_log_id is not None and backlog and backlog[0]["id"] > last_log_id + 1:
+                yield format_event({"dropped": backlog[0]["id"] - last_log_id - 1}, event="dropped")
+            if len(backlog) < INLINE_JSON_ENTRIES:
+                for entry in backlog:
+                    yield format_log_entry(entry)
+            elif backlog:
+                # A reconnect can replay the whole ring, so encode it off the event loop
+                loop = asyncio.get_running_loop()
+                yield await loop.run_in_executor(json_encode_executor, lambda: "".join(format_log_entry(entry) for entry in backlog))
+            if backlog:
+                subscriber.last_id = backlog[-1]["id"]
+            elif last_log_id is not None:
+                subscriber.last_id = last_log_id
+
+            while True:
+                frames, dropped = await subscriber.drain(timeout=15)
+                if dropped:
+                    yield format_event({"dropped": dropped}, event="dropped")
+                if frames:
+                    yield "".join(frames)
+                elif not dropped:
+                    yield ": keepalive\n\n"
+        finally:
+            log_stream.unsubscribe(subscriber)
+
+    response = await make_response(send_events(), {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    response.timeout = None
+    return response
 
 
 async def main_web():
 	await app.run_task(host=webserver_host, port=webserver_port)
+
+# Every shard worker answers the others' requests; returns once it is listening
+async def main_control():
+	if shard_router is not None:
+		await shard_router.serve()